@@ -0,0 +1,101 @@
+"""
+QR Service — HTTP front end for qr_service.QRService.
+
+    POST /qr/batch          render many payloads, streamed as NDJSON
+                            (400 up front for bad options or oversized payloads)
+    GET  /qr/{digest}.{ext} fetch a rendered code from the cache
+
+Run:
+    uvicorn qr_server:app --host 0.0.0.0 --port 8100
+"""
+
+import base64
+import json
+import os
+from typing import List, Literal
+
+from fastapi import FastAPI, HTTPException, status
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+from qr_service import FORMATS, get_qr_service
+
+app = FastAPI(
+    title="QR Service",
+    description="Batched, content-addressed QR code rendering",
+    version="1.0.0",
+)
+
+MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml", "txt": "text/plain"}
+
+
+class QRBatchRequest(BaseModel):
+    payloads: List[str] = Field(..., min_length=1, max_length=10000)
+    format: Literal["png", "svg", "matrix"] = "png"
+    error_correction: Literal["L", "M", "Q", "H"] = "H"
+    # Range-checked by QRService (400, like the other option errors)
+    box_size: int = 10
+    border: int = 4
+    # Include the rendered content in each line (base64 for png)
+    inline: bool = False
+
+
+@app.on_event("shutdown")
+async def shutdown_pool():
+    get_qr_service().close()
+
+
+@app.get("/health", tags=["Health"])
+async def health():
+    return {"status": "healthy"}
+
+
+@app.post("/qr/batch", tags=["QR"])
+def qr_batch(request: QRBatchRequest):
+    """
+    Render a batch of QR codes. One JSON line is streamed per payload as
+    soon as it is ready (cache hits first), so large batches start
+    arriving before the whole batch is rendered. A payload that fails to
+    render gets {"index", "digest", "error"} instead of a url.
+    """
+    service = get_qr_service()
+    try:
+        results = service.iter_batch(
+            request.payloads,
+            fmt=request.format,
+            error_correction=request.error_correction,
+            box_size=request.box_size,
+            border=request.border,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    def lines():
+        for result in results:
+            if result.error is not None:
+                yield json.dumps({"index": result.index, "digest": result.digest, "error": result.error}) + "\n"
+                continue
+            ext = FORMATS[result.format]
+            line = {
+                "index": result.index,
+                "digest": result.digest,
+                "url": f"/qr/{result.digest}.{ext}",
+                "cached": result.cached,
+            }
+            if request.inline:
+                with open(result.path, "rb") as f:
+                    data = f.read()
+                line["content"] = base64.b64encode(data).decode("ascii") if ext == "png" else data.decode("utf-8")
+            yield json.dumps(line) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/qr/{digest}.{ext}", tags=["QR"])
+async def qr_file(digest: str, ext: str):
+    if ext not in MEDIA_TYPES or len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="QR code not found")
+    path = os.path.join(get_qr_service().cache_dir, digest[:2], f"{digest}.{ext}")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="QR code not found")
+    return FileResponse(path, media_type=MEDIA_TYPES[ext])
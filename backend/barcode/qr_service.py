@@ -0,0 +1,233 @@
+"""
+QR code generation service.
+
+A long-lived replacement for spawning `python qr_code.py <data>` once per
+code. Payloads are rendered in a process pool, deduplicated by content
+hash, and stored in a content-addressed on-disk cache:
+
+    <cache_dir>/<digest[:2]>/<digest>.<ext>
+
+so the same payload + options is only ever rendered once, and two codes
+generated in the same second can never overwrite each other.
+
+Formats:
+    png     — image (requires Pillow), the most expensive
+    svg     — vector path image, no Pillow needed
+    matrix  — raw module matrix as '0'/'1' text lines, cheapest
+
+A payload that fails to render (e.g. more data than a QR code holds)
+only fails its own entry: its QRResult carries `error` and no path, and
+the rest of the batch is unaffected.
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+import qrcode
+import qrcode.constants
+
+
+FORMATS = {"png": "png", "svg": "svg", "matrix": "txt"}
+
+ERROR_CORRECTION = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
+
+# Largest version-40 payload per error correction level, by the densest
+# mode the payload fits: (numeric, alphanumeric, byte)
+CAPACITY = {
+    "L": (7089, 4296, 2953),
+    "M": (5596, 3391, 2331),
+    "Q": (3993, 2420, 1663),
+    "H": (3057, 1852, 1273),
+}
+_ALPHANUMERIC = frozenset("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:")
+
+MAX_BOX_SIZE = 50
+MAX_BORDER = 20
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend", "qr_codes")
+
+
+class QRResult(NamedTuple):
+    index: int          # position of the payload in the request
+    digest: str         # content hash (cache key)
+    path: Optional[str]  # file in the content-addressed cache (None on error)
+    format: str
+    cached: bool        # True if no rendering was needed
+    error: Optional[str] = None
+
+
+def content_digest(payload: str, fmt: str, error_correction: str, box_size: int, border: int) -> str:
+    key = f"{fmt}|{error_correction}|{box_size}|{border}|{payload}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def payload_capacity(payload: str, error_correction: str) -> int:
+    """How many characters (bytes, for byte mode) of this payload's kind fit in one code."""
+    numeric, alphanumeric, byte = CAPACITY[error_correction]
+    if payload.isdigit() and payload.isascii():
+        return numeric
+    if all(c in _ALPHANUMERIC for c in payload):
+        return alphanumeric
+    return byte
+
+
+def payload_size(payload: str) -> int:
+    """Size of a payload in the unit payload_capacity() counts."""
+    if payload.isascii():
+        return len(payload)
+    return len(payload.encode("utf-8"))
+
+
+def render(payload: str, fmt: str = "png", error_correction: str = "H", box_size: int = 10, border: int = 4) -> bytes:
+    """Render one QR code to bytes. Runs inside pool workers."""
+    qr = qrcode.QRCode(
+        version=None,  # automatic size
+        error_correction=ERROR_CORRECTION[error_correction],
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(payload)
+    qr.make(fit=True)
+
+    if fmt == "matrix":
+        rows = qr.get_matrix()
+        return "\n".join("".join("1" if cell else "0" for cell in row) for row in rows).encode("ascii")
+
+    if fmt == "svg":
+        from qrcode.image.svg import SvgPathImage
+        img = qr.make_image(image_factory=SvgPathImage)
+    else:
+        img = qr.make_image(fill_color="black", back_color="white")
+
+    buffer = io.BytesIO()
+    img.save(buffer)
+    return buffer.getvalue()
+
+
+def _render_to_file(payload: str, fmt: str, error_correction: str, box_size: int, border: int, path: str) -> str:
+    """Render and write atomically (temp file + rename)."""
+    data = render(payload, fmt, error_correction, box_size, border)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return path
+
+
+class QRService:
+    """Batch QR renderer with a process pool and content-addressed cache."""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_workers: Optional[int] = None):
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def path_for(self, digest: str, fmt: str) -> str:
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.{FORMATS[fmt]}")
+
+    def iter_batch(
+        self,
+        payloads: Iterable[str],
+        fmt: str = "png",
+        error_correction: str = "H",
+        box_size: int = 10,
+        border: int = 4,
+    ) -> Iterator[QRResult]:
+        """
+        Yield one QRResult per payload as soon as it is available: cache
+        hits first, then rendered codes in completion order. Identical
+        payloads are rendered once and reported for every index.
+        Options and payload sizes are validated eagerly (ValueError),
+        before any output; a payload that still fails to render is
+        reported with `error` set.
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported QR format: {fmt}")
+        if error_correction not in ERROR_CORRECTION:
+            raise ValueError(f"Unsupported error correction level: {error_correction}")
+        if not 1 <= box_size <= MAX_BOX_SIZE:
+            raise ValueError(f"box_size must be between 1 and {MAX_BOX_SIZE}")
+        if not 0 <= border <= MAX_BORDER:
+            raise ValueError(f"border must be between 0 and {MAX_BORDER}")
+        payloads = list(payloads)
+        for index, payload in enumerate(payloads):
+            capacity = payload_capacity(payload, error_correction)
+            if payload_size(payload) > capacity:
+                raise ValueError(
+                    f"Payload {index} is too large for one QR code at error correction "
+                    f"{error_correction} ({payload_size(payload)} > {capacity})"
+                )
+        return self._iter_batch(payloads, fmt, error_correction, box_size, border)
+
+    def _iter_batch(self, payloads: List[str], fmt: str, error_correction: str,
+                    box_size: int, border: int) -> Iterator[QRResult]:
+        pending: Dict[str, List[int]] = {}
+        payload_for: Dict[str, str] = {}
+        for index, payload in enumerate(payloads):
+            digest = content_digest(payload, fmt, error_correction, box_size, border)
+            path = self.path_for(digest, fmt)
+            if digest in pending:
+                pending[digest].append(index)
+            elif os.path.exists(path):
+                yield QRResult(index, digest, path, fmt, True)
+            else:
+                pending[digest] = [index]
+                payload_for[digest] = payload
+
+        if not pending:
+            return
+
+        futures = {
+            self.pool.submit(
+                _render_to_file, payload_for[digest], fmt, error_correction, box_size, border,
+                self.path_for(digest, fmt),
+            ): digest
+            for digest in pending
+        }
+        for future in as_completed(futures):
+            digest = futures[future]
+            try:
+                path, error = future.result(), None
+            except Exception as e:
+                path, error = None, str(e) or type(e).__name__
+            for index in pending[digest]:
+                yield QRResult(index, digest, path, fmt, False, error)
+
+    def render_batch(self, payloads: Iterable[str], fmt: str = "png", **options) -> List[QRResult]:
+        """Render many payloads; results are returned in input order."""
+        return sorted(self.iter_batch(payloads, fmt, **options), key=lambda r: r.index)
+
+
+# Global instance
+_service: Optional[QRService] = None
+
+
+def get_qr_service() -> QRService:
+    global _service
+    if _service is None:
+        _service = QRService(
+            cache_dir=os.environ.get("QR_CACHE_DIR", DEFAULT_CACHE_DIR),
+            max_workers=int(os.environ["QR_POOL_WORKERS"]) if os.environ.get("QR_POOL_WORKERS") else None,
+        )
+    return _service
@@ -0,0 +1,145 @@
+"""
+Admission control, request deadlines and load shedding.
+
+Every match request carries a Deadline (from the X-Deadline-Ms header,
+or DEFAULT_DEADLINE_MS). The AdmissionController caps how many matches
+score concurrently, bounds the wait queue, and estimates from recent
+throughput whether a new request can finish before its deadline. If it
+cannot, the request is rejected up front (503 + Retry-After) instead of
+making every in-flight request slower.
+
+Admitted requests that run short of time degrade gracefully: semantic
+scoring is dropped (fuzzy only), and scoring stops between chunks once
+the deadline passes, returning the partial top-K with a flag.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from metrics import metrics
+
+
+class Deadline:
+    """A request's time budget plus what it had to give up to meet it."""
+
+    def __init__(self, budget_seconds: float):
+        self.budget_seconds = budget_seconds
+        self.expires_at = time.monotonic() + budget_seconds
+        self.partial = False
+        self.degraded: Optional[str] = None
+
+    @classmethod
+    def from_header(cls, header_ms: Optional[int], default_ms: int) -> "Deadline":
+        budget_ms = header_ms if header_ms and header_ms > 0 else default_ms
+        return cls(budget_ms / 1000.0)
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted; carries a Retry-After hint."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Tracks in-flight and queued work (in estimated seconds) and admits a
+    request only if it can plausibly start and finish before its deadline.
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int, initial_cost_per_candidate: float = 0.0002):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.queued = 0
+        self._pending_work = 0.0
+        # EWMA of observed seconds per candidate
+        self.cost_per_candidate = initial_cost_per_candidate
+
+    def estimate(self, candidate_count: int) -> float:
+        return max(1, candidate_count) * self.cost_per_candidate
+
+    def _backlog_wait(self) -> float:
+        return self._pending_work / self.max_in_flight
+
+    def _publish(self) -> None:
+        metrics.set_gauge("admission.in_flight", self.in_flight)
+        metrics.set_gauge("admission.queued", self.queued)
+        metrics.set_gauge("admission.backlog_seconds", round(self._backlog_wait(), 4))
+
+    def _reject(self, reason: str) -> None:
+        metrics.inc(f"admission.rejected.{reason}")
+        raise Overloaded(reason, retry_after=max(1, math.ceil(self._backlog_wait())))
+
+    @asynccontextmanager
+    async def slot(self, deadline: Deadline, candidate_count: int, learn: bool = True):
+        """
+        Wait for a scoring slot; raise Overloaded if the deadline can't be met.
+        With `learn=False` the request's time does not update the cost estimate.
+        """
+        cost = self.estimate(candidate_count)
+        with self._lock:
+            if self.queued >= self.max_queue and self.in_flight >= self.max_in_flight:
+                self._reject("queue_full")
+            if self._backlog_wait() + cost > deadline.remaining():
+                self._reject("deadline")
+            self.queued += 1
+            self._pending_work += cost
+            self._publish()
+
+        queued_at = time.monotonic()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=max(0.0, deadline.remaining()))
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.queued -= 1
+                self._pending_work -= cost
+                self._publish()
+            self._reject("queue_timeout")
+
+        with self._lock:
+            self.queued -= 1
+            self.in_flight += 1
+            self._publish()
+        metrics.observe("admission.queue_wait_ms", (time.monotonic() - queued_at) * 1000)
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self.in_flight -= 1
+                self._pending_work = max(0.0, self._pending_work - cost)
+                if learn and candidate_count > 0 and not deadline.partial:
+                    observed = elapsed / candidate_count
+                    self.cost_per_candidate = 0.8 * self.cost_per_candidate + 0.2 * observed
+                self._publish()
+            self._slots.release()
+
+
+# Global instance
+_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    global _controller
+    if _controller is None:
+        from config import get_settings
+        settings = get_settings()
+        _controller = AdmissionController(settings.MAX_IN_FLIGHT, settings.MAX_QUEUE_DEPTH)
+    return _controller
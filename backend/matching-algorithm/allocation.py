@@ -0,0 +1,296 @@
+"""
+Global quantity-constrained allocation of supplies to demands.
+
+Ranking answers "which supplies suit this demand"; allocation answers
+"how much of which supply should go to which demand" when the same
+supply quantity is wanted by many demands at once.
+
+The problem is a transportation problem on a sparse bipartite graph:
+
+    maximize    Σ score(s, d) · x(s, d) / need(d)
+    subject to  Σ_d x(s, d) ≤ offer(s)      for every supply s
+                Σ_s x(s, d) ≤ need(d)       for every demand d
+                x ≥ 0
+
+with quantities normalized by `normalize_quantity`. Dividing by the
+demand's need makes the objective unit-free: fully serving a demand
+through a pair earns that pair's match score, whatever its size.
+
+Only feasible pairs are edges (in radius, related item, score above the
+minimum, comparable units), so the graph is sparse and falls apart into
+connected components, roughly one per region. Each component is solved
+exactly and independently by min-cost flow (successive shortest paths,
+Dijkstra with potentials); a component left unsolved at the deadline is
+allocated greedily by score instead.
+"""
+
+import heapq
+import math
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# (supply index, demand index, match score)
+Edge = Tuple[int, int, float]
+
+_EPS = 1e-9
+
+
+# ═══════════════════════════════════════════════════════════════
+# Spatial bucketing (edge generation)
+# ═══════════════════════════════════════════════════════════════
+
+class RegionGrid:
+    """Points bucketed into lat/lon cells about one search radius wide."""
+
+    KM_PER_DEGREE = 111.0
+
+    def __init__(self, radius_km: float):
+        self.cell_deg = max(radius_km, 1e-3) / self.KM_PER_DEGREE
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return math.floor(latitude / self.cell_deg), math.floor(longitude / self.cell_deg)
+
+    def add(self, index: int, latitude: float, longitude: float) -> None:
+        self.cells.setdefault(self._cell(latitude, longitude), []).append(index)
+
+    def remove(self, index: int, latitude: float, longitude: float) -> None:
+        cell = self._cell(latitude, longitude)
+        members = self.cells.get(cell)
+        if members and index in members:
+            members.remove(index)
+            if not members:
+                del self.cells[cell]
+
+    def near(self, latitude: float, longitude: float, radius_km: float) -> List[int]:
+        """Indices in every cell the circle can touch (a superset; check distance after)."""
+        lat_cells = math.ceil(radius_km / self.KM_PER_DEGREE / self.cell_deg)
+        # Longitude degrees shrink towards the poles
+        cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+        lon_cells = min(math.ceil(lat_cells / cos_lat), math.ceil(360 / self.cell_deg))
+        row = math.floor(latitude / self.cell_deg)
+        col = math.floor(longitude / self.cell_deg)
+        found = []
+        for r in range(row - lat_cells, row + lat_cells + 1):
+            for c in range(col - lon_cells, col + lon_cells + 1):
+                found.extend(self.cells.get((r, c), ()))
+        return found
+
+
+# ═══════════════════════════════════════════════════════════════
+# Decomposition
+# ═══════════════════════════════════════════════════════════════
+
+def components(num_supplies: int, num_demands: int, edges: Sequence[Edge]) -> List[List[int]]:
+    """Edge indices grouped by connected component (union-find), largest first."""
+    parent = list(range(num_supplies + num_demands))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for s, d, _ in edges:
+        a, b = find(s), find(num_supplies + d)
+        if a != b:
+            parent[a] = b
+    groups: Dict[int, List[int]] = {}
+    for e, (s, _, _) in enumerate(edges):
+        groups.setdefault(find(s), []).append(e)
+    return sorted(groups.values(), key=len, reverse=True)
+
+
+# ═══════════════════════════════════════════════════════════════
+# Solvers
+# ═══════════════════════════════════════════════════════════════
+
+def solve_min_cost_flow(offer: Sequence[float], need: Sequence[float],
+                        edges: Sequence[Edge]) -> List[float]:
+    """
+    Exact max-score allocation for one component by successive shortest
+    paths. Returns the allocated quantity per edge.
+
+    Network: source → supply (capacity offer) → demand (uncapacitated,
+    cost -score/need per unit) → sink (capacity need). Augmenting stops
+    at the first path with non-negative cost, i.e. when no further flow
+    raises the score; the flow need not be maximal.
+
+    Nodes are supplies 0..S-1, demands S..S+D-1 and the sink S+D; the
+    source is implicit (potential 0, an arc to every supply with offer left).
+    """
+    num_supplies, num_demands = len(offer), len(need)
+    sink = num_supplies + num_demands
+    edge_supply = [s for s, _, _ in edges]
+    edge_demand = [num_supplies + d for _, d, _ in edges]
+    cost = [-score / need[d] for _, d, score in edges]
+    flow = [0.0] * len(edges)
+    out_edges: List[List[int]] = [[] for _ in range(num_supplies)]
+    in_edges: List[List[int]] = [[] for _ in range(num_demands)]
+    for e, (s, d, _) in enumerate(edges):
+        out_edges[s].append(e)
+        in_edges[d].append(e)
+    remaining_offer = list(offer)
+    remaining_need = list(need)
+
+    # Potentials = shortest distances from the source on the initial
+    # (acyclic) network, so every reduced cost starts non-negative
+    potential = [0.0] * (sink + 1)
+    for d in range(num_demands):
+        potential[num_supplies + d] = min((cost[e] for e in in_edges[d]), default=0.0)
+    potential[sink] = min(potential[num_supplies:sink], default=0.0)
+
+    inf = math.inf
+    heappush, heappop = heapq.heappush, heapq.heappop
+    while True:
+        dist = [inf] * (sink + 1)
+        # Edge into each node on the shortest path; -1 for supplies fed by the source
+        pred = [-1] * (sink + 1)
+        # Finalized nodes are never relaxed again (guards against round-off
+        # in the potentials turning the predecessor tree into a cycle)
+        done = [False] * (sink + 1)
+        heap = []
+        for s in range(num_supplies):
+            if remaining_offer[s] > _EPS:
+                dist[s] = -potential[s]
+                heap.append((dist[s], s))
+        heapq.heapify(heap)
+        while heap:
+            du, u = heappop(heap)
+            if done[u]:
+                continue
+            done[u] = True
+            if u == sink:
+                break
+            pu = potential[u]
+            if u < num_supplies:
+                for e in out_edges[u]:
+                    v = edge_demand[e]
+                    dv = du + cost[e] + pu - potential[v]
+                    if dv < dist[v] and not done[v]:
+                        dist[v] = dv
+                        pred[v] = e
+                        heappush(heap, (dv, v))
+            else:
+                d = u - num_supplies
+                if remaining_need[d] > _EPS:
+                    dv = du + pu - potential[sink]
+                    if dv < dist[sink]:
+                        dist[sink] = dv
+                        pred[sink] = d
+                        heappush(heap, (dv, sink))
+                for e in in_edges[d]:
+                    if flow[e] > _EPS:
+                        v = edge_supply[e]
+                        dv = du - cost[e] + pu - potential[v]
+                        if dv < dist[v] and not done[v]:
+                            dist[v] = dv
+                            pred[v] = e
+                            heappush(heap, (dv, v))
+
+        reach = dist[sink]
+        if reach == inf or reach + potential[sink] >= -_EPS:
+            break
+        for v in range(sink + 1):
+            potential[v] += dist[v] if dist[v] < reach else reach
+
+        # Walk back from the sink: demand ← supply (forward edge) ← demand
+        # (backward edge, flow is taken back) ... ← supply fed by the source
+        d = pred[sink]
+        amount = remaining_need[d]
+        forward_path, backward_path = [], []
+        v = num_supplies + d
+        while True:
+            e = pred[v]
+            forward_path.append(e)
+            v = edge_supply[e]
+            e = pred[v]
+            if e < 0:
+                break
+            backward_path.append(e)
+            if flow[e] < amount:
+                amount = flow[e]
+            v = edge_demand[e]
+        if remaining_offer[v] < amount:
+            amount = remaining_offer[v]
+        for e in forward_path:
+            flow[e] += amount
+        for e in backward_path:
+            flow[e] -= amount
+        remaining_offer[v] -= amount
+        remaining_need[d] -= amount
+    return flow
+
+
+def solve_greedy(offer: Sequence[float], need: Sequence[float], edges: Sequence[Edge]) -> List[float]:
+    """Highest score per unit of need first; fast, not optimal."""
+    remaining_offer = list(offer)
+    remaining_need = list(need)
+    flow = [0.0] * len(edges)
+    for e in sorted(range(len(edges)), key=lambda e: -edges[e][2] / need[edges[e][1]]):
+        s, d, _ = edges[e]
+        amount = min(remaining_offer[s], remaining_need[d])
+        if amount > _EPS:
+            flow[e] = amount
+            remaining_offer[s] -= amount
+            remaining_need[d] -= amount
+    return flow
+
+
+def objective(need: Sequence[float], edges: Sequence[Edge], flow: Sequence[float]) -> float:
+    """Total score: Σ score · fraction of the demand's need served."""
+    return sum(score * x / need[d] for (_, d, score), x in zip(edges, flow))
+
+
+def allocate(offer: Sequence[float], need: Sequence[float], edges: Sequence[Edge],
+             deadline=None, checkpoint: Optional[Callable[[], None]] = None) -> Tuple[List[float], dict]:
+    """
+    Solve every connected component (exactly, or greedily once the
+    deadline has passed). `checkpoint` runs between components, e.g. to
+    yield a bulk scheduler slot. Returns the flow per edge and solve stats.
+    """
+    started = time.perf_counter()
+    flow = [0.0] * len(edges)
+    groups = components(len(offer), len(need), edges)
+    exact = greedy = 0
+    for group in groups:
+        if checkpoint is not None:
+            checkpoint()
+        # Re-index the component's supplies and demands densely
+        supplies: Dict[int, int] = {}
+        demands: Dict[int, int] = {}
+        local_edges = []
+        for e in group:
+            s, d, score = edges[e]
+            local_edges.append((supplies.setdefault(s, len(supplies)), demands.setdefault(d, len(demands)), score))
+        local_offer = [0.0] * len(supplies)
+        for s, i in supplies.items():
+            local_offer[i] = offer[s]
+        local_need = [0.0] * len(demands)
+        for d, i in demands.items():
+            local_need[i] = need[d]
+
+        if deadline is not None and deadline.expired():
+            deadline.partial = True
+            local_flow = solve_greedy(local_offer, local_need, local_edges)
+            greedy += 1
+        else:
+            local_flow = solve_min_cost_flow(local_offer, local_need, local_edges)
+            exact += 1
+        for e, x in zip(group, local_flow):
+            flow[e] = x
+
+    stats = {
+        "components": len(groups),
+        "largest_component_edges": len(groups[0]) if groups else 0,
+        "components_exact": exact,
+        "components_greedy": greedy,
+        "solve_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    return flow, stats
+
+
+def fulfilled_fraction(need: Sequence[float], flow: Sequence[float]) -> float:
+    """Share of the total need (in normalized units) that was allocated."""
+    total = sum(need)
+    return sum(flow) / total if total > 0 else 0.0
@@ -0,0 +1,513 @@
+"""
+Benchmark script for the Matching Worker
+
+Runs offline micro-benchmarks of the worker's indexes and kernels.
+No server, API key or database is needed — all data is synthetic
+("warmstart" starts local worker processes on a free port).
+
+Usage:
+    python benchmark.py            # run every benchmark
+    python benchmark.py strings    # run selected benchmarks by name
+"""
+
+import sys
+import time
+
+import numpy as np
+
+
+def _clustered_vectors(n: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Synthetic embeddings: noisy points around random topic centres."""
+    rng = np.random.default_rng(seed)
+    centres = 0.45 * rng.normal(size=(clusters, dim))
+    labels = rng.integers(0, clusters, size=n)
+    return (centres[labels] + rng.normal(size=(n, dim))).astype(np.float32)
+
+
+def benchmark_string_similarity(n: int = 20000, repeats: int = 3):
+    """Per-candidate calculate_string_similarity vs the batched kernel."""
+    import random
+    from utils import calculate_string_similarity, calculate_string_similarity_batch
+
+    print(f"\n=== String similarity — query vs {n} candidates ===")
+    rng = random.Random(0)
+    vocab = ["rice", "basmati", "steel", "pipes", "solar", "panel", "face", "mask",
+             "cooking", "oil", "wheat", "flour", "cotton", "fabric", "plastic", "sheets"]
+    candidates = [" ".join(rng.choice(vocab) for _ in range(rng.randint(1, 4))) for _ in range(n)]
+    query = "basmati rice grains"
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        [calculate_string_similarity(query, c) for c in candidates]
+    loop_ms = (time.perf_counter() - start) * 1000 / repeats
+    print(f"Per-candidate loop: {loop_ms:.1f} ms")
+
+    for cutoff in (0.0, 0.2, 0.5):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            calculate_string_similarity_batch(query, candidates, min_score=cutoff)
+        batch_ms = (time.perf_counter() - start) * 1000 / repeats
+        print(f"  batch min_score={cutoff}: {batch_ms:.1f} ms ({loop_ms / batch_ms:.1f}x)")
+
+
+def benchmark_scheduler(interactive: int = 200, bulk_threads: int = 4, chunk: int = 256):
+    """Interactive latency while a bulk rebuild saturates the worker."""
+    import random
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from scheduler import PriorityScheduler
+    from utils import calculate_string_similarity
+
+    print(f"\n=== Scheduler — {interactive} interactive requests, {bulk_threads} bulk threads ===")
+    rng = random.Random(0)
+    vocab = ["rice", "basmati", "steel", "pipes", "solar", "panel", "face", "mask",
+             "cooking", "oil", "wheat", "flour", "cotton", "fabric", "plastic", "sheets"]
+    candidates = [" ".join(rng.choice(vocab) for _ in range(rng.randint(1, 4))) for _ in range(4 * chunk)]
+
+    def score(sched):
+        for start in range(0, len(candidates), chunk):
+            if start and sched is not None:
+                sched.checkpoint()
+            for text in candidates[start:start + chunk]:
+                calculate_string_similarity("basmati rice grains", text)
+
+    def run(label, sched, with_bulk):
+        stop = threading.Event()
+
+        def rebuild():
+            while not stop.is_set():
+                if sched is None:
+                    score(None)
+                else:
+                    sched.run("bulk", score, sched)
+
+        threads = [threading.Thread(target=rebuild) for _ in range(bulk_threads if with_bulk else 0)]
+        for t in threads:
+            t.start()
+
+        def request(_):
+            start = time.perf_counter()
+            if sched is None:
+                score(None)
+            else:
+                sched.run("interactive", score, sched)
+            return (time.perf_counter() - start) * 1000
+
+        with ThreadPoolExecutor(4) as pool:
+            latencies = sorted(pool.map(request, range(interactive)))
+        stop.set()
+        for t in threads:
+            t.join()
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        print(f"{label:<28} p50 {p50:7.1f} ms   p99 {p99:7.1f} ms")
+
+    run("idle", None, with_bulk=False)
+    run("rebuild, no scheduler", None, with_bulk=True)
+    run("rebuild, priority scheduler", PriorityScheduler(4, {"interactive": 4, "bulk": 1}), with_bulk=True)
+
+
+def benchmark_adaptive_radius(n: int = 5000, radius: float = 50.0, repeats: int = 3):
+    """Full-radius scoring vs nearest-first rings with early stop, dense city."""
+    import random
+    import main
+    from main import DemandData, OrgData, SupplyData, calculate_distance
+
+    print(f"\n=== Adaptive radius — {n} candidates in a dense city, radius {radius} km ===")
+    rng = random.Random(0)
+    names = ["Basmati rice", "Rice", "Brown rice", "Steel pipes", "Cooking oil", "Wheat flour"]
+    candidates = []
+    for i in range(n):
+        # Most sellers sit in the city centre, a tail spreads over the radius
+        spread = 0.05 if rng.random() < 0.8 else 0.4
+        org = OrgData(org_id=i, org_name=f"Org{i}",
+                      latitude=12.97 + rng.uniform(-spread, spread),
+                      longitude=77.59 + rng.uniform(-spread, spread))
+        supply = SupplyData(supply_id=i, org_id=i, item_name=rng.choice(names),
+                            item_category="Grains", category_id=1,
+                            price_per_unit=rng.uniform(20, 60), quantity=rng.uniform(50, 500),
+                            quantity_unit="kg")
+        candidates.append((supply, org))
+    demand = DemandData(demand_id=1, org_id=-1, item_name="Basmati rice", item_category="Grains",
+                        category_id=1, max_price_per_unit=60, quantity=100, quantity_unit="kg")
+    demand_org = OrgData(org_id=-1, org_name="Buyer", latitude=12.97, longitude=77.59)
+    in_radius = sum(1 for _, org in candidates
+                    if calculate_distance(12.97, 77.59, org.latitude, org.longitude) <= radius)
+
+    outputs = {}
+    for adaptive in (False, True):
+        main.settings.ADAPTIVE_RADIUS_SEARCH = adaptive
+        main.metrics.reset()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            results = main.match_candidates(demand, demand_org, candidates, radius)
+        elapsed_ms = (time.perf_counter() - start) * 1000 / repeats
+        skipped = main.metrics.snapshot()["counters"].get("adaptive_radius.rows_skipped", 0) / repeats
+        outputs[adaptive] = [(r.id, r.match_score) for r in results]
+        print(f"adaptive={adaptive!s:<5} {elapsed_ms:8.1f} ms   rows skipped {skipped:.0f}/{in_radius}")
+    print(f"Identical results: {outputs[False] == outputs[True]}")
+
+
+def benchmark_synonyms(sizes=(10, 1000, 50000), texts: int = 20000):
+    """tokenize() throughput as the synonym table grows; naive phrase scan for contrast."""
+    import random
+    import utils
+    from synonyms import SynonymTrie, split_words
+
+    print(f"\n=== Synonym phrases — tokenize {texts} texts ===")
+    rng = random.Random(0)
+    syllables = ["ka", "ro", "mi", "tu", "sel", "van", "por", "di", "lek", "na", "zo", "bri"]
+    vocab = sorted({"".join(rng.choice(syllables) for _ in range(rng.randint(2, 3))) for _ in range(20000)})
+    corpus = [" ".join(rng.choice(vocab) for _ in range(rng.randint(3, 12))) for _ in range(texts)]
+
+    saved = utils._synonyms
+    try:
+        for size in sizes:
+            clusters = []
+            trie = SynonymTrie()
+            while len(trie) < size:
+                cluster = [" ".join(rng.choice(vocab) for _ in range(rng.randint(1, 3))) for _ in range(4)]
+                clusters.append(cluster)
+                trie.add_clusters([cluster])
+            utils._synonyms = trie
+
+            start = time.perf_counter()
+            for text in corpus:
+                utils.tokenize(text)
+            trie_s = time.perf_counter() - start
+
+            # Naive alternative: test every multi-word phrase against every text
+            phrases = [" ".join(split_words(p)) for c in clusters for p in c if " " in p]
+            sample = corpus[:max(1, texts // 100)]
+            start = time.perf_counter()
+            for text in sample:
+                words = " ".join(split_words(text))
+                [p for p in phrases if p in words]
+            naive_s = (time.perf_counter() - start) * len(corpus) / len(sample)
+
+            print(f"{len(trie):>6} synonyms: trie {texts / trie_s:10.0f} texts/s   "
+                  f"naive phrase scan {texts / naive_s:10.0f} texts/s")
+    finally:
+        utils._synonyms = saved
+
+
+def _regex_tokenize(text: str) -> set:
+    """The previous tokenize(): regex split, ASCII only, fresh strings every call."""
+    import re
+    from utils import STOP_WORDS, get_synonyms
+
+    words = re.sub(r'[^a-z0-9\s]', ' ', text.lower()).split()
+    synonyms = get_synonyms()
+    meaningful = set()
+    i = 0
+    while i < len(words):
+        length, canonical = synonyms.longest_match(words, i)
+        if length > 1:
+            meaningful.add(canonical)
+            i += length
+            continue
+        t = words[i]
+        i += 1
+        if len(t) < 2 or t in STOP_WORDS:
+            continue
+        meaningful.add(canonical or t)
+    return meaningful
+
+
+def _script_vocabulary(rng, size: int) -> dict:
+    """
+    `size` distinct made-up words per script, built from each script's
+    letters and syllables, with a few real item words at the head.
+    """
+    latin_syllables = [c + v for c in "bcdfghklmnprstvz" for v in "aeiou"]
+    syllables = {
+        "latin": latin_syllables,
+        "accented": latin_syllables + [c + v for c in "bcdlmnprst" for v in "áéíóúàèâêôäöüç"],
+        "devanagari": [c + v for c in "कखगचजटडतदनपबमयरलवसह" for v in ("", "ा", "ि", "ी", "ु", "े", "ो", "ं")],
+        "arabic": list("ابتثجحخدذرزسشصضطعغفقكلمنهوي"),
+        "cyrillic": [c + v for c in "бвгджзклмнпрстфхчш" for v in "аеиоуыя"],
+        "cjk": [chr(code) for code in range(0x4E00, 0x4E00 + 3000)],
+    }
+    lengths = {"arabic": (3, 7), "cjk": (2, 4)}
+    heads = {
+        "latin": ["basmati", "rice", "steel", "pipes", "solar", "panel", "face", "mask", "cooking",
+                  "oil", "wheat", "flour", "cotton", "fabric", "water", "pump", "blankets", "tarpaulin"],
+        "accented": ["café", "farine", "blé", "riz", "acier", "tubería", "açúcar", "manteiga", "Öl", "Größe"],
+        "devanagari": ["चावल", "गेहूं", "आटा", "पानी", "कंबल", "दवाई", "तेल", "चीनी", "दाल", "सौर"],
+        "arabic": ["أرز", "دقيق", "ماء", "بطانية", "زيت", "سكر", "دواء", "خيمة", "مضخة", "قمح"],
+        "cyrillic": ["рис", "мука", "вода", "одеяло", "масло", "сахар", "лекарство", "палатка", "насос"],
+        "cjk": ["大米", "面粉", "饮用水", "毛毯", "食用油", "白糖", "药品", "帐篷", "水泵", "太阳能板"],
+    }
+    vocabulary = {}
+    for script, parts in syllables.items():
+        low, high = lengths.get(script, (2, 4))
+        words = dict.fromkeys(heads[script])
+        while len(words) < size:
+            word = "".join(rng.choice(parts) for _ in range(rng.randint(low, high)))
+            words.setdefault(word.capitalize() if rng.random() < 0.2 else word)
+        vocabulary[script] = list(words)
+    return vocabulary
+
+
+def benchmark_tokenizer(texts: int = 50000, repeats: int = 5, vocabulary: int = 5000):
+    """tokenize() vs the previous regex tokenizer on a mixed-script corpus of item texts."""
+    import itertools
+    import random
+    import tracemalloc
+    import utils
+
+    rng = random.Random(0)
+    words = _script_vocabulary(rng, vocabulary)
+    # Word frequencies of item text are roughly Zipfian: a few very common words, a long tail
+    cumulative = list(itertools.accumulate(1 / rank for rank in range(1, vocabulary + 1)))
+    scripts = list(words)
+    print(f"\n=== Tokenizer — {texts} mixed-script item texts, "
+          f"{vocabulary * len(scripts)} distinct words (Zipf) ===")
+
+    def word(script: str) -> str:
+        return rng.choices(words[script], cum_weights=cumulative)[0]
+
+    names, corpus = [], []
+    for _ in range(texts):
+        script = rng.choice(scripts)
+        # Item text as build_rich_text makes it: name, description, category
+        name = " ".join(word(script) for _ in range(rng.randint(1, 3)))
+        description = ", ".join(word(rng.choice(("latin", script))) for _ in range(rng.randint(3, 10)))
+        names.append(name)
+        corpus.append(f"{name}. {description} ({word('latin')}) - {rng.randint(1, 500)}kg")
+
+    for label, tokenize in (("regex (previous)", _regex_tokenize), ("translate + interned", utils.tokenize)):
+        elapsed = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            token_sets = [tokenize(text) for text in corpus]
+            elapsed = min(elapsed, time.perf_counter() - start)
+        tokens = sum(len(t) for t in token_sets)
+        # Names left without tokens fall back to Levenshtein alone
+        empty = sum(1 for name in names if not tokenize(name))
+        # Memory held by the corpus's token sets (the form the token index keeps)
+        del token_sets
+        tracemalloc.start()
+        token_sets = [frozenset(tokenize(text)) for text in corpus]
+        held = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"{label:<22} {tokens / elapsed:10.0f} tokens/s  {texts / elapsed:8.0f} texts/s  "
+              f"{tokens / texts:5.2f} tokens/text  {held / tokens:5.1f} B/token held  "
+              f"{empty:>6} names without tokens")
+    print(f"Vocabulary: {len(utils.get_tokenizer().vocabulary)} tokens, "
+          f"{len(utils.get_tokenizer())} distinct words cached")
+
+
+def benchmark_embedding_store(n: int = 20000, queries: int = 100, k: int = 30, rank: int = 64):
+    """Memory, similarity throughput and top-k agreement of quantized/PCA storage vs float64."""
+    from embedding_store import EmbeddingStore, PCAProjection
+
+    for dim in (384, 1536):
+        print(f"\n=== Embedding store — {n} items, dim {dim} (intrinsic rank {rank}), "
+              f"agreement@{k} vs float64 ===")
+        # Sentence embeddings concentrate in a low-dimensional subspace:
+        # clustered latent vectors, a random linear map, a little noise
+        rng = np.random.default_rng(1)
+        latent = _clustered_vectors(n + queries, rank, clusters=200)
+        data = latent @ rng.normal(size=(rank, dim)) + 0.5 * rng.normal(size=(n + queries, dim))
+        items, probes = data[:n], data[n:]
+        texts = [str(i) for i in range(n)]
+
+        unit = items / np.linalg.norm(items, axis=1, keepdims=True)
+        rows = np.arange(n)
+        exact_top = [set(np.argsort(-(unit @ (q / np.linalg.norm(q))))[:k]) for q in probes]
+        start = time.perf_counter()
+        for q in probes:
+            unit[rows] @ (q / np.linalg.norm(q))
+        base_rate = n * queries / (time.perf_counter() - start)
+        print(f"{'float64 (lru_cache)':<22} {unit.itemsize * dim:6.0f} MB/1M items   "
+              f"{base_rate / 1e6:6.1f} M sims/s   agreement 1.000")
+
+        configs = [("float32", None), ("float16", None), ("int8", None),
+                   ("float16", dim // 4), ("int8", dim // 4), ("int8", dim // 8)]
+        for dtype, pca_dim in configs:
+            projection = PCAProjection.fit(items, pca_dim) if pca_dim else None
+            store = EmbeddingStore(capacity=n, dtype=dtype, projection=projection)
+            for text, vec in zip(texts, items):
+                store.put(text, vec)
+            rows = store.rows(texts)
+
+            start = time.perf_counter()
+            scores = [store.similarities(q, rows) for q in probes]
+            rate = n * queries / (time.perf_counter() - start)
+            agreement = np.mean([len(set(np.argsort(-s)[:k]) & exact) / k for s, exact in zip(scores, exact_top)])
+            label = f"{dtype}" + (f" + PCA {pca_dim}" if pca_dim else "")
+            print(f"{label:<22} {store.nbytes / n:6.0f} MB/1M items   "
+                  f"{rate / 1e6:6.1f} M sims/s   agreement {agreement:.3f}")
+
+
+def _match_payload(n: int, seed: int) -> dict:
+    """A /match/demand-to-supplies body with n candidates around one city."""
+    rng = np.random.default_rng(seed)
+    words = ["rice", "wheat flour", "steel pipe", "solar panel", "face mask", "cooking oil",
+             "cotton fabric", "generator", "tarpaulin", "sanitizer", "timber", "cement"]
+    candidates = []
+    for i in range(n):
+        name = f"{words[i % len(words)]} {words[(i * 7) % len(words)]} lot {i % 97}"
+        candidates.append({
+            "supply": {"supply_id": i, "org_id": i % 200, "item_name": name, "price_per_unit": 10.0,
+                       "quantity": 100, "quantity_unit": "kg"},
+            "org": {"org_id": i % 200, "org_name": f"org {i % 200}",
+                    "latitude": 12.9 + float(rng.uniform(-0.3, 0.3)),
+                    "longitude": 77.6 + float(rng.uniform(-0.3, 0.3))},
+        })
+    return {
+        "demand": {"demand_id": 1, "org_id": 999, "item_name": "rice", "quantity": 50, "quantity_unit": "kg"},
+        "demand_org": {"org_id": 999, "org_name": "query", "latitude": 12.9, "longitude": 77.6},
+        "search_radius": 50,
+        "candidates": candidates,
+    }
+
+
+def benchmark_warm_start(n: int = 5000, steady_requests: int = 10):
+    """Time to first fast request after a restart, cold vs warm (WARM_STATE_DIR)."""
+    import os
+    import signal
+    import socket
+    import subprocess
+    import tempfile
+
+    import requests
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+    payloads = [_match_payload(n, seed) for seed in range(steady_requests + 1)]
+    env = {k: v for k, v in os.environ.items()
+           if k not in ("SHARED_STATE_DIR", "SHARD_MAP_PATH")}
+    env["WARM_STATE_DIR"] = tempfile.mkdtemp(prefix="warm-state-")
+
+    def run(label: str) -> float:
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--log-level", "warning"],
+            env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.DEVNULL,
+        )
+        try:
+            while True:
+                try:
+                    ready = requests.get(f"{base_url}/ready", timeout=1)
+                    if ready.status_code == 200:
+                        break
+                except requests.ConnectionError:
+                    pass
+                time.sleep(0.01)
+            ready_s = time.perf_counter() - started
+            latencies = []
+            for payload in payloads:
+                t = time.perf_counter()
+                requests.post(f"{base_url}/match/demand-to-supplies", json=payload).raise_for_status()
+                latencies.append(time.perf_counter() - t)
+            first_fast_s = time.perf_counter() - started - sum(latencies[1:])
+            steady_ms = 1000 * float(np.median(latencies[1:]))
+            print(f"{label:<6} {ready.json()['state']:<5} ready {ready_s * 1000:7.0f} ms   "
+                  f"first request {latencies[0] * 1000:7.1f} ms   steady {steady_ms:6.1f} ms   "
+                  f"time to first fast request {first_fast_s * 1000:7.0f} ms")
+            return first_fast_s
+        finally:
+            # SIGTERM → graceful shutdown → final snapshot
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=60)
+
+    print(f"\n=== Warm start — {n} candidates per request, restart of one worker process ===")
+    cold = run("cold")
+    warm = run("warm")
+    print(f"Warm start reaches the first fast request {cold / warm:.1f}x sooner")
+
+
+def benchmark_payload(results: int = 30, orgs: int = 8, repeats: int = 2000):
+    """Bytes and serialization time per response: full vs projections, raw and gzipped."""
+    import gzip
+
+    from main import MatchResponse, MatchResult, MatchLabels, ResponseShape, ScoreBreakdown, render_response
+
+    rows = [MatchResult(
+        id=i, org_id=i % orgs, org_name=f"Organisation {i % orgs}", item_name=f"Basmati rice lot {i}",
+        item_category="Grains", item_description="Long-grain aged basmati, 25 kg sacks, stored dry " * 2,
+        price=31.5, currency="USD", quantity=400.0, quantity_unit="kg", distance_km=12.4,
+        name_similarity=0.91, match_score=0.87,
+        score_breakdown=ScoreBreakdown(similarity=0.91, distance=0.6, price=1.0, quantity=1.0),
+        match_labels=MatchLabels(price="under_budget", quantity="full_fulfillment", fulfillment_pct=100.0),
+        category_matched=True, org_email=f"contact{i % orgs}@example.org", org_phone="+91 98765 43210",
+        org_address=f"{i % orgs} Industrial Estate, Bengaluru, Karnataka 560058",
+        org_latitude=12.97, org_longitude=77.59,
+    ) for i in range(results)]
+    response = MatchResponse(total_results=results, results=rows, computed_at="2024-01-01T00:00:00")
+
+    print(f"\n=== Match response payload — {results} results from {orgs} orgs ===")
+    shapes = [
+        ("full", ResponseShape()),
+        ("org_dict", ResponseShape(response_format="org_dict")),
+        ("fields (6)", ResponseShape(fields=["id", "org_id", "org_name", "item_name", "price", "match_score"])),
+        ("compact", ResponseShape(response_format="compact")),
+    ]
+    for label, shape in shapes:
+        start = time.perf_counter()
+        for _ in range(repeats):
+            rendered = render_response(response, shape)
+            body = rendered.body if hasattr(rendered, "body") else rendered.model_dump_json().encode()
+        per_response_us = (time.perf_counter() - start) / repeats * 1e6
+        print(f"{label:<12} {len(body):7d} B   gzip {len(gzip.compress(body)):6d} B   "
+              f"serialize {per_response_us:6.0f} µs")
+
+
+def _allocation_graph(n: int, region: int, degree: int = 30, seed: int = 0):
+    """n supplies and n demands in regions of `region` each; every demand has `degree` scored edges."""
+    rng = np.random.default_rng(seed)
+    offer = rng.uniform(10, 500, n).tolist()
+    need = rng.uniform(10, 500, n).tolist()
+    edges = []
+    for d in range(n):
+        base = (d // region) * region
+        size = min(n, base + region) - base
+        for s in rng.choice(size, min(degree, size), replace=False):
+            edges.append((base + int(s), d, round(float(rng.uniform(0.25, 1.0)), 3)))
+    return offer, need, edges
+
+
+def benchmark_allocation(sizes=(1000, 10000, 100000), region: int = 250, component_sizes=(250, 500, 1000)):
+    """Min-cost-flow allocation: solve time vs graph size, and vs greedy on total score."""
+    from allocation import allocate, objective, solve_greedy
+
+    def run(n, region_size):
+        offer, need, edges = _allocation_graph(n, region_size)
+        start = time.perf_counter()
+        flow, stats = allocate(offer, need, edges)
+        elapsed = time.perf_counter() - start
+        greedy = objective(need, edges, solve_greedy(offer, need, edges))
+        print(f"{n:>7} × {n:<7} {len(edges):>9} edges {stats['components']:>6} components   "
+              f"solve {elapsed:8.2f} s   score {objective(need, edges, flow):10.1f}   greedy {greedy:10.1f}")
+
+    print(f"\n=== Allocation — regions of {region} supplies × {region} demands, 30 edges per demand ===")
+    for n in sizes:
+        run(n, region)
+    print("\n=== Allocation — one connected component (no regional decomposition) ===")
+    for n in component_sizes:
+        run(n, n)
+
+
+BENCHMARKS = {
+    "strings": benchmark_string_similarity,
+    "scheduler": benchmark_scheduler,
+    "adaptive": benchmark_adaptive_radius,
+    "synonyms": benchmark_synonyms,
+    "tokenizer": benchmark_tokenizer,
+    "embeddings": benchmark_embedding_store,
+    "warmstart": benchmark_warm_start,
+    "payload": benchmark_payload,
+    "allocation": benchmark_allocation,
+}
+
+
+if __name__ == "__main__":
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for name in selected:
+        BENCHMARKS[name]()
@@ -0,0 +1,194 @@
+"""
+Online embedding model migration.
+
+Vectors from two embedding models (or one model's two dimensions) cannot
+be compared, so the worker serves exactly one EmbeddingVersion at a
+time. When the configured model (HF_MODEL / OPENAI_MODEL / provider)
+differs from the version of the restored warm-state snapshot, the worker
+keeps serving the snapshot's version (its vectors plus cache misses
+embedded by the old model) and this job re-embeds every known text with
+the new model in the background:
+
+    - rate-limited to EMBEDDING_MIGRATION_RATE texts per second, so the
+      provider's quota and the request path are left alone
+    - texts first seen during the migration are picked up by later passes
+    - failed calls are retried on the next pass
+
+Once a pass finds nothing left to embed, the new store becomes the
+served version in one reference swap (SemanticMatcher.activate) and the
+ANN indexes restart from the new vectors. Until then the new vectors are
+never mixed into scoring.
+
+Progress: the `embedding_migration.*` gauges and counters in /metrics,
+and the "embedding" section of /metrics for the versions involved.
+"""
+
+import threading
+import time
+from typing import Callable, List, Optional
+
+from embedding_store import EmbeddingStore, EmbeddingVersion
+from metrics import metrics
+
+
+class EmbeddingMigration:
+    """Re-embeds the served version's texts with `target`, then cuts over."""
+
+    # Wait after a failed call before the next one (provider down or loading)
+    FAILURE_BACKOFF_SECONDS = 2.0
+
+    def __init__(self, matcher, target: EmbeddingVersion, texts: Callable[[], List[str]],
+                 rate_per_second: float):
+        self.matcher = matcher
+        self.source = matcher.version
+        self.target = target
+        self.texts = texts
+        self.rate_per_second = rate_per_second
+        self.store: EmbeddingStore = matcher.make_store(target)
+        self.state = "pending"
+        self.total = 0
+        self.embedded = 0
+        self.failures = 0
+        self.passes = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def coverage(self) -> float:
+        return min(1.0, len(self.store) / self.total) if self.total else 0.0
+
+    def run(self, stop: threading.Event) -> None:
+        self.state = "running"
+        self.started_at = time.monotonic()
+        interval = 1.0 / self.rate_per_second if self.rate_per_second > 0 else 0.0
+        next_call = time.monotonic()
+        print(f"[Embeddings] Migrating {self.source.key} → {self.target.key} "
+              f"at {self.rate_per_second:g} texts/s")
+        while not stop.is_set():
+            self.passes += 1
+            texts = self.texts()
+            pending = [t for t in texts if t not in self.store]
+            self.total = len(texts)
+            self._publish(len(pending))
+            if not pending:
+                self._cut_over()
+                return
+            for done, text in enumerate(pending):
+                # Throttle: at most rate_per_second calls, whatever the provider's latency
+                delay = next_call - time.monotonic()
+                if delay > 0 and stop.wait(delay):
+                    return
+                next_call = max(next_call + interval, time.monotonic())
+                raw = self.matcher.fetch_embedding(text, self.target)
+                if raw is None:
+                    self.failures += 1
+                    metrics.inc("embedding_migration.failures")
+                    if stop.wait(self.FAILURE_BACKOFF_SECONDS):
+                        return
+                    continue
+                if self.target.dim == 0:
+                    # First vector of an unlisted model: now the store can pick its projection
+                    self.target = self.target._replace(dim=len(raw))
+                    self.store = self.matcher.make_store(self.target)
+                try:
+                    self.store.put(text, raw)
+                except ValueError as e:
+                    # e.g. a PCA projection fitted for another dimension
+                    print(f"[Embeddings] Migration to {self.target.key} failed: {e}")
+                    self.state = "failed"
+                    return
+                self.embedded += 1
+                metrics.inc("embedding_migration.embedded")
+                if self.embedded % 100 == 0:
+                    self._publish(len(pending) - done - 1)
+        self.state = "stopped"
+
+    def _cut_over(self) -> None:
+        self.matcher.activate(self.target, self.store)
+        self.state = "done"
+        self.finished_at = time.monotonic()
+        metrics.inc("embedding_migration.cutovers")
+        metrics.set_gauge("embedding_migration.coverage", 1.0)
+        print(f"[Embeddings] Cut over to {self.target.key}: {len(self.store)} texts re-embedded "
+              f"in {self.finished_at - self.started_at:.0f}s ({self.failures} failed calls retried)")
+
+    def _publish(self, pending: int) -> None:
+        elapsed = time.monotonic() - self.started_at
+        metrics.set_gauge("embedding_migration.coverage", round(self.coverage(), 4))
+        metrics.set_gauge("embedding_migration.pending", pending)
+        metrics.set_gauge("embedding_migration.texts_per_second",
+                          round(self.embedded / elapsed, 2) if elapsed > 0 else 0.0)
+
+    def status(self) -> dict:
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at if self.started_at else 0.0
+        return {
+            "state": self.state,
+            "from": self.source.key,
+            "to": self.target.key,
+            "texts": self.total,
+            "embedded": self.embedded,
+            "coverage": round(self.coverage(), 4),
+            "failures": self.failures,
+            "passes": self.passes,
+            "texts_per_second": round(self.embedded / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+
+def plan_migration(matcher, shared, rate_per_second: float) -> Optional[EmbeddingMigration]:
+    """
+    Compare the restored snapshot's embedding version with the configured
+    one. If they differ, serve the snapshot's version and return the
+    migration job to run; otherwise (or if the old version cannot be
+    served) return None.
+    """
+    configured = matcher.configured_version
+    key = shared.embedding_version if shared is not None else None
+    if key is None:
+        return None
+    previous = EmbeddingVersion.parse(key)
+    if configured.same_as(previous):
+        return None
+    from config import get_settings
+    settings = get_settings()
+    servable = (previous.provider == "huggingface"
+                or (previous.provider == "openai" and settings.OPENAI_API_KEY))
+    if not servable or configured.provider not in ("huggingface", "openai"):
+        print(f"[Embeddings] Snapshot vectors are {previous.key}, configured {configured.key}: "
+              f"the old model cannot be served, starting cold on {configured.key}")
+        # Drops ANN indexes restored with the snapshot's vectors
+        matcher.activate(configured, matcher.store)
+        return None
+
+    # Serve the snapshot's version: its vectors stay valid, misses use its model
+    matcher.activate(previous, matcher.make_store(previous))
+
+    def texts() -> List[str]:
+        # Known texts: the snapshot's plus everything embedded since, up to the store size
+        known = dict.fromkeys(t for t in shared.embedding_texts() if t)
+        known.update(dict.fromkeys(matcher.store.texts()))
+        return list(known)[-matcher.store.capacity:]
+
+    return EmbeddingMigration(matcher, configured, texts, rate_per_second)
+
+
+# Global instance
+_migration: Optional[EmbeddingMigration] = None
+
+
+def get_embedding_migration() -> Optional[EmbeddingMigration]:
+    return _migration
+
+
+def start_embedding_migration(stop: threading.Event) -> Optional[EmbeddingMigration]:
+    """Plan (and start in the background) a migration to the configured embedding model."""
+    global _migration
+    from config import get_settings
+    from semantic_search import get_semantic_matcher
+    from shared_state import get_shared_state
+
+    settings = get_settings()
+    if not settings.USE_SEMANTIC_SEARCH:
+        return None
+    _migration = plan_migration(get_semantic_matcher(), get_shared_state(), settings.EMBEDDING_MIGRATION_RATE)
+    if _migration is not None:
+        threading.Thread(target=_migration.run, args=(stop,), name="embedding-migration", daemon=True).start()
+    return _migration
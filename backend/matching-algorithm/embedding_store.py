@@ -0,0 +1,267 @@
+"""
+Compact in-memory embedding store.
+
+Replaces holding float64 embedding arrays in an lru_cache. Vectors are
+L2-normalised, optionally projected with PCA to a lower dimension, and
+stored quantized in one preallocated matrix:
+
+    float32 — 4 bytes/dim, exact
+    float16 — 2 bytes/dim, ~1e-3 relative error
+    int8    — 1 byte/dim + one float32 scale per vector
+
+The store is a fixed-capacity ring that grows by doubling up to
+`capacity`; when full, the oldest entry is overwritten. Reads return
+dequantized float32 unit vectors, so a cosine similarity is just a dot
+product.
+
+PCA projections are fitted offline on our own corpus and loaded from an
+.npz file (mean, components):
+
+    python embedding_store.py fit-pca 128 pca.npz   # texts from CATALOG_PATH
+
+Vectors from different models are not comparable, so every store and
+every published generation carries the EmbeddingVersion (provider,
+model, dimension) its vectors came from.
+"""
+
+import os
+import sys
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+
+DTYPES = ("float32", "float16", "int8")
+
+# Output dimension of the embedding models we support, for zero fallbacks
+# before the first real embedding has been seen
+MODEL_DIMENSIONS = {
+    "sentence-transformers/all-MiniLM-L6-v2": 384,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+
+class EmbeddingVersion(NamedTuple):
+    """Where a vector came from; vectors of different versions must not be compared."""
+    provider: str
+    model: str
+    # Raw model output dimension; 0 while unknown (unlisted model, nothing fetched yet)
+    dim: int = 0
+
+    @property
+    def key(self) -> str:
+        return f"{self.provider}/{self.model}/{self.dim}"
+
+    @classmethod
+    def parse(cls, key: str) -> "EmbeddingVersion":
+        provider, rest = key.split("/", 1)
+        model, dim = rest.rsplit("/", 1)
+        return cls(provider, model, int(dim))
+
+    @classmethod
+    def of(cls, provider: str, model: str) -> "EmbeddingVersion":
+        return cls(provider, model, MODEL_DIMENSIONS.get(model, 0))
+
+    def same_as(self, other: Optional["EmbeddingVersion"]) -> bool:
+        """Same provider and model, and the same dimension where both are known."""
+        return (other is not None and self.provider == other.provider and self.model == other.model
+                and (self.dim == other.dim or 0 in (self.dim, other.dim)))
+
+
+class PCAProjection:
+    """Linear projection x → (x - mean) @ components.T, fitted on sample vectors."""
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray):
+        self.mean = mean.astype(np.float32)
+        self.components = components.astype(np.float32)
+
+    @property
+    def input_dim(self) -> int:
+        return self.components.shape[1]
+
+    @property
+    def output_dim(self) -> int:
+        return self.components.shape[0]
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, dim: int) -> "PCAProjection":
+        data = np.asarray(vectors, dtype=np.float32)
+        data = data / np.maximum(np.linalg.norm(data, axis=1, keepdims=True), 1e-12)
+        mean = data.mean(axis=0)
+        # Principal axes are the top right-singular vectors of the centred data
+        _, _, vt = np.linalg.svd(data - mean, full_matrices=False)
+        return cls(mean, vt[:dim])
+
+    def project(self, vectors: np.ndarray) -> np.ndarray:
+        return (vectors - self.mean) @ self.components.T
+
+    def save(self, path: str) -> None:
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, mean=self.mean, components=self.components)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "PCAProjection":
+        with np.load(path) as data:
+            return cls(data["mean"], data["components"])
+
+
+class EmbeddingStore:
+    """Fixed-capacity text → normalised, quantized vector store."""
+
+    def __init__(self, capacity: int = 100000, dtype: str = "float16",
+                 projection: Optional[PCAProjection] = None):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported embedding dtype: {dtype}")
+        self.capacity = capacity
+        self.dtype = dtype
+        self.projection = projection
+        self.dim: Optional[int] = projection.output_dim if projection is not None else None
+        self._lock = threading.Lock()
+        self._codes: Optional[np.ndarray] = None
+        self._scales = np.ones(0, dtype=np.float32)
+        self._row_of: Dict[str, int] = {}
+        self._text_at: List[Optional[str]] = [None] * capacity
+        self._next = 0
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    def __contains__(self, text: str) -> bool:
+        return text in self._row_of
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes used by vector storage (codes plus int8 scales)."""
+        if self._codes is None:
+            return 0
+        return self._codes.nbytes + (self._scales.nbytes if self.dtype == "int8" else 0)
+
+    def encode(self, vector: np.ndarray) -> np.ndarray:
+        """Project (if configured) and normalise one raw embedding to float32."""
+        vec = np.asarray(vector, dtype=np.float32).ravel()
+        if self.projection is not None:
+            if vec.shape[0] != self.projection.input_dim:
+                raise ValueError(f"Embedding dimension {vec.shape[0]} does not match "
+                                 f"projection input {self.projection.input_dim}")
+            if np.any(vec):
+                vec = self.projection.project(vec / np.linalg.norm(vec))
+            else:
+                vec = np.zeros(self.projection.output_dim, dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm > 0 else vec
+
+    def put(self, text: str, vector: np.ndarray) -> np.ndarray:
+        """Store `vector` for `text`; returns the stored (dequantized) unit vector."""
+        vec = self.encode(vector)
+        with self._lock:
+            if self._codes is None:
+                self.dim = vec.shape[0]
+                self._codes = np.zeros((0, self.dim), dtype=self.dtype)
+            elif vec.shape[0] != self.dim:
+                raise ValueError(f"Embedding dimension {vec.shape[0]} does not match store dimension {self.dim}")
+
+            row = self._row_of.get(text)
+            if row is None:
+                row = self._next
+                self._next = (self._next + 1) % self.capacity
+                if row >= len(self._codes):
+                    self._grow()
+                evicted = self._text_at[row]
+                if evicted is not None:
+                    del self._row_of[evicted]
+                self._text_at[row] = text
+                self._row_of[text] = row
+
+            if self.dtype == "int8":
+                peak = float(np.max(np.abs(vec))) if vec.size else 0.0
+                scale = peak / 127.0 if peak > 0 else 1.0
+                self._codes[row] = np.round(vec / scale).astype(np.int8)
+                self._scales[row] = scale
+            else:
+                self._codes[row] = vec
+            return self._decode(row)
+
+    def _grow(self) -> None:
+        size = min(self.capacity, max(1024, 2 * len(self._codes)))
+        codes = np.zeros((size, self.dim), dtype=self.dtype)
+        codes[:len(self._codes)] = self._codes
+        scales = np.ones(size, dtype=np.float32)
+        scales[:len(self._scales)] = self._scales
+        self._codes, self._scales = codes, scales
+
+    def _decode(self, row: int) -> np.ndarray:
+        vec = self._codes[row].astype(np.float32)
+        if self.dtype == "int8":
+            vec *= self._scales[row]
+        return vec
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self._row_of.get(text)
+            return None if row is None else self._decode(row)
+
+    def texts(self) -> List[str]:
+        with self._lock:
+            return list(self._row_of)
+
+    def items(self) -> List[Tuple[str, np.ndarray]]:
+        """All stored (text, dequantized vector) pairs, e.g. for snapshots."""
+        with self._lock:
+            return [(text, self._decode(row)) for text, row in self._row_of.items()]
+
+    def rows(self, texts: List[str]) -> np.ndarray:
+        """Storage rows of `texts` (-1 where not stored)."""
+        with self._lock:
+            return np.array([self._row_of.get(t, -1) for t in texts], dtype=np.int64)
+
+    def similarities(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Cosine similarity of `query` to each stored row (NaN for -1)."""
+        q = self.encode(query)
+        out = np.full(len(rows), np.nan, dtype=np.float32)
+        valid = rows >= 0
+        if not valid.any():
+            return out
+        with self._lock:
+            picked = rows[valid]
+            scores = self._codes[picked].astype(np.float32) @ q
+            if self.dtype == "int8":
+                scores *= self._scales[picked]
+        out[valid] = scores
+        return out
+
+
+def fallback_dimension(model: str, store: Optional[EmbeddingStore] = None) -> int:
+    """Dimension for zero-vector fallbacks: the store's, else the model's known size."""
+    if store is not None and store.dim:
+        return store.dim
+    return MODEL_DIMENSIONS.get(model, 384)
+
+
+def _fit_pca_from_catalog(dim: int, out_path: str) -> None:
+    import json
+    from config import get_settings
+    from loader import _item_text
+    from semantic_search import get_semantic_matcher
+
+    settings = get_settings()
+    with open(settings.CATALOG_PATH) as f:
+        catalog = json.load(f)
+    texts = sorted({_item_text(item) for key in ("supplies", "demands") for item in catalog.get(key, [])})
+    matcher = get_semantic_matcher()
+    vectors = np.array([v for v in (matcher.fetch_embedding(t) for t in texts) if v is not None and np.any(v)])
+    if len(vectors) < dim:
+        print(f"[Embeddings] Need at least {dim} embedded texts to fit PCA, got {len(vectors)}")
+        sys.exit(1)
+    PCAProjection.fit(vectors, dim).save(out_path)
+    print(f"[Embeddings] Fitted PCA {vectors.shape[1]} → {dim} on {len(vectors)} texts: {out_path}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "fit-pca":
+        print("Usage: python embedding_store.py fit-pca <dim> <out.npz>")
+        sys.exit(1)
+    _fit_pca_from_catalog(int(sys.argv[2]), sys.argv[3])
@@ -0,0 +1,369 @@
+"""
+Ranking quality vs latency of the worker's matching modes.
+
+Every shortcut in the matching pipeline (token index prefilter and
+semantic top-M, adaptive radius early stop, quantized embeddings) may
+trade some exactness for speed. This harness runs a corpus of queries through
+each mode and compares the results with the exact ordering: every
+in-radius candidate scored by `calculate_match_score_detailed`, with no
+prefilter and no early stop.
+
+Per mode it reports, averaged over the queries:
+
+    ndcg@K      NDCG of the mode's top K, graded by the exact match scores
+    recall@K    share of the exact top K the mode also returns
+    label@K     NDCG against the corpus' relevance labels, if it has any
+    |Δscore|    mean and max score difference on results both rankings have
+    p50 / p95   request latency (after one warm-up pass per mode)
+    peak KiB    peak Python allocations per request (tracemalloc, separate pass)
+
+Corpora:
+    - synthetic: items named from the built-in synonym clusters (with
+      modifiers and typos) around one city. Labels: same cluster = 2,
+      same category = 1.
+    - a catalog export in the loader.py format, optionally with labels:
+        "judgements": [{"demand_id": 1, "supply_id": 7, "relevance": 2}]
+      Demands are the queries, all supplies the candidates.
+
+Semantic modes (embedding store dtypes, semantic top-M candidates) only
+run when an embedding provider is configured; the exact reference then
+uses float32 embeddings.
+
+Usage:
+    python evaluation.py                           # synthetic corpus
+    python evaluation.py --catalog catalog.json    # exported dataset
+    python evaluation.py --modes exact,token_index --json results.json
+"""
+
+import argparse
+import json
+import math
+import random
+import time
+import tracemalloc
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import main
+from main import DemandData, OrgData, SupplyData
+from semantic_search import get_semantic_matcher
+from embedding_store import EmbeddingStore
+from utils import _SYNONYM_CLUSTERS
+
+settings = main.settings
+
+# Mode name → (settings overrides, embedding store dtype or None for the configured store)
+EXACT = {"USE_TOKEN_INDEX": False, "ADAPTIVE_RADIUS_SEARCH": False}
+MODES = {
+    "exact": (EXACT, None),
+    "adaptive": ({"USE_TOKEN_INDEX": False, "ADAPTIVE_RADIUS_SEARCH": True}, None),
+    "token_index": ({"USE_TOKEN_INDEX": True, "ADAPTIVE_RADIUS_SEARCH": False}, None),
+    "token_index+adaptive": ({"USE_TOKEN_INDEX": True, "ADAPTIVE_RADIUS_SEARCH": True}, None),
+}
+SEMANTIC_MODES = {
+    "float16": (EXACT, "float16"),
+    "int8": (EXACT, "int8"),
+    "prefilter+float16": ({"USE_TOKEN_INDEX": True, "ADAPTIVE_RADIUS_SEARCH": True}, "float16"),
+    "prefilter+int8": ({"USE_TOKEN_INDEX": True, "ADAPTIVE_RADIUS_SEARCH": True}, "int8"),
+}
+
+
+# ═══════════════════════════════════════════════════════════════
+# Corpora
+# ═══════════════════════════════════════════════════════════════
+
+class Corpus:
+    """Queries (demands), candidates (supplies) and optional relevance labels."""
+
+    def __init__(self, name: str, queries: list, candidates: list, radius: float,
+                 labels: Optional[Dict[Tuple[int, int], float]] = None):
+        self.name = name
+        self.queries = queries          # [(DemandData, OrgData)]
+        self.candidates = candidates    # [(SupplyData, OrgData)]
+        self.radius = radius
+        self.labels = labels or {}      # (demand_id, supply_id) → relevance
+
+
+_MODIFIERS = ["", "", "bulk", "surplus", "grade A", "used", "new", "export quality", "local"]
+# Clusters are grouped into categories of five
+_CATEGORY_SIZE = 5
+
+
+def _typo(word: str, rng: random.Random) -> str:
+    if len(word) < 4:
+        return word
+    i = rng.randrange(len(word) - 1)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def synthetic_corpus(supplies: int = 5000, queries: int = 100, orgs: int = 400,
+                     radius: float = 50.0, seed: int = 0) -> Corpus:
+    """Supplies and demands named from `_SYNONYM_CLUSTERS`, around one city."""
+    rng = random.Random(seed)
+
+    def make_org(org_id: int) -> OrgData:
+        # Most orgs in the city centre, a tail spread over and beyond the radius
+        spread = 0.05 if rng.random() < 0.7 else 0.6
+        return OrgData(org_id=org_id, org_name=f"Org {org_id}",
+                       latitude=12.97 + rng.uniform(-spread, spread),
+                       longitude=77.59 + rng.uniform(-spread, spread))
+
+    def make_item(cluster: int) -> dict:
+        name = rng.choice(_SYNONYM_CLUSTERS[cluster])
+        if rng.random() < 0.15:
+            name = _typo(name, rng)
+        name = f"{rng.choice(_MODIFIERS)} {name}".strip()
+        category = cluster // _CATEGORY_SIZE
+        item = {"item_name": name.capitalize(), "quantity": rng.uniform(10, 1000),
+                "quantity_unit": rng.choice(["kg", "kg", "tons"])}
+        # Many real items carry no category
+        if rng.random() < 0.5:
+            item.update(category_id=category + 1, item_category=f"Category {category + 1}")
+        return item
+
+    supply_orgs = [make_org(i) for i in range(orgs)]
+    supply_clusters = []
+    candidates = []
+    for i in range(supplies):
+        cluster = rng.randrange(len(_SYNONYM_CLUSTERS))
+        org = rng.choice(supply_orgs)
+        supply = SupplyData(supply_id=i, org_id=org.org_id, price_per_unit=rng.uniform(10, 100), **make_item(cluster))
+        supply_clusters.append(cluster)
+        candidates.append((supply, org))
+
+    labels = {}
+    query_list = []
+    for i in range(queries):
+        cluster = rng.randrange(len(_SYNONYM_CLUSTERS))
+        org = make_org(orgs + i)
+        demand = DemandData(demand_id=i, org_id=org.org_id, max_price_per_unit=rng.uniform(30, 90), **make_item(cluster))
+        query_list.append((demand, org))
+        for supply_id, supply_cluster in enumerate(supply_clusters):
+            if supply_cluster == cluster:
+                labels[(i, supply_id)] = 2.0
+            elif supply_cluster // _CATEGORY_SIZE == cluster // _CATEGORY_SIZE:
+                labels[(i, supply_id)] = 1.0
+    return Corpus(f"synthetic ({supplies} supplies)", query_list, candidates, radius, labels)
+
+
+def load_catalog(path: str, queries: int = 100, radius: float = 50.0, seed: int = 0) -> Corpus:
+    """A catalog export (loader.py format); a sample of its demands are the queries."""
+    with open(path) as f:
+        catalog = json.load(f)
+    orgs = {}
+    for org in catalog.get("orgs", []):
+        if org.get("latitude") is None or org.get("longitude") is None:
+            continue
+        orgs[int(org["org_id"])] = OrgData(**{"org_name": f"Org {org['org_id']}", **org})
+
+    candidates = [(SupplyData(**s), orgs[int(s["org_id"])])
+                  for s in catalog.get("supplies", []) if int(s["org_id"]) in orgs]
+    demands = [(DemandData(**d), orgs[int(d["org_id"])])
+               for d in catalog.get("demands", []) if int(d["org_id"]) in orgs]
+    if len(demands) > queries:
+        demands = random.Random(seed).sample(demands, queries)
+    labels = {(int(j["demand_id"]), int(j["supply_id"])): float(j["relevance"])
+              for j in catalog.get("judgements", [])}
+    return Corpus(path, demands, candidates, radius, labels)
+
+
+# ═══════════════════════════════════════════════════════════════
+# Metrics
+# ═══════════════════════════════════════════════════════════════
+
+def dcg(gains: List[float]) -> float:
+    return sum(g / math.log2(i + 2) for i, g in enumerate(gains))
+
+
+def ndcg(ranked_ids: List[int], gain: Dict[int, float], k: int) -> Optional[float]:
+    """NDCG@k of ranked_ids under `gain` (id → graded relevance); None if nothing is relevant."""
+    ideal = dcg(sorted(gain.values(), reverse=True)[:k])
+    if ideal <= 0:
+        return None
+    return dcg([gain.get(i, 0.0) for i in ranked_ids[:k]]) / ideal
+
+
+def _mean(values: List[float]) -> Optional[float]:
+    return sum(values) / len(values) if values else None
+
+
+# ═══════════════════════════════════════════════════════════════
+# Runner
+# ═══════════════════════════════════════════════════════════════
+
+class _ModeSettings:
+    """Applies a mode's settings overrides and embedding store; restores both on exit."""
+
+    def __init__(self, overrides: dict, store_dtype: Optional[str], stores: Dict[str, EmbeddingStore]):
+        self.overrides = overrides
+        self.store_dtype = store_dtype
+        self.stores = stores
+
+    def __enter__(self):
+        self.saved = {name: getattr(settings, name) for name in self.overrides}
+        for name, value in self.overrides.items():
+            setattr(settings, name, value)
+        if settings.USE_SEMANTIC_SEARCH:
+            matcher = get_semantic_matcher()
+            self.saved_store = matcher.store
+            if self.store_dtype is not None:
+                store = self.stores.get(self.store_dtype)
+                if store is None:
+                    store = self.stores[self.store_dtype] = EmbeddingStore(
+                        capacity=settings.EMBEDDING_STORE_SIZE, dtype=self.store_dtype)
+                matcher.store = store
+        return self
+
+    def __exit__(self, *exc):
+        for name, value in self.saved.items():
+            setattr(settings, name, value)
+        if settings.USE_SEMANTIC_SEARCH:
+            get_semantic_matcher().store = self.saved_store
+
+
+def _cache_raw_embeddings() -> None:
+    """Fetch each text's raw embedding once for all the stores under test."""
+    matcher = get_semantic_matcher()
+    fetch = matcher.fetch_embedding
+    raw: Dict[tuple, Optional[np.ndarray]] = {}
+
+    def cached_fetch(text: str, version=None):
+        key = (text, version)
+        if key not in raw:
+            raw[key] = fetch(text, version)
+        return raw[key]
+
+    matcher.fetch_embedding = cached_fetch
+
+
+def reference(corpus: Corpus, stores: Dict[str, EmbeddingStore]) -> List[Dict[int, float]]:
+    """Exact match score of every qualifying candidate, per query."""
+    saved_k = settings.MAX_RESULTS
+    settings.MAX_RESULTS = len(corpus.candidates)
+    try:
+        with _ModeSettings(EXACT, "float32" if settings.USE_SEMANTIC_SEARCH else None, stores):
+            return [{r.id: r.match_score for r in main.match_candidates(query, org, corpus.candidates, corpus.radius)}
+                    for query, org in corpus.queries]
+    finally:
+        settings.MAX_RESULTS = saved_k
+
+
+def evaluate_mode(corpus: Corpus, exact: List[Dict[int, float]], overrides: dict,
+                  store_dtype: Optional[str], stores: Dict[str, EmbeddingStore],
+                  memory_queries: int) -> dict:
+    k = settings.MAX_RESULTS
+    with _ModeSettings(overrides, store_dtype, stores):
+        # Warm-up pass: fills indexes and similarity/embedding caches
+        for query, org in corpus.queries:
+            main.match_candidates(query, org, corpus.candidates, corpus.radius)
+
+        latencies, rankings = [], []
+        for query, org in corpus.queries:
+            start = time.perf_counter()
+            results = main.match_candidates(query, org, corpus.candidates, corpus.radius)
+            latencies.append((time.perf_counter() - start) * 1000)
+            rankings.append(results)
+
+        peaks = []
+        tracemalloc.start()
+        try:
+            for query, org in corpus.queries[:memory_queries]:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                main.match_candidates(query, org, corpus.candidates, corpus.radius)
+                peaks.append((tracemalloc.get_traced_memory()[1] - before) / 1024)
+        finally:
+            tracemalloc.stop()
+
+    ndcgs, recalls, label_ndcgs, deltas = [], [], [], []
+    for (query, _), results, exact_scores in zip(corpus.queries, rankings, exact):
+        ranked = [r.id for r in results]
+        score = ndcg(ranked, exact_scores, k)
+        if score is not None:
+            ndcgs.append(score)
+            top = sorted(exact_scores, key=exact_scores.get, reverse=True)[:k]
+            recalls.append(len(set(top) & set(ranked)) / len(top))
+        labels = {s: rel for (d, s), rel in corpus.labels.items() if d == query.demand_id}
+        label_score = ndcg(ranked, labels, k)
+        if label_score is not None:
+            label_ndcgs.append(label_score)
+        deltas.extend(abs(r.match_score - exact_scores[r.id]) for r in results if r.id in exact_scores)
+
+    return {
+        f"ndcg@{k}": _mean(ndcgs),
+        f"recall@{k}": _mean(recalls),
+        f"label_ndcg@{k}": _mean(label_ndcgs),
+        "mean_abs_score_delta": _mean(deltas),
+        "max_abs_score_delta": max(deltas) if deltas else None,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "peak_kib": _mean(peaks),
+    }
+
+
+def run(corpus: Corpus, mode_names: Optional[List[str]] = None, memory_queries: int = 20) -> Dict[str, dict]:
+    modes = dict(MODES)
+    if settings.USE_SEMANTIC_SEARCH:
+        modes.update(SEMANTIC_MODES)
+    unknown = [name for name in mode_names or [] if name not in modes]
+    if unknown:
+        raise ValueError(f"Unknown or unavailable modes: {', '.join(unknown)} (available: {', '.join(modes)})")
+
+    # Sampled recall checks would add brute-force runs to the timings
+    saved_sample_rate = settings.TOKEN_INDEX_RECALL_SAMPLE_RATE
+    settings.TOKEN_INDEX_RECALL_SAMPLE_RATE = 0.0
+    stores: Dict[str, EmbeddingStore] = {}
+    if settings.USE_SEMANTIC_SEARCH:
+        _cache_raw_embeddings()
+    try:
+        exact = reference(corpus, stores)
+        return {name: evaluate_mode(corpus, exact, *modes[name], stores, memory_queries)
+                for name in mode_names or modes}
+    finally:
+        settings.TOKEN_INDEX_RECALL_SAMPLE_RATE = saved_sample_rate
+
+
+def print_report(corpus: Corpus, report: Dict[str, dict]) -> None:
+    k = settings.MAX_RESULTS
+
+    def cell(value, fmt):
+        return format(value, fmt) if value is not None else "-".rjust(len(format(0.0, fmt)))
+
+    print(f"\n=== Evaluation — {corpus.name}, {len(corpus.queries)} queries, radius {corpus.radius} km ===")
+    print(f"{'mode':<22} {'ndcg@' + str(k):>8} {'recall@' + str(k):>9} {'label@' + str(k):>8} "
+          f"{'|Δscore|':>9} {'max Δ':>7} {'p50 ms':>8} {'p95 ms':>8} {'peak KiB':>9}")
+    for name, row in report.items():
+        print(f"{name:<22} {cell(row[f'ndcg@{k}'], '8.4f')} {cell(row[f'recall@{k}'], '9.4f')} "
+              f"{cell(row[f'label_ndcg@{k}'], '8.4f')} {cell(row['mean_abs_score_delta'], '9.4f')} "
+              f"{cell(row['max_abs_score_delta'], '7.3f')} {row['p50_ms']:8.1f} {row['p95_ms']:8.1f} "
+              f"{cell(row['peak_kib'], '9.0f')}")
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--catalog", help="catalog export to evaluate on (default: synthetic corpus)")
+    parser.add_argument("--supplies", type=int, default=5000, help="synthetic corpus size")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--radius", type=float, default=settings.DEFAULT_SEARCH_RADIUS_KM)
+    parser.add_argument("--modes", help="comma-separated mode names (default: all available)")
+    parser.add_argument("--memory-queries", type=int, default=20, help="queries in the tracemalloc pass")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    if args.catalog:
+        corpus = load_catalog(args.catalog, args.queries, args.radius, args.seed)
+    else:
+        corpus = synthetic_corpus(args.supplies, args.queries, radius=args.radius, seed=args.seed)
+    mode_names = args.modes.split(",") if args.modes else None
+    report = run(corpus, mode_names, args.memory_queries)
+    print_report(corpus, report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"corpus": corpus.name, "queries": len(corpus.queries), "radius": corpus.radius,
+                       "modes": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,94 @@
+"""
+Shared-state loader for multi-process serving.
+
+Reads a catalog export (JSON, written by the Node.js server or any batch
+job), builds the embedding matrix and token indexes once, and publishes
+them as a new shared-state generation that every worker process
+attaches to read-only (see shared_state.py).
+
+Catalog format:
+    {
+      "supplies": [{"supply_id": 1, "org_id": 1, "item_name": "Rice", ...}],
+      "demands":  [{"demand_id": 1, "org_id": 2, "item_name": "Basmati", ...}]
+    }
+
+Usage:
+    python loader.py            # watch CATALOG_PATH and republish on change
+    python loader.py --once     # build one generation and exit
+"""
+
+import json
+import os
+import sys
+import time
+
+from config import get_settings
+from shared_state import publish_generation
+from token_index import TokenIndex
+from utils import build_rich_text
+
+settings = get_settings()
+
+
+def _item_text(item: dict) -> str:
+    return build_rich_text(item.get("item_name"), item.get("item_description"), item.get("item_category"))
+
+
+def build_generation(catalog_path: str, state_dir: str) -> int:
+    """Build and publish one generation from the catalog file."""
+    with open(catalog_path) as f:
+        catalog = json.load(f)
+
+    token_indexes = {"supply": TokenIndex(), "demand": TokenIndex()}
+    texts = []
+    for kind, key, id_field in (("supply", "supplies", "supply_id"), ("demand", "demands", "demand_id")):
+        for item in catalog.get(key, []):
+            text = _item_text(item)
+            texts.append(text)
+            token_indexes[kind].upsert(
+                int(item[id_field]), text, item.get("category_id"), item.get("item_category")
+            )
+
+    embeddings = {}
+    embedding_version = None
+    if settings.USE_SEMANTIC_SEARCH:
+        from semantic_search import get_semantic_matcher
+        matcher = get_semantic_matcher()
+        for text in set(texts):
+            embeddings[text.lower().strip()] = matcher.get_embedding(text)
+        embedding_version = matcher.version.key
+
+    return publish_generation(state_dir, embeddings, token_indexes, embedding_version=embedding_version)
+
+
+def run_loader(catalog_path: str, state_dir: str, poll_seconds: float, once: bool = False) -> None:
+    """Publish a generation whenever the catalog file changes."""
+    last_mtime = None
+    while True:
+        try:
+            mtime = os.stat(catalog_path).st_mtime_ns
+            if mtime != last_mtime:
+                start = time.perf_counter()
+                generation = build_generation(catalog_path, state_dir)
+                last_mtime = mtime
+                print(f"[Loader] Published generation {generation} "
+                      f"in {time.perf_counter() - start:.2f}s")
+        except FileNotFoundError:
+            print(f"[Loader] Waiting for catalog at {catalog_path}")
+        except Exception as e:
+            print(f"[Loader] Build failed: {e}")
+        if once:
+            return
+        time.sleep(poll_seconds)
+
+
+if __name__ == "__main__":
+    if not settings.CATALOG_PATH or not settings.SHARED_STATE_DIR:
+        print("CATALOG_PATH and SHARED_STATE_DIR must be set")
+        sys.exit(1)
+    run_loader(
+        settings.CATALOG_PATH,
+        settings.SHARED_STATE_DIR,
+        settings.LOADER_POLL_SECONDS,
+        once="--once" in sys.argv,
+    )
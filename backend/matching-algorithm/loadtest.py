@@ -0,0 +1,482 @@
+"""
+Open-loop load test of the matching worker.
+
+Starts a worker process (uvicorn, free local port) and, unless
+--fuzzy-only, a stand-in Hugging Face embedding server it talks to. Then
+sends /match/demand-to-supplies requests at each configured rate, with
+Poisson arrivals that do not wait for earlier responses. Latency is
+measured from each request's scheduled send time, so a slow worker
+cannot hide its queueing by slowing the sender down.
+
+Per rate it reports achieved throughput, p50/p95/p99 latency, the error
+rate (worker 503s, other errors, timeouts), the share of partial and
+degraded answers, and the embedding server's traffic. The saturation
+point is the first rate at which throughput falls behind the sent rate
+(a backlog builds up), p99 exceeds --slo-ms or errors exceed
+--max-error-rate.
+
+Request sizes follow a candidate-count mix ("100:0.7,1000:0.25,5000:0.05").
+A share of candidate names (--novel-fraction) is unique per request, so
+the embedding cache keeps missing as it would on live traffic.
+
+The embedding server answers like the Inference API paths that
+`_get_hf_embedding` handles: 200 with a vector, 503 while the "model is
+loading", other errors. Latency, loading time and failure rates are
+configurable.
+
+Usage:
+    python loadtest.py --rates 2,5,10,20 --duration 20
+    python loadtest.py --mix 1000:1 --embed-latency-ms 80 --embed-loading-rate 0.02
+    python loadtest.py --fuzzy-only --worker-env MAX_IN_FLIGHT=2
+    python loadtest.py embed-server --port 8900 --latency-ms 50
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import requests
+
+from utils import _SYNONYM_CLUSTERS
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+# ═══════════════════════════════════════════════════════════════
+# Stand-in embedding server
+# ═══════════════════════════════════════════════════════════════
+
+def hashed_embedding(text: str, dim: int = 384) -> List[float]:
+    """Deterministic bag-of-words/trigram vector: similar texts get similar vectors."""
+    vec = np.zeros(dim, dtype=np.float32)
+    text = text.lower()
+    for word in text.split():
+        vec[zlib.crc32(word.encode()) % dim] += 1.0
+    for i in range(len(text) - 2):
+        vec[zlib.crc32(text[i:i + 3].encode()) % dim] += 0.3
+    norm = np.linalg.norm(vec)
+    return (vec / norm if norm else vec).tolist()
+
+
+class EmbeddingServer:
+    """
+    Threaded HTTP server for POST <anything>/{model} with {"inputs": ...}.
+    The first `loading_seconds` and a `loading_rate` share of calls get
+    503 "currently loading"; an `error_rate` share gets 500.
+    """
+
+    def __init__(self, port: int, latency_ms: float = 30.0, jitter_ms: float = 10.0,
+                 loading_seconds: float = 0.0, loading_rate: float = 0.0, error_rate: float = 0.0,
+                 dim: int = 384, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.loading_seconds = loading_seconds
+        self.loading_rate = loading_rate
+        self.error_rate = error_rate
+        self.dim = dim
+        self.rng = random.Random(seed)
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "ok": 0, "loading": 0, "error": 0}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                status, payload = server.respond(self.path, body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                data = json.dumps(server.stats()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.httpd.daemon_threads = True
+
+    def respond(self, path: str, body: dict) -> Tuple[int, object]:
+        with self.lock:
+            self.counts["requests"] += 1
+            roll = self.rng.random()
+            delay = max(0.0, self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+        time.sleep(delay)
+        model = path.rsplit("/feature-extraction/", 1)[-1].lstrip("/")
+        if time.monotonic() - self.started < self.loading_seconds or roll < self.loading_rate:
+            outcome, status = "loading", 503
+            payload = {"error": f"Model {model} is currently loading", "estimated_time": 20.0}
+        elif roll < self.loading_rate + self.error_rate:
+            outcome, status = "error", 500
+            payload = {"error": "Internal Server Error"}
+        else:
+            outcome, status = "ok", 200
+            inputs = body.get("inputs", "")
+            if isinstance(inputs, list):
+                payload = [hashed_embedding(text, self.dim) for text in inputs]
+            else:
+                payload = hashed_embedding(inputs, self.dim)
+        with self.lock:
+            self.counts[outcome] += 1
+        return status, payload
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(self.counts)
+
+    def serve_forever(self) -> None:
+        self.httpd.serve_forever()
+
+
+# ═══════════════════════════════════════════════════════════════
+# Payloads
+# ═══════════════════════════════════════════════════════════════
+
+# Replaced by a per-request counter in novel candidate names
+NOVEL_MARKER = "@@"
+
+
+def parse_mix(mix: str) -> List[Tuple[int, float]]:
+    """"100:0.7,1000:0.3" → [(100, 0.7), (1000, 0.3)]"""
+    pairs = []
+    for part in mix.split(","):
+        size, weight = part.split(":")
+        pairs.append((int(size), float(weight)))
+    return pairs
+
+
+def payload_template(size: int, novel_fraction: float, seed: int) -> str:
+    """A /match/demand-to-supplies body (as JSON text) with `size` candidates around one city."""
+    rng = random.Random(seed)
+    words = [word for cluster in _SYNONYM_CLUSTERS for word in cluster]
+    candidates = []
+    for i in range(size):
+        name = f"{rng.choice(words)} {rng.choice(['', 'bulk', 'surplus', 'grade A', 'used'])}".strip()
+        if rng.random() < novel_fraction:
+            name = f"{name} batch {i}-{NOVEL_MARKER}"
+        org_id = i % 300
+        candidates.append({
+            "supply": {"supply_id": i, "org_id": org_id, "item_name": name,
+                       "price_per_unit": round(rng.uniform(10, 100), 2),
+                       "quantity": round(rng.uniform(10, 1000), 1), "quantity_unit": "kg"},
+            "org": {"org_id": org_id, "org_name": f"Org {org_id}",
+                    "latitude": 12.97 + rng.uniform(-0.3, 0.3), "longitude": 77.59 + rng.uniform(-0.3, 0.3)},
+        })
+    return json.dumps({
+        "demand": {"demand_id": 1, "org_id": 9999, "item_name": rng.choice(words),
+                   "max_price_per_unit": 60, "quantity": 100, "quantity_unit": "kg"},
+        "demand_org": {"org_id": 9999, "org_name": "Load test", "latitude": 12.97, "longitude": 77.59},
+        "search_radius": 50,
+        "candidates": candidates,
+        "response_format": "compact",
+    })
+
+
+# ═══════════════════════════════════════════════════════════════
+# Load generator
+# ═══════════════════════════════════════════════════════════════
+
+class Sample:
+    __slots__ = ("size", "outcome", "latency_ms", "partial", "degraded")
+
+    def __init__(self, size: int, outcome: str, latency_ms: float, partial: bool = False, degraded: bool = False):
+        self.size = size
+        self.outcome = outcome      # "ok" | "overloaded" (worker 503) | "http_<code>" | "timeout" | "error"
+        self.latency_ms = latency_ms
+        self.partial = partial
+        self.degraded = degraded
+
+
+def run_rate(url: str, rate: float, duration: float, mix: List[Tuple[int, float]],
+             templates: Dict[int, List[str]], timeout: float, deadline_ms: Optional[int],
+             seed: int) -> Tuple[List[Sample], float]:
+    """Poisson arrivals at `rate` req/s for `duration` s; returns samples and wall time."""
+    rng = random.Random(seed)
+    sizes = [size for size, _ in mix]
+    weights = [weight for _, weight in mix]
+    local = threading.local()
+    samples: List[Sample] = []
+    lock = threading.Lock()
+    headers = {"Content-Type": "application/json"}
+    if deadline_ms:
+        headers["X-Deadline-Ms"] = str(deadline_ms)
+
+    def send(scheduled: float, size: int, body: str):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        partial = degraded = False
+        try:
+            response = session.post(url, data=body, headers=headers, timeout=timeout)
+            if response.status_code == 200:
+                outcome = "ok"
+                data = response.json()
+                partial, degraded = bool(data.get("partial")), bool(data.get("degraded"))
+            elif response.status_code == 503:
+                outcome = "overloaded"
+            else:
+                outcome = f"http_{response.status_code}"
+        except requests.Timeout:
+            outcome = "timeout"
+        except requests.RequestException:
+            outcome = "error"
+        sample = Sample(size, outcome, (time.perf_counter() - scheduled) * 1000, partial, degraded)
+        with lock:
+            samples.append(sample)
+
+    # Enough threads that a slow worker never stalls the sender
+    pool = ThreadPoolExecutor(max_workers=max(8, min(256, int(rate * timeout) + 1)))
+    started = time.perf_counter()
+    next_send = started
+    counter = 0
+    while True:
+        next_send += rng.expovariate(rate)
+        if next_send - started >= duration:
+            break
+        size = rng.choices(sizes, weights)[0]
+        counter += 1
+        body = rng.choice(templates[size]).replace(NOVEL_MARKER, f"{seed}-{counter}")
+        delay = next_send - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        pool.submit(send, next_send, size, body)
+    pool.shutdown(wait=True)
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples: List[Sample], rate: float, duration: float, wall: float) -> dict:
+    ok = [s for s in samples if s.outcome == "ok"]
+    latencies = np.array([s.latency_ms for s in ok]) if ok else np.array([np.nan])
+    outcomes: Dict[str, int] = {}
+    for s in samples:
+        outcomes[s.outcome] = outcomes.get(s.outcome, 0) + 1
+    total = len(samples) or 1
+    return {
+        "offered_rps": rate,
+        # Poisson arrivals: the rate actually sent differs a little from the offered one
+        "sent_rps": len(samples) / duration,
+        # Successes over the whole run, including draining the backlog
+        "achieved_rps": len(ok) / max(wall, duration),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "error_rate": (len(samples) - len(ok)) / total,
+        "outcomes": outcomes,
+        "partial_rate": sum(s.partial for s in ok) / (len(ok) or 1),
+        "degraded_rate": sum(s.degraded for s in ok) / (len(ok) or 1),
+        "p95_ms_by_size": {size: float(np.percentile([s.latency_ms for s in ok if s.size == size], 95))
+                           for size in sorted({s.size for s in ok})},
+    }
+
+
+def saturated(row: dict, slo_ms: float, max_error_rate: float) -> bool:
+    return (row["achieved_rps"] < 0.95 * row["sent_rps"] * (1 - row["error_rate"])
+            or not row["p99_ms"] <= slo_ms
+            or row["error_rate"] > max_error_rate)
+
+
+# ═══════════════════════════════════════════════════════════════
+# Processes
+# ═══════════════════════════════════════════════════════════════
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url: str, timeout: float = 120.0) -> None:
+    limit = time.monotonic() + timeout
+    while time.monotonic() < limit:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.05)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def start_worker(port: int, env_overrides: dict) -> subprocess.Popen:
+    env = {k: v for k, v in os.environ.items()
+           if k not in ("SHARED_STATE_DIR", "SHARD_MAP_PATH", "WARM_STATE_DIR",
+                        "HF_API_KEY", "OPENAI_API_KEY")}
+    env.update(env_overrides)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        env=env, cwd=HERE, stdout=subprocess.DEVNULL,
+    )
+
+
+def start_embed_server(port: int, args) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "embed-server", "--port", str(port),
+         "--latency-ms", str(args.embed_latency_ms), "--jitter-ms", str(args.embed_jitter_ms),
+         "--loading-seconds", str(args.embed_loading_seconds),
+         "--loading-rate", str(args.embed_loading_rate), "--error-rate", str(args.embed_error_rate)],
+        cwd=HERE,
+    )
+
+
+# ═══════════════════════════════════════════════════════════════
+# CLI
+# ═══════════════════════════════════════════════════════════════
+
+def embed_server_cli(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(prog="loadtest.py embed-server",
+                                     description="Stand-in Hugging Face feature-extraction server")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=30.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--loading-seconds", type=float, default=0.0, help="answer 503 for this long after start")
+    parser.add_argument("--loading-rate", type=float, default=0.0, help="share of calls answered 503")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered 500")
+    parser.add_argument("--dim", type=int, default=384)
+    args = parser.parse_args(argv)
+    server = EmbeddingServer(args.port, args.latency_ms, args.jitter_ms, args.loading_seconds,
+                             args.loading_rate, args.error_rate, args.dim)
+    print(f"[LoadTest] Embedding server on :{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def print_row(row: dict, embed: Optional[dict]) -> None:
+    outcomes = row["outcomes"]
+    line = (f"{row['offered_rps']:8.1f} {row['achieved_rps']:9.1f} {row['p50_ms']:8.0f} {row['p95_ms']:8.0f} "
+            f"{row['p99_ms']:8.0f} {100 * row['error_rate']:6.1f}% {outcomes.get('overloaded', 0):5d} "
+            f"{outcomes.get('timeout', 0):5d} {100 * row['partial_rate']:7.1f}% {100 * row['degraded_rate']:7.1f}%")
+    if embed is not None:
+        line += f"   embed {embed['requests']:6d} ({embed['loading']} 503, {embed['error']} 500)"
+    print(line)
+    by_size = "  ".join(f"{size}: {ms:.0f}" for size, ms in row["p95_ms_by_size"].items())
+    print(f"{'':8} p95 ms by candidates — {by_size}")
+
+
+def cli() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == "embed-server":
+        return embed_server_cli(sys.argv[2:])
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rates", default="2,5,10,20,40", help="offered request rates, req/s, ascending")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per rate")
+    parser.add_argument("--mix", action="append",
+                        help="candidate-size mix, e.g. 100:0.7,1000:0.3 (repeat to sweep several)")
+    parser.add_argument("--novel-fraction", type=float, default=0.05,
+                        help="share of candidate names unique per request (embedding cache misses)")
+    parser.add_argument("--no-warmup", action="store_true",
+                        help="measure from a cold embedding cache (default: one unmeasured pass first)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="client timeout per request, s")
+    parser.add_argument("--deadline-ms", type=int, help="X-Deadline-Ms sent with every request")
+    parser.add_argument("--slo-ms", type=float, default=1000.0, help="p99 latency objective")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--stop-after-saturation", type=int, default=1,
+                        help="rates to run past the first saturated one")
+    parser.add_argument("--worker-url", help="load an already running worker instead of starting one")
+    parser.add_argument("--worker-env", action="append", default=[], help="KEY=VALUE for the started worker")
+    parser.add_argument("--fuzzy-only", action="store_true", help="no embedding provider")
+    parser.add_argument("--embed-latency-ms", type=float, default=30.0)
+    parser.add_argument("--embed-jitter-ms", type=float, default=10.0)
+    parser.add_argument("--embed-loading-seconds", type=float, default=0.0)
+    parser.add_argument("--embed-loading-rate", type=float, default=0.0)
+    parser.add_argument("--embed-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    rates = [float(rate) for rate in args.rates.split(",")]
+    mixes = args.mix or ["100:0.7,1000:0.25,5000:0.05"]
+    processes = []
+    embed_url = None
+    try:
+        if args.worker_url:
+            base_url = args.worker_url.rstrip("/")
+        else:
+            env = dict(pair.split("=", 1) for pair in args.worker_env)
+            if not args.fuzzy_only:
+                embed_port = free_port()
+                processes.append(start_embed_server(embed_port, args))
+                embed_url = f"http://127.0.0.1:{embed_port}"
+                wait_until_up(f"{embed_url}/stats")
+                env.update(HF_API_KEY="loadtest", HF_INFERENCE_URL=f"{embed_url}/pipeline/feature-extraction")
+            port = free_port()
+            processes.append(start_worker(port, env))
+            base_url = f"http://127.0.0.1:{port}"
+        wait_until_up(f"{base_url}/ready")
+        url = f"{base_url}/match/demand-to-supplies"
+
+        report = []
+        for mix_text in mixes:
+            mix = parse_mix(mix_text)
+            templates = {size: [payload_template(size, args.novel_fraction, args.seed * 100 + i) for i in range(4)]
+                         for size, _ in mix}
+            if not args.no_warmup:
+                # One sequential pass fills the embedding cache with the shared texts
+                for body in (body for bodies in templates.values() for body in bodies):
+                    requests.post(url, data=body.replace(NOVEL_MARKER, "warmup"),
+                                  headers={"Content-Type": "application/json"}, timeout=300)
+            print(f"\n=== Load test — mix {mix_text}, {args.duration:.0f} s per rate, "
+                  f"{'fuzzy only' if args.fuzzy_only else f'embeddings {args.embed_latency_ms:.0f} ms'} ===")
+            print(f"{'offered':>8} {'achieved':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} "
+                  f"{'503s':>5} {'t/o':>5} {'partial':>8} {'degraded':>8}")
+            rows = []
+            saturation = None
+            for i, rate in enumerate(rates):
+                before = requests.get(f"{embed_url}/stats").json() if embed_url else None
+                samples, wall = run_rate(url, rate, args.duration, mix, templates, args.timeout,
+                                         args.deadline_ms, args.seed + i)
+                row = summarize(samples, rate, args.duration, wall)
+                embed = None
+                if embed_url:
+                    after = requests.get(f"{embed_url}/stats").json()
+                    embed = row["embedding_server"] = {k: after[k] - before[k] for k in after}
+                rows.append(row)
+                print_row(row, embed)
+                if saturation is None and saturated(row, args.slo_ms, args.max_error_rate):
+                    saturation = rate
+                if saturation is not None and rates.index(saturation) + args.stop_after_saturation <= i:
+                    break
+            sustained = [row["offered_rps"] for row in rows if row["offered_rps"] < (saturation or float("inf"))]
+            if saturation is None:
+                print(f"Not saturated up to {rates[-1]:g} req/s (p99 ≤ {args.slo_ms:g} ms, "
+                      f"errors ≤ {100 * args.max_error_rate:g}%)")
+            elif sustained:
+                print(f"Saturation point: {saturation:g} req/s (last sustained: {max(sustained):g} req/s)")
+            else:
+                print(f"Saturation point: {saturation:g} req/s (already at the lowest rate)")
+            report.append({"mix": mix_text, "saturation_rps": saturation, "rates": rows})
+
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    cli()
@@ -17,21 +17,55 @@ Architecture:
                                                Store in Cache
 """
 
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, Header, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse, Response
 from datetime import datetime
-from typing import List, Optional, Dict, Any
-from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any, Literal, Tuple
+from pydantic import BaseModel, Field, field_validator, model_validator
+from pydantic_core import to_json
 
 from utils import (
     calculate_distance,
     calculate_hybrid_similarity,
-    calculate_match_score_detailed,
+    calculate_hybrid_similarity_batch,
+    combine_match_score,
+    distance_score,
+    match_score_detail,
+    max_achievable_score,
+    score_components,
     tokenize,
     calculate_token_overlap,
+    build_rich_text,
+    normalize_quantity,
+    are_units_comparable,
 )
+from metrics import metrics
+from token_index import entry_fingerprint, get_token_index
+from semantic_search import get_semantic_matcher
+from shared_state import get_shared_state
+from admission import Deadline, Overloaded, get_admission_controller
+from precompute import ChangeEvent, FileChangeQueue, MaterializedView, MemoryChangeQueue
+from scheduler import get_scheduler
+from sharding import ShardMap, get_shard_router
+from warm_state import get_warm_state
+from allocation import RegionGrid, allocate, fulfilled_fraction, objective
+from profiling import ProfilingMiddleware, attach_thread, get_profiler
+from pagination import CursorError, cursor_for, get_ranked_lists, request_fingerprint
+from percolator import Percolator
+from memory_accounting import MemoryBudgetMiddleware, get_memory_accountant, mark_stage, memory_bounded
+from embedding_migration import get_embedding_migration, start_embedding_migration
+from collections import Counter
+import heapq
+import hmac
+import threading
+import time
 import os
+import random
 
+import numpy as np
 
 from config import get_settings
 
@@ -54,6 +88,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.GZIP_MIN_BYTES > 0:
+    # Negotiated: only applied when the request sends Accept-Encoding: gzip
+    app.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MIN_BYTES)
+
+# Estimates every request body before it is read: 413 over the limit,
+# sliced scoring over the budget (the parse itself is not bounded)
+app.add_middleware(MemoryBudgetMiddleware, accountant=get_memory_accountant())
+
+if get_profiler() is not None:
+    # Outermost, so pydantic (de)serialization and compression are sampled too
+    app.add_middleware(ProfilingMiddleware, profiler=get_profiler())
+
 
 # ═══════════════════════════════════════════════════════════════
 # Request/Response schemas
@@ -99,7 +145,65 @@ class DemandData(BaseModel):
     quantity_unit: Optional[str] = None
 
 
-class MatchSupplyRequest(BaseModel):
+class ResponseShape(BaseModel):
+    """
+    Optional response shaping for the match endpoints:
+      - fields: only these MatchResult fields per result
+      - response_format "compact": ids and scores only (unless fields given)
+      - response_format "org_dict": org details once per org in `orgs`
+        (keyed by org_id) instead of once per result; a result is
+        reconstructed as {**orgs[str(org_id)], **result}
+    """
+    fields: Optional[List[str]] = None
+    response_format: Literal["full", "compact", "org_dict"] = "full"
+
+    @field_validator("fields")
+    @classmethod
+    def known_fields(cls, fields):
+        if fields is not None:
+            unknown = sorted(set(fields) - set(MatchResult.model_fields))
+            if unknown:
+                raise ValueError(f"Unknown result fields: {', '.join(unknown)}")
+        return fields
+
+
+class Pagination(BaseModel):
+    """
+    Optional paging for the match endpoints:
+      - page_size: results per response (default MAX_RESULTS)
+      - paginate: rank up to PAGINATION_MAX_DEPTH candidates and return a
+        `next_cursor` for the following pages
+      - cursor: continue a ranking; send the same query and candidates
+        (409 if they changed, 410 once the ranking has expired)
+    """
+    page_size: Optional[int] = Field(None, ge=1, le=settings.PAGINATION_MAX_DEPTH)
+    paginate: bool = False
+    cursor: Optional[str] = None
+
+
+class RadiusSweep(BaseModel):
+    """
+    Optional radius sweep for the match endpoints: `search_radii` ranks
+    the candidates for each listed radius in one scoring pass and returns
+    them in `by_radius`; `results` stays the ranking for `search_radius`.
+    """
+    search_radii: Optional[List[float]] = Field(None, min_length=1, max_length=settings.MAX_SEARCH_RADII)
+
+    @field_validator("search_radii")
+    @classmethod
+    def positive_radii(cls, radii):
+        if radii is not None and any(radius <= 0 for radius in radii):
+            raise ValueError("search_radii must be positive")
+        return radii
+
+    def sweep_radii(self) -> Optional[List[float]]:
+        """Every radius to rank for (search_radius included), or None without a sweep."""
+        if not self.search_radii:
+            return None
+        return sorted(set(self.search_radii) | {self.search_radius})
+
+
+class MatchSupplyRequest(ResponseShape, Pagination, RadiusSweep):
     class Candidate(BaseModel):
         demand: DemandData
         org: OrgData
@@ -110,7 +214,7 @@ class MatchSupplyRequest(BaseModel):
     candidates: List[Candidate]
 
 
-class MatchDemandRequest(BaseModel):
+class MatchDemandRequest(ResponseShape, Pagination, RadiusSweep):
     class Candidate(BaseModel):
         supply: SupplyData
         org: OrgData
@@ -163,11 +267,85 @@ class MatchResult(BaseModel):
     org_longitude: float
 
 
+class RadiusMatches(BaseModel):
+    """The ranking for one radius of a sweep"""
+    search_radius: float
+    total_results: int
+    results: List[MatchResult]
+
+
 class MatchResponse(BaseModel):
     """Worker response with scored + ranked results"""
     total_results: int
     results: List[MatchResult]
     computed_at: str
+    # Set when the request ran out of time: scoring stopped early and/or
+    # semantic scoring was skipped ("fuzzy_only")
+    partial: bool = False
+    degraded: Optional[str] = None
+    # Precomputed answers only: a recompute for this item is pending
+    stale: bool = False
+    # Paginated requests only: continues the ranking (None on the last page)
+    next_cursor: Optional[str] = None
+    # Radius sweeps only: one ranking per requested radius, in request order
+    by_radius: Optional[List[RadiusMatches]] = None
+
+
+# Result fields that describe the org, moved to `orgs` by "org_dict"
+ORG_RESULT_FIELDS = ("org_name", "org_email", "org_phone", "org_address", "org_latitude", "org_longitude")
+COMPACT_RESULT_FIELDS = ("id", "org_id", "match_score")
+
+
+def render_response(response: MatchResponse, shape: ResponseShape):
+    """
+    Apply the request's field projection / compact / org_dict format.
+    The full format is returned as the model itself; shaped responses are
+    serialized directly (they are not valid MatchResponse documents).
+    """
+    if shape.response_format == "full" and shape.fields is None:
+        return response
+    if shape.fields is not None:
+        include = set(shape.fields)
+    elif shape.response_format == "compact":
+        include = set(COMPACT_RESULT_FIELDS)
+    else:
+        include = set(MatchResult.model_fields)
+
+    org_dict = shape.response_format == "org_dict"
+    if org_dict:
+        include.add("org_id")
+    body = response.model_dump(include={
+        **{name: True for name in MatchResponse.model_fields if name != "results"},
+        "results": {"__all__": include},
+        "by_radius": {"__all__": {"search_radius": True, "total_results": True,
+                                  "results": {"__all__": include}}} if response.by_radius else True,
+    })
+
+    if org_dict:
+        org_fields = include.intersection(ORG_RESULT_FIELDS)
+        orgs: Dict[str, dict] = {}
+        rows = body["results"] + [row for entry in body["by_radius"] or [] for row in entry["results"]]
+        for row in rows:
+            details = {f: row.pop(f) for f in org_fields}
+            shared = orgs.setdefault(str(row["org_id"]), details)
+            if shared is not details:
+                # Same org_id with different details: keep the differences inline
+                row.update({f: v for f, v in details.items() if shared[f] != v})
+        body["orgs"] = orgs
+    return Response(content=to_json(body), media_type="application/json")
+
+
+class ChangeEventIn(BaseModel):
+    """One item change for the precompute queue"""
+    op: Literal["upsert", "delete"]
+    kind: Literal["supply", "demand"]
+    item_id: int
+    item: Optional[Dict[str, Any]] = None
+    org: Optional[OrgData] = None
+
+
+class ChangeEventBatch(BaseModel):
+    events: List[ChangeEventIn]
 
 
 # ═══════════════════════════════════════════════════════════════
@@ -209,24 +387,737 @@ def check_category_match(
     return False
 
 
-def build_rich_text(item_name: str, item_description: str = None, item_category: str = None) -> str:
-    """Build rich comparison text from item fields."""
-    parts = [item_name or ""]
-    if item_description:
-        parts.append(item_description)
-    if item_category:
-        parts.append(item_category)
-    return " ".join(parts).strip()
-
-
 # Minimum score to include in results (lower = more results)
 MIN_MATCH_SCORE = 0.25
 
+# Rows per batched-similarity chunk; deadlines are checked between chunks,
+# and in adaptive radius mode each chunk is one distance ring
+SCORING_CHUNK_SIZE = 256
+
+
+def item_kind(item) -> str:
+    return "supply" if isinstance(item, SupplyData) else "demand"
+
+
+def item_id(item) -> int:
+    return item.supply_id if isinstance(item, SupplyData) else item.demand_id
+
+
+def item_price(item) -> Optional[float]:
+    return item.price_per_unit if isinstance(item, SupplyData) else item.max_price_per_unit
+
+
+def candidate_components(query, item, name_similarity: float) -> Optional[tuple]:
+    """
+    The radius-independent part of scoring one candidate against the
+    query item: (category matched, effective similarity, score
+    components), or None if the candidate does not qualify.
+    Works in both directions: whichever side is the SupplyData provides
+    the offered price/quantity, the DemandData side the budget/need.
+    """
+    # Category match (consistent logic)
+    cat_match = check_category_match(
+        query.category_id, item.category_id,
+        query.item_category, item.item_category
+    )
+
+    # Skip only if NEITHER category nor name matches
+    if not cat_match and name_similarity < settings.SIMILARITY_THRESHOLD:
+        return None
+
+    # Category boost: moderate, not overwhelming
+    if cat_match:
+        effective_sim = max(name_similarity, 0.65)
+        # Additional boost proportional to name similarity
+        effective_sim = min(1.0, effective_sim + 0.15)
+    else:
+        effective_sim = name_similarity
+
+    return cat_match, effective_sim, similarity_components(query, item, effective_sim)
+
+
+def similarity_components(query, item, effective_sim: float) -> dict:
+    """Score components of a candidate whose effective similarity is known."""
+    supply, demand = (query, item) if isinstance(query, SupplyData) else (item, query)
+    return score_components(
+        similarity_score=effective_sim,
+        supply_price=supply.price_per_unit,
+        demand_max_price=demand.max_price_per_unit,
+        supply_qty=supply.quantity,
+        supply_unit=supply.quantity_unit,
+        demand_qty=demand.quantity,
+        demand_unit=demand.quantity_unit,
+        price_tolerance=settings.PRICE_TOLERANCE_PERCENT
+    )
+
+
+def build_result(item, org: OrgData, distance_km: float, cat_match: bool,
+                 effective_sim: float, score_detail: dict) -> MatchResult:
+    return MatchResult(
+        id=item_id(item),
+        org_id=org.org_id,
+        org_name=org.org_name,
+        item_name=item.item_name,
+        item_category=item.item_category,
+        item_description=item.item_description,
+        price=item_price(item),
+        currency=item.currency,
+        quantity=item.quantity,
+        quantity_unit=item.quantity_unit,
+        distance_km=round(distance_km, 2),
+        name_similarity=round(effective_sim, 3),
+        match_score=round(score_detail["match_score"], 3),
+        score_breakdown=ScoreBreakdown(**score_detail["breakdown"]),
+        match_labels=MatchLabels(**score_detail["labels"]),
+        category_matched=cat_match,
+        org_email=org.email,
+        org_phone=org.phone_number,
+        org_address=org.address,
+        org_latitude=org.latitude,
+        org_longitude=org.longitude,
+    )
+
+
+def score_candidate(query, item, org: OrgData, distance_km: float,
+                    name_similarity: float, search_radius: float) -> Optional[MatchResult]:
+    """
+    Score one in-radius candidate against the query item, given its
+    precomputed hybrid name similarity.
+    Returns None if the candidate does not qualify.
+    """
+    parts = candidate_components(query, item, name_similarity)
+    if parts is None:
+        return None
+    cat_match, effective_sim, components = parts
+
+    # Detailed match score with breakdown
+    score_detail = match_score_detail(components, distance_score(distance_km, search_radius))
+    if score_detail["match_score"] < MIN_MATCH_SCORE:
+        return None
+
+    return build_result(item, org, distance_km, cat_match, effective_sim, score_detail)
+
+
+def use_semantic(deadline: Optional[Deadline]) -> bool:
+    """Semantic scoring unless the request has been degraded to fuzzy-only."""
+    return settings.USE_SEMANTIC_SEARCH and not (deadline and deadline.degraded == "fuzzy_only")
+
+
+def score_chunk(query, query_text: str, chunk: list, search_radius: float,
+                deadline: Optional[Deadline] = None,
+                similarity_cache: Optional[Dict[str, float]] = None) -> List[Optional[MatchResult]]:
+    """
+    Score one chunk of rows; returns a result (or None) per row.
+    Similarity is computed once per unique item text; `similarity_cache`
+    carries those values across the chunks of one request.
+    """
+    similarities = chunk_similarities(query_text, chunk, deadline, similarity_cache)
+
+    results = []
+    for (item, org, distance_km, _), name_similarity in zip(chunk, similarities):
+        try:
+            results.append(score_candidate(query, item, org, distance_km, name_similarity, search_radius))
+        except Exception as item_err:
+            print(f"[Worker] Skipping candidate due to error: {item_err}")
+            results.append(None)
+    return results
+
+
+def chunk_similarities(query_text: str, chunk: list, deadline: Optional[Deadline] = None,
+                       similarity_cache: Optional[Dict[str, float]] = None) -> List[float]:
+    """Hybrid name similarity of each row's item text to the query text."""
+    if similarity_cache is None:
+        similarity_cache = {}
+    # Hybrid similarity for the chunk's new texts in one batched call.
+    # Similarities below SIMILARITY_THRESHOLD only matter for category
+    # matches, which are floored at 0.65 anyway, so it is a safe cutoff.
+    missing = list(dict.fromkeys(row[3] for row in chunk if row[3] not in similarity_cache))
+    if missing:
+        try:
+            computed = calculate_hybrid_similarity_batch(
+                query_text,
+                missing,
+                use_semantic=use_semantic(deadline),
+                semantic_weight=settings.SEMANTIC_WEIGHT,
+                fuzzy_weight=settings.FUZZY_WEIGHT,
+                min_score=settings.SIMILARITY_THRESHOLD,
+            )
+            similarity_cache.update(zip(missing, computed))
+        except Exception as e:
+            print(f"[Worker] Similarity calc failed: {e}")
+    metrics.inc("dedup.similarity_rows", len(chunk))
+    metrics.inc("dedup.similarity_computed", len(missing))
+    return [similarity_cache.get(row[3], 0.0) for row in chunk]
+
+
+def score_rows(query, query_text: str, rows: list, search_radius: float,
+               deadline: Optional[Deadline] = None, adaptive: bool = False,
+               limit: Optional[int] = None) -> List[MatchResult]:
+    """
+    Score (item, org, distance_km, item_text) rows and return the ranked
+    top `limit` results (default MAX_RESULTS).
+    Rows are scored in chunks; once the deadline passes, the remaining
+    chunks are abandoned and the request is flagged partial. Chunk
+    boundaries are also where bulk jobs yield to interactive requests.
+
+    With `adaptive`, rows are scored nearest-first, one chunk (ring) at a
+    time, and scoring stops once the current K-th best score beats the
+    best score achievable at the next ring's distance. The result is the
+    same as scoring every row: ties keep the rows' original order.
+    """
+    order = list(range(len(rows)))
+    if adaptive:
+        order.sort(key=lambda i: rows[i][2])
+
+    k = limit or settings.MAX_RESULTS
+    similarity_cache: Dict[str, float] = {}
+    scored = []       # (row position, result)
+    top_k = []        # min-heap of the K best scores so far
+    scheduler = get_scheduler()
+    for start in range(0, len(order), SCORING_CHUNK_SIZE):
+        if start:
+            scheduler.checkpoint()
+            if adaptive and len(top_k) >= k:
+                next_distance = rows[order[start]][2]
+                if top_k[0] > max_achievable_score(next_distance, search_radius):
+                    metrics.inc("adaptive_radius.rows_skipped", len(order) - start)
+                    metrics.observe("adaptive_radius.stop_km", next_distance)
+                    break
+        # The first chunk always runs so a late request still returns something
+        if start and deadline is not None and deadline.expired():
+            deadline.partial = True
+            metrics.inc("admission.partial_results")
+            break
+
+        positions = order[start:start + SCORING_CHUNK_SIZE]
+        chunk = [rows[i] for i in positions]
+        chunk_results = score_chunk(query, query_text, chunk, search_radius, deadline, similarity_cache)
+        for position, result in zip(positions, chunk_results):
+            if result is None:
+                continue
+            scored.append((position, result))
+            if adaptive:
+                if len(top_k) < k:
+                    heapq.heappush(top_k, result.match_score)
+                elif result.match_score > top_k[0]:
+                    heapq.heapreplace(top_k, result.match_score)
+
+    scored.sort(key=lambda pr: (-pr[1].match_score, pr[0]))
+    return [result for _, result in scored[:k]]
+
+
+def score_rows_by_radius(query, query_text: str, rows: list, radii: List[float],
+                         deadline: Optional[Deadline] = None, adaptive: bool = False,
+                         limit: Optional[int] = None) -> Dict[float, List[MatchResult]]:
+    """
+    Radius sweep: rank the rows (within the largest of `radii`) for every
+    radius in one pass. Similarity, category, price and quantity are
+    computed once per row; only the distance component and the radius
+    cutoff are evaluated per radius, and full results are built only for
+    each radius's top `limit`. Each ranking is the one score_rows returns
+    for the rows within that radius.
+
+    With `adaptive`, scoring stops once every radius is settled: the next
+    ring lies outside it, or its K-th best score beats the best score
+    achievable there.
+    """
+    order = list(range(len(rows)))
+    if adaptive:
+        order.sort(key=lambda i: rows[i][2])
+
+    k = limit or settings.MAX_RESULTS
+    similarity_cache: Dict[str, float] = {}
+    parts: Dict[int, tuple] = {}                              # row position -> candidate_components
+    scored: Dict[float, list] = {radius: [] for radius in radii}  # (score, row position)
+    top_k: Dict[float, list] = {radius: [] for radius in radii}
+    scheduler = get_scheduler()
+    for start in range(0, len(order), SCORING_CHUNK_SIZE):
+        if start:
+            scheduler.checkpoint()
+            if adaptive:
+                next_distance = rows[order[start]][2]
+                if all(next_distance > radius or (len(top_k[radius]) >= k and
+                                                  top_k[radius][0] > max_achievable_score(next_distance, radius))
+                       for radius in radii):
+                    metrics.inc("adaptive_radius.rows_skipped", len(order) - start)
+                    metrics.observe("adaptive_radius.stop_km", next_distance)
+                    break
+        if start and deadline is not None and deadline.expired():
+            deadline.partial = True
+            metrics.inc("admission.partial_results")
+            break
+
+        positions = order[start:start + SCORING_CHUNK_SIZE]
+        chunk = [rows[i] for i in positions]
+        similarities = chunk_similarities(query_text, chunk, deadline, similarity_cache)
+        for position, (item, _, distance_km, _), name_similarity in zip(positions, chunk, similarities):
+            try:
+                part = candidate_components(query, item, name_similarity)
+            except Exception as item_err:
+                print(f"[Worker] Skipping candidate due to error: {item_err}")
+                continue
+            if part is None:
+                continue
+            parts[position] = part
+            for radius in radii:
+                if distance_km > radius:
+                    continue
+                score = round(combine_match_score(part[2], distance_score(distance_km, radius)), 3)
+                if score < MIN_MATCH_SCORE:
+                    continue
+                scored[radius].append((score, position))
+                if adaptive:
+                    if len(top_k[radius]) < k:
+                        heapq.heappush(top_k[radius], score)
+                    elif score > top_k[radius][0]:
+                        heapq.heapreplace(top_k[radius], score)
+
+    metrics.observe("radius_sweep.radii", len(radii))
+    ranked = {}
+    for radius in radii:
+        results = []
+        for _, position in sorted(scored[radius], key=lambda sp: (-sp[0], sp[1]))[:k]:
+            item, org, distance_km, _ = rows[position]
+            cat_match, effective_sim, components = parts[position]
+            detail = match_score_detail(components, distance_score(distance_km, radius))
+            results.append(build_result(item, org, distance_km, cat_match, effective_sim, detail))
+        ranked[radius] = results
+    return ranked
+
+
+def semantic_top_m(query_text: str, rows: list) -> set:
+    """
+    Semantic candidate generation: the IDs of the ANN_TOP_M rows whose
+    embeddings are nearest to the query's, by exact cosine over this
+    request's rows (each distinct text embedded once, from the embedding
+    store cache). Rows without an embedding are never candidates. A
+    catalog-wide index would save no embedding calls here, and its top-M
+    would fill up with items from other regions.
+    """
+    matcher = get_semantic_matcher()
+    query_vector = matcher.get_embedding(query_text)
+    if not np.any(query_vector):
+        return set()
+    texts = list(dict.fromkeys(row[3] for row in rows))
+    vectors = np.stack([matcher.get_embedding(text) for text in texts])
+    text_scores = np.where(np.any(vectors, axis=1), vectors @ query_vector, -np.inf)
+    position = {text: i for i, text in enumerate(texts)}
+    scores = text_scores[[position[row[3]] for row in rows]]
+
+    top_m = min(settings.ANN_TOP_M, int(np.isfinite(scores).sum()))
+    metrics.observe("ann.candidates", top_m)
+    if top_m == 0:
+        return set()
+    nearest = np.argpartition(-scores, top_m - 1)[:top_m]
+    return {item_id(rows[i][0]) for i in nearest.tolist()}
+
+
+def select_rows(query, query_org: OrgData, candidates: list, search_radius: float,
+                deadline: Optional[Deadline] = None) -> Tuple[str, list, list]:
+    """
+    Steps 1 and 2 of match_candidates: the query text, the in-radius
+    (item, org, distance_km, item_text) rows, and the rows the token index
+    (and semantic top-M) prefilter selects for scoring (all of them without it).
+    """
+    query_text = build_rich_text(query.item_name, query.item_description, query.item_category)
+
+    # Candidates of the same org share coordinates and many share item
+    # texts: compute distance and rich text once per unique key
+    distances: Dict[tuple, float] = {}
+    texts: Dict[tuple, str] = {}
+    in_radius = []
+    for item, org in candidates:
+        location = (org.latitude, org.longitude)
+        distance_km = distances.get(location)
+        if distance_km is None:
+            try:
+                distance_km = calculate_distance(
+                    query_org.latitude, query_org.longitude,
+                    org.latitude, org.longitude
+                )
+            except Exception as item_err:
+                print(f"[Worker] Skipping candidate due to error: {item_err}")
+                continue
+            distances[location] = distance_km
+        if distance_km > search_radius:
+            continue
+        # Build rich text for similarity
+        text_key = (item.item_name, item.item_description, item.item_category)
+        item_text = texts.get(text_key)
+        if item_text is None:
+            item_text = texts[text_key] = build_rich_text(*text_key)
+        in_radius.append((item, org, distance_km, item_text))
+
+    if candidates:
+        metrics.observe("dedup.location_ratio", len(distances) / len(candidates))
+    if in_radius:
+        metrics.observe("dedup.text_ratio", len(set(row[3] for row in in_radius)) / len(in_radius))
+
+    # Not enough time left for embedding lookups: fall back to fuzzy-only
+    if (settings.USE_SEMANTIC_SEARCH and deadline is not None
+            and deadline.remaining() < 2 * get_admission_controller().estimate(len(in_radius))):
+        deadline.degraded = "fuzzy_only"
+        metrics.inc("admission.degraded_fuzzy_only")
+
+    if not settings.USE_TOKEN_INDEX or not in_radius:
+        return query_text, in_radius, in_radius
+
+    kind = item_kind(in_radius[0][0])
+    index = get_token_index(kind)
+    if len(in_radius) > index.max_items:
+        # The bounded index would evict this request's own candidates
+        metrics.inc("token_index.oversized_requests")
+        return query_text, in_radius, in_radius
+    shared = get_shared_state()
+    frozen = shared.token_index(kind) if shared is not None else None
+    for item, _, _, item_text in in_radius:
+        # Items already in the shared segment with the same text and category need no private copy
+        if (frozen is not None and frozen.fingerprint(item_id(item))
+                == entry_fingerprint(item_text, item.category_id, item.item_category)):
+            continue
+        index.upsert(item_id(item), item_text, item.category_id, item.item_category)
+    hits = index.lookup(query_text, query.category_id, query.item_category)
+    if frozen is not None:
+        hits |= frozen.lookup(query_text, query.category_id, query.item_category)
+
+    if use_semantic(deadline):
+        try:
+            hits |= semantic_top_m(query_text, in_radius)
+        except Exception as e:
+            print(f"[Worker] Semantic candidate generation failed: {e}")
+    selected = [row for row in in_radius if item_id(row[0]) in hits]
+
+    metrics.inc("token_index.candidates_in_radius", len(in_radius))
+    metrics.inc("token_index.candidates_scored", len(selected))
+    metrics.observe("token_index.selectivity", len(selected) / len(in_radius))
+    return query_text, in_radius, selected
+
+
+def match_candidates(query, query_org: OrgData, candidates: list, search_radius: float,
+                     deadline: Optional[Deadline] = None, limit: Optional[int] = None) -> List[MatchResult]:
+    """
+    Shared pipeline for both match directions.
+
+    1. Radius filter (cheap haversine)
+    2. Token index prefilter: keep only candidates sharing a canonical
+       token, a trigram neighbourhood or a category with the query
+       (merged with the semantic top-M of the in-radius rows when
+       semantic search is enabled)
+    3. Full hybrid scoring of the survivors
+    """
+    query_text, in_radius, selected = select_rows(query, query_org, candidates, search_radius, deadline)
+    mark_stage("prefilter")
+    results = score_rows(query, query_text, selected, search_radius, deadline,
+                         adaptive=settings.ADAPTIVE_RADIUS_SEARCH, limit=limit)
+    mark_stage("score")
+
+    # Sampled recall check against the brute-force path (never on a tight budget)
+    if (selected is not in_radius and random.random() < settings.TOKEN_INDEX_RECALL_SAMPLE_RATE
+            and not (deadline and (deadline.partial or deadline.degraded))):
+        if _recall_checks.acquire(blocking=False):
+            threading.Thread(
+                target=check_recall, args=(query, query_text, in_radius, search_radius, results, limit),
+                name="recall-check", daemon=True,
+            ).start()
+        else:
+            metrics.inc("token_index.recall_skipped")
+
+    return results
+
+
+# Sampled recall checks queued or running at once; further samples are skipped
+_recall_checks = threading.BoundedSemaphore(2)
+
+
+def check_recall(query, query_text: str, in_radius: list, search_radius: float,
+                 results: List[MatchResult], limit: Optional[int]) -> None:
+    """
+    Recall of the token index prefilter on one sampled request: every
+    in-radius row is scored brute-force as a bulk job, off the request
+    thread, and the top-K overlap goes to `token_index.recall`.
+    """
+    try:
+        exact = get_scheduler().run("bulk", score_rows, query, query_text, in_radius, search_radius, limit=limit)
+        if exact:
+            found = {r.id for r in results}
+            metrics.observe("token_index.recall", sum(1 for r in exact if r.id in found) / len(exact))
+    except Exception as e:
+        print(f"[Worker] Recall check failed: {e}")
+    finally:
+        _recall_checks.release()
+
+
+def match_candidates_by_radius(query, query_org: OrgData, candidates: list, radii: List[float],
+                               deadline: Optional[Deadline] = None,
+                               limit: Optional[int] = None) -> Dict[float, List[MatchResult]]:
+    """
+    match_candidates for several radii at once: the radius filter and the
+    prefilter run once for the largest radius, then score_rows_by_radius
+    ranks the survivors for each radius.
+    """
+    query_text, _, selected = select_rows(query, query_org, candidates, max(radii), deadline)
+    mark_stage("prefilter")
+    ranked = score_rows_by_radius(query, query_text, selected, radii, deadline,
+                                  adaptive=settings.ADAPTIVE_RADIUS_SEARCH, limit=limit)
+    mark_stage("score")
+    return ranked
+
 
 # ═══════════════════════════════════════════════════════════════
 # Endpoints
 # ═══════════════════════════════════════════════════════════════
 
+def overloaded_response(e: Overloaded) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=f"Matching worker overloaded ({e.reason})",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def match_streamed(score, candidates: list, deadline: Optional[Deadline],
+                   limit: Optional[int] = None) -> Dict[float, List[MatchResult]]:
+    """
+    Sliced scoring for requests over REQUEST_MEMORY_BUDGET_BYTES: run
+    `score(subset) -> {radius: results}` on MEMORY_STREAM_CHUNK candidates
+    at a time and keep only the top `limit` per radius, so the rows, texts
+    and results of one slice are alive at a time. The parsed request is
+    already in memory; only REQUEST_MEMORY_LIMIT_BYTES bounds that. Ties
+    keep candidate order, so the ranking is the one of a single pass.
+    """
+    metrics.inc("memory.streamed_requests")
+    if len(candidates) <= settings.MEMORY_STREAM_CHUNK:
+        return score(candidates)
+    k = limit or settings.MAX_RESULTS
+    # (-score, slice start, rank in slice): every row of a slice comes after
+    # the previous slice's, so this is the single pass's (score, row) order
+    merged: Dict[float, list] = {}
+    for start in range(0, len(candidates), settings.MEMORY_STREAM_CHUNK):
+        if start and deadline is not None and deadline.expired():
+            deadline.partial = True
+            metrics.inc("admission.partial_results")
+            break
+        for radius, results in score(candidates[start:start + settings.MEMORY_STREAM_CHUNK]).items():
+            ranked = merged.setdefault(radius, [])
+            ranked.extend((-r.match_score, start, rank, r) for rank, r in enumerate(results))
+            ranked.sort(key=lambda entry: entry[:3])
+            del ranked[k:]
+    return {radius: [entry[3] for entry in ranked] for radius, ranked in merged.items()}
+
+
+def match_request(path: str, request, query, query_org: OrgData, deadline: Deadline,
+                  limit: Optional[int] = None) -> Dict[float, List[MatchResult]]:
+    """
+    Run one match request as an interactive job: locally, or in
+    coordinator mode (SHARD_MAP_PATH) scattered across region shards.
+    Returns the top `limit` results (default MAX_RESULTS) by radius:
+    search_radius, plus every radius of a sweep.
+    """
+    attach_thread()
+    item_field = "demand" if isinstance(query, SupplyData) else "supply"
+    candidates = [(getattr(c, item_field), c.org) for c in request.candidates]
+    radii = request.sweep_radii()
+
+    def score(subset):
+        if radii is not None:
+            return match_candidates_by_radius(query, query_org, subset, radii, deadline, limit)
+        return {request.search_radius: match_candidates(query, query_org, subset, request.search_radius, deadline, limit)}
+
+    def local(indices=None):
+        subset = candidates if indices is None else [candidates[i] for i in indices]
+        if memory_bounded():
+            return get_scheduler().run("interactive", match_streamed, score, subset, deadline, limit)
+        return get_scheduler().run("interactive", score, subset)
+
+    router = get_shard_router()
+    if router is None:
+        return local()
+    return router.scatter(path, request, query_org, deadline, local, MatchResult, limit)
+
+
+# ═══════════════════════════════════════════════════════════════
+# Cursor pagination
+# ═══════════════════════════════════════════════════════════════
+
+def ranking_fingerprint(request) -> str:
+    """Fingerprint of everything a request's ranking depends on."""
+    query_field, org_field = (("supply", "supply_org") if isinstance(request, MatchSupplyRequest)
+                              else ("demand", "demand_org"))
+    return request_fingerprint(request, {query_field, org_field, "search_radius", "candidates"})
+
+
+def next_page(request, query, query_org: OrgData, page_size: int) -> MatchResponse:
+    """
+    Cut the page a cursor points at from its stored ranking. Rows keep
+    the stored order and match scores; their breakdowns are rebuilt from
+    the stored name similarity, so no similarity is computed again and
+    no row can drop out or move.
+    """
+    attach_thread()
+    ranked, rows, next_cursor = get_ranked_lists().page(request.cursor, ranking_fingerprint(request), page_size)
+    item_field = "demand" if isinstance(query, SupplyData) else "supply"
+    by_id: Dict[int, tuple] = {}
+    for candidate in request.candidates:
+        item = getattr(candidate, item_field)
+        by_id.setdefault(item_id(item), (item, candidate.org))
+
+    results = []
+    for id_, score, similarity in zip(ranked.ids[rows].tolist(), ranked.scores[rows].tolist(),
+                                      ranked.similarities[rows].tolist()):
+        item, org = by_id[id_]
+        distance_km = calculate_distance(query_org.latitude, query_org.longitude, org.latitude, org.longitude)
+        cat_match = check_category_match(query.category_id, item.category_id, query.item_category, item.item_category)
+        components = similarity_components(query, item, similarity)
+        score_detail = match_score_detail(components, distance_score(distance_km, request.search_radius))
+        score_detail["match_score"] = score
+        results.append(build_result(item, org, distance_km, cat_match, similarity, score_detail))
+    return MatchResponse(
+        total_results=len(results),
+        results=results,
+        computed_at=datetime.utcnow().isoformat(),
+        partial=ranked.partial,
+        degraded=ranked.degraded,
+        next_cursor=next_cursor,
+    )
+
+
+async def run_match(path: str, request, query, query_org: OrgData, x_deadline_ms: Optional[int]) -> MatchResponse:
+    """
+    One match request: the next page of a cursor, or a fresh ranking.
+    With `paginate`, up to PAGINATION_MAX_DEPTH results are ranked and
+    kept server-side, and the first page comes back with a cursor.
+    With `search_radii`, every radius's first page comes back in
+    `by_radius`; cursors continue the `search_radius` ranking only.
+    """
+    mark_stage("parse")
+    page_size = request.page_size or settings.MAX_RESULTS
+    deadline = Deadline.from_header(x_deadline_ms, settings.DEFAULT_DEADLINE_MS)
+    if request.cursor:
+        # One page of rows and no similarity calls: admitted at page size,
+        # and kept out of the per-candidate cost estimate
+        async with get_admission_controller().slot(deadline, page_size, learn=False):
+            return await run_in_threadpool(get_scheduler().run, "interactive", next_page,
+                                           request, query, query_org, page_size)
+
+    depth = max(settings.PAGINATION_MAX_DEPTH, page_size) if request.paginate else page_size
+    async with get_admission_controller().slot(deadline, len(request.candidates)):
+        by_radius = await run_in_threadpool(match_request, path, request, query, query_org, deadline, depth)
+    results = by_radius[request.search_radius]
+
+    next_cursor = None
+    if request.paginate and len(results) > page_size:
+        fingerprint = await run_in_threadpool(ranking_fingerprint, request)
+        list_id = get_ranked_lists().put(
+            [r.id for r in results], [r.match_score for r in results], [r.name_similarity for r in results],
+            fingerprint, deadline.partial, deadline.degraded,
+        )
+        next_cursor = cursor_for(list_id, page_size)
+        results = results[:page_size]
+
+    sweep = None
+    if request.search_radii:
+        sweep = [
+            RadiusMatches(search_radius=radius, total_results=len(by_radius[radius][:page_size]),
+                          results=by_radius[radius][:page_size])
+            for radius in dict.fromkeys(request.search_radii)
+        ]
+
+    return MatchResponse(
+        total_results=len(results),
+        results=results,
+        computed_at=datetime.utcnow().isoformat(),
+        partial=deadline.partial,
+        degraded=deadline.degraded,
+        next_cursor=next_cursor,
+        by_radius=sweep,
+    )
+
+
+# ═══════════════════════════════════════════════════════════════
+# Background precompute (materialized top-K view)
+# ═══════════════════════════════════════════════════════════════
+
+def parse_change(kind: str, item: dict, org: dict):
+    model = SupplyData if kind == "supply" else DemandData
+    return model(**item), OrgData(**org)
+
+
+materialized_view: Optional[MaterializedView] = None
+_precompute_stop = threading.Event()
+
+
+def start_precompute() -> MaterializedView:
+    global materialized_view
+    if settings.PRECOMPUTE_QUEUE_PATH:
+        change_queue = FileChangeQueue(settings.PRECOMPUTE_QUEUE_PATH, settings.PRECOMPUTE_QUEUE_SIZE)
+    else:
+        change_queue = MemoryChangeQueue(settings.PRECOMPUTE_QUEUE_SIZE)
+    materialized_view = MaterializedView(
+        change_queue,
+        parse=parse_change,
+        score=match_candidates,
+        default_radius=settings.DEFAULT_SEARCH_RADIUS_KM,
+        batch_window=settings.PRECOMPUTE_BATCH_WINDOW,
+        scheduler=get_scheduler(),
+    )
+    threading.Thread(
+        target=materialized_view.run_forever, args=(_precompute_stop,),
+        name="precompute", daemon=True,
+    ).start()
+    return materialized_view
+
+
+# ═══════════════════════════════════════════════════════════════
+# Warm start (snapshots, warm-up, readiness)
+# ═══════════════════════════════════════════════════════════════
+
+_snapshot_stop = threading.Event()
+
+
+def warm_up() -> None:
+    """One synthetic fuzzy scoring pass: imports, singletons, kernels, models."""
+    get_semantic_matcher()
+    org = OrgData(org_id=0, org_name="warm-up", latitude=0.0, longitude=0.0)
+    query = DemandData(demand_id=0, org_id=0, item_name="warm up rice", quantity=1, quantity_unit="kg")
+    rows = []
+    for i in range(8):
+        text = f"warm up rice {i}"
+        item = SupplyData(supply_id=i, org_id=0, item_name=text, price_per_unit=1.0, quantity=1, quantity_unit="kg")
+        rows.append((item, org, float(i), text))
+    deadline = Deadline(5.0)
+    deadline.degraded = "fuzzy_only"   # no embedding API calls
+    score_rows(query, "warm up rice", rows, settings.DEFAULT_SEARCH_RADIUS_KM, deadline)
+
+
+@app.on_event("startup")
+async def restore_snapshots():
+    warm = get_warm_state()
+    warm.restore()
+    if warm.directory:
+        # Snapshot vectors of another embedding model: serve them, re-embed in the background
+        start_embedding_migration(_snapshot_stop)
+    if settings.PRECOMPUTE_ENABLED:
+        start_precompute()
+    threading.Thread(target=warm.warm_up, args=(warm_up,), name="warm-up", daemon=True).start()
+    if warm.writes_snapshots:
+        threading.Thread(
+            target=warm.run_periodic, args=(_snapshot_stop,),
+            name="warm-state-snapshot", daemon=True,
+        ).start()
+
+
+@app.on_event("shutdown")
+async def write_snapshots():
+    _precompute_stop.set()
+    _snapshot_stop.set()
+    warm = get_warm_state()
+    if warm.writes_snapshots:
+        try:
+            warm.snapshot()
+        except Exception as e:
+            print(f"[Worker] Warm-state snapshot on shutdown failed: {e}")
+
+
 @app.get("/", tags=["Root"])
 async def root():
     return {
@@ -241,259 +1132,534 @@ async def health():
     return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
 
 
+@app.get("/ready", tags=["Health"])
+async def ready():
+    """Readiness: 503 until start-up warm-up is done; reports warm or cold start."""
+    body = get_warm_state().status()
+    if not body["ready"]:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=body)
+    return body
+
+
+@app.get("/metrics", tags=["Health"])
+async def get_metrics():
+    snapshot = metrics.snapshot()
+    snapshot["token_index"] = {
+        kind: get_token_index(kind).stats() for kind in ("supply", "demand")
+    }
+    shared = get_shared_state()
+    snapshot["shared_state"] = shared.meta if shared is not None else None
+    matcher = get_semantic_matcher()
+    migration = get_embedding_migration()
+    snapshot["embedding"] = {
+        "served_version": matcher.version.key,
+        "configured_version": matcher.configured_version.key,
+        "migration": migration.status() if migration is not None else None,
+    }
+    return snapshot
+
+
 @app.post("/match/supply-to-demands", response_model=MatchResponse, tags=["Matching"])
-async def match_supply_to_demands(request: MatchSupplyRequest):
+async def match_supply_to_demands(
+    request: MatchSupplyRequest,
+    x_deadline_ms: Optional[int] = Header(None),
+):
     """
     Compute matches: Supply → Demands.
     Returns scored results with personalized breakdowns.
     """
     try:
-        supply = request.supply
-        supply_org = request.supply_org
-        search_radius = request.search_radius
-        results = []
+        print(f"[Worker] Processing Supply→Demands for Supply ID: {request.supply.supply_id}. "
+              f"Candidates: {len(request.candidates)}. Radius: {request.search_radius}km")
 
-        print(f"[Worker] Processing Supply→Demands for Supply ID: {supply.supply_id}. "
-              f"Candidates: {len(request.candidates)}. Radius: {search_radius}km")
+        response = await run_match("/match/supply-to-demands", request, request.supply, request.supply_org, x_deadline_ms)
+        return render_response(response, request)
 
-        supply_text = build_rich_text(supply.item_name, supply.item_description, supply.item_category)
+    except Overloaded as e:
+        print(f"[Worker] supply→demand request shed ({e.reason}), retry after {e.retry_after}s")
+        raise overloaded_response(e)
+    except CursorError as e:
+        raise HTTPException(status_code=e.status, detail=e.reason)
+    except Exception as e:
+        print(f"[Worker] supply→demand matching error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
 
-        for candidate in request.candidates:
-            dem = candidate.demand
-            org = candidate.org
 
-            try:
-                # Distance
-                distance_km = calculate_distance(
-                    supply_org.latitude, supply_org.longitude,
-                    org.latitude, org.longitude
-                )
+@app.post("/match/demand-to-supplies", response_model=MatchResponse, tags=["Matching"])
+async def match_demand_to_supplies(
+    request: MatchDemandRequest,
+    x_deadline_ms: Optional[int] = Header(None),
+):
+    """
+    Compute matches: Demand → Supplies.
+    Returns scored results with personalized breakdowns.
+    """
+    try:
+        print(f"[Worker] Processing Demand→Supplies for Demand ID: {request.demand.demand_id}. "
+              f"Candidates: {len(request.candidates)}. Radius: {request.search_radius}km")
 
-                if distance_km > search_radius:
-                    continue
+        response = await run_match("/match/demand-to-supplies", request, request.demand, request.demand_org, x_deadline_ms)
+        return render_response(response, request)
 
-                # Category match (consistent logic)
-                cat_match = check_category_match(
-                    supply.category_id, dem.category_id,
-                    supply.item_category, dem.item_category
-                )
+    except Overloaded as e:
+        print(f"[Worker] demand→supply request shed ({e.reason}), retry after {e.retry_after}s")
+        raise overloaded_response(e)
+    except CursorError as e:
+        raise HTTPException(status_code=e.status, detail=e.reason)
+    except Exception as e:
+        print(f"[Worker] demand→supply matching error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
 
-                # Build rich text for similarity
-                demand_text = build_rich_text(dem.item_name, dem.item_description, dem.item_category)
-
-                # Hybrid similarity
-                try:
-                    name_similarity = calculate_hybrid_similarity(
-                        supply_text,
-                        demand_text,
-                        use_semantic=settings.USE_SEMANTIC_SEARCH,
-                        semantic_weight=settings.SEMANTIC_WEIGHT,
-                        fuzzy_weight=settings.FUZZY_WEIGHT
-                    )
-                except Exception as e:
-                    print(f"[Worker] Similarity calc failed: {e}")
-                    name_similarity = 0.0
-
-                # Skip only if NEITHER category nor name matches
-                if not cat_match and name_similarity < settings.SIMILARITY_THRESHOLD:
-                    continue
 
-                # Category boost: moderate, not overwhelming
-                if cat_match:
-                    effective_sim = max(name_similarity, 0.65)
-                    # Additional boost proportional to name similarity
-                    effective_sim = min(1.0, effective_sim + 0.15)
-                else:
-                    effective_sim = name_similarity
-
-                # Detailed match score with breakdown
-                score_detail = calculate_match_score_detailed(
-                    distance_km=distance_km,
-                    similarity_score=effective_sim,
-                    supply_price=supply.price_per_unit,
-                    demand_max_price=dem.max_price_per_unit,
-                    max_distance=search_radius,
-                    supply_qty=supply.quantity,
-                    supply_unit=supply.quantity_unit,
-                    demand_qty=dem.quantity,
-                    demand_unit=dem.quantity_unit,
-                    price_tolerance=settings.PRICE_TOLERANCE_PERCENT
-                )
+@app.post("/precompute/events", tags=["Precompute"])
+async def submit_change_events(batch: ChangeEventBatch):
+    """
+    Enqueue item changes for background recomputation.
+    Returns 429 with Retry-After once the change queue is full.
+    """
+    if materialized_view is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Precompute mode is disabled")
+
+    accepted = 0
+    for event in batch.events:
+        if event.op == "upsert" and (event.item is None or event.org is None):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"upsert of {event.kind} {event.item_id} needs item and org")
+        change = ChangeEvent(
+            op=event.op,
+            kind=event.kind,
+            item_id=event.item_id,
+            item=event.item,
+            org=event.org.model_dump() if event.org else None,
+        )
+        if not materialized_view.submit(change):
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Change queue full; accepted {accepted} of {len(batch.events)} events",
+                headers={"Retry-After": str(max(1, round(settings.PRECOMPUTE_BATCH_WINDOW * 2)))},
+            )
+        accepted += 1
+    return {"accepted": accepted}
+
+
+@app.get("/precompute/{kind}/{item_id}", response_model=MatchResponse, tags=["Precompute"])
+async def get_precomputed_matches(
+    kind: Literal["supply", "demand"],
+    item_id: int,
+    response_format: Literal["full", "compact", "org_dict"] = "full",
+    fields: Optional[str] = None,
+):
+    """
+    O(1) read of a precomputed top-K; 404 means fall back to a live match.
+    `fields` (comma-separated) and `response_format` shape it as for /match/*.
+    """
+    try:
+        shape = ResponseShape(
+            fields=fields.split(",") if fields else None, response_format=response_format
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    if materialized_view is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Precompute mode is disabled")
+
+    found = materialized_view.get(kind, item_id)
+    if found is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No precomputed matches for {kind} {item_id}")
+    entry, stale = found
+    return render_response(MatchResponse(
+        total_results=len(entry.results),
+        results=entry.results,
+        computed_at=datetime.utcfromtimestamp(entry.computed_at).isoformat(),
+        stale=stale,
+    ), shape)
 
-                match_score = score_detail["match_score"]
 
-                if match_score < MIN_MATCH_SCORE:
-                    continue
+# ═══════════════════════════════════════════════════════════════
+# Percolator (open items as standing queries)
+# ═══════════════════════════════════════════════════════════════
 
-                results.append(MatchResult(
-                    id=dem.demand_id,
-                    org_id=org.org_id,
-                    org_name=org.org_name,
-                    item_name=dem.item_name,
-                    item_category=dem.item_category,
-                    item_description=dem.item_description,
-                    price=dem.max_price_per_unit,
-                    currency=dem.currency,
-                    quantity=dem.quantity,
-                    quantity_unit=dem.quantity_unit,
-                    distance_km=round(distance_km, 2),
-                    name_similarity=round(effective_sim, 3),
-                    match_score=round(match_score, 3),
-                    score_breakdown=ScoreBreakdown(**score_detail["breakdown"]),
-                    match_labels=MatchLabels(**score_detail["labels"]),
-                    category_matched=cat_match,
-                    org_email=org.email,
-                    org_phone=org.phone_number,
-                    org_address=org.address,
-                    org_latitude=org.latitude,
-                    org_longitude=org.longitude,
-                ))
-            except Exception as item_err:
-                print(f"[Worker] Skipping candidate due to error: {item_err}")
-                continue
+class StandingItem(BaseModel):
+    """One open supply or demand (exactly one of the two) with its org"""
+    supply: Optional[SupplyData] = None
+    demand: Optional[DemandData] = None
+    org: OrgData
+    # Search circle of the standing query (default: the supply's own
+    # search_radius, else DEFAULT_SEARCH_RADIUS_KM)
+    search_radius: Optional[float] = Field(None, gt=0)
+
+    @model_validator(mode="after")
+    def one_item(self):
+        if (self.supply is None) == (self.demand is None):
+            raise ValueError("Send exactly one of supply or demand")
+        return self
+
+    @property
+    def kind(self) -> str:
+        return "supply" if self.supply is not None else "demand"
+
+    @property
+    def item(self):
+        return self.supply if self.supply is not None else self.demand
+
+    def radius(self) -> float:
+        if self.search_radius:
+            return self.search_radius
+        if self.supply is not None and self.supply.search_radius:
+            return self.supply.search_radius
+        return settings.DEFAULT_SEARCH_RADIUS_KM
+
+
+class StandingBatch(BaseModel):
+    items: List[StandingItem]
+    # Full sync: drop standing queries of these kinds that are not in `items`
+    replace: List[Literal["supply", "demand"]] = []
+
+
+class PercolateRequest(StandingItem):
+    # Report matches scoring at least this much (default PERCOLATOR_MIN_SCORE)
+    min_score: Optional[float] = Field(None, ge=0, le=1)
+    limit: Optional[int] = Field(None, ge=1)
+    # Also register (or replace) the item as a standing query of its own kind
+    add_standing: bool = True
+
+
+class PercolateMatch(BaseModel):
+    """An open item of the other side whose search the new item qualifies for"""
+    id: int
+    org_id: int
+    match_score: float
+    distance_km: float
 
-        results.sort(key=lambda x: x.match_score, reverse=True)
-        results = results[:settings.MAX_RESULTS]
 
-        return MatchResponse(
-            total_results=len(results),
-            results=results,
-            computed_at=datetime.utcnow().isoformat()
-        )
+class PercolateResponse(BaseModel):
+    kind: str                 # kind of the matched standing queries
+    total_results: int
+    matches: List[PercolateMatch]
+    examined: int             # standing queries scored after the index filters
+    standing: int             # standing queries of that kind
+    computed_at: str
+
+
+percolators: Dict[str, Percolator] = {
+    kind: Percolator(kind, score_chunk, settings.PERCOLATOR_CELL_KM, settings.PRICE_TOLERANCE_PERCENT)
+    for kind in ("supply", "demand")
+}
+
+
+def run_percolate(request: PercolateRequest) -> PercolateResponse:
+    attach_thread()
+    other = "demand" if request.kind == "supply" else "supply"
+    min_score = settings.PERCOLATOR_MIN_SCORE if request.min_score is None else request.min_score
+    matches, examined = percolators[other].percolate(request.item, request.org, min_score, request.limit)
+    if request.add_standing:
+        percolators[request.kind].upsert(item_id(request.item), request.item, request.org, request.radius())
+    return PercolateResponse(
+        kind=other,
+        total_results=len(matches),
+        matches=[PercolateMatch(id=i, org_id=o, match_score=s, distance_km=d) for i, o, s, d in matches],
+        examined=examined,
+        standing=len(percolators[other]),
+        computed_at=datetime.utcnow().isoformat(),
+    )
+
 
+@app.post("/percolate", response_model=PercolateResponse, tags=["Percolator"])
+async def percolate_item(request: PercolateRequest):
+    """
+    Which open items of the other side does this new or updated item
+    qualify for (match_score >= min_score in their own search)? Runs as
+    a bulk job; by default the item is then registered as a standing
+    query itself, so later items of the other side find it.
+    """
+    print(f"[Worker] Percolating {request.kind} {item_id(request.item)} "
+          f"against {len(percolators['demand' if request.kind == 'supply' else 'supply'])} standing queries")
+    try:
+        return await run_in_threadpool(get_scheduler().run, "bulk", run_percolate, request)
     except Exception as e:
-        print(f"[Worker] supply→demand matching error: {e}")
+        print(f"[Worker] Percolate error: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
         )
 
 
-@app.post("/match/demand-to-supplies", response_model=MatchResponse, tags=["Matching"])
-async def match_demand_to_supplies(request: MatchDemandRequest):
-    """
-    Compute matches: Demand → Supplies.
-    Returns scored results with personalized breakdowns.
-    """
-    try:
-        demand = request.demand
-        demand_org = request.demand_org
-        search_radius = request.search_radius
-        results = []
+@app.post("/percolator/standing", tags=["Percolator"])
+async def register_standing_queries(batch: StandingBatch):
+    """Register open items as standing queries (e.g. all open demands at startup)."""
+    keep: Dict[str, set] = {kind: set() for kind in batch.replace}
+    for entry in batch.items:
+        percolators[entry.kind].upsert(item_id(entry.item), entry.item, entry.org, entry.radius())
+        if entry.kind in keep:
+            keep[entry.kind].add(item_id(entry.item))
+    removed = 0
+    for kind, ids in keep.items():
+        for stale_id in set(percolators[kind].ids()) - ids:
+            removed += percolators[kind].remove(stale_id)
+    return {"registered": len(batch.items), "removed": removed,
+            "standing": {kind: len(p) for kind, p in percolators.items()}}
 
-        print(f"[Worker] Processing Demand→Supplies for Demand ID: {demand.demand_id}. "
-              f"Candidates: {len(request.candidates)}. Radius: {search_radius}km")
 
-        demand_text = build_rich_text(demand.item_name, demand.item_description, demand.item_category)
+@app.delete("/percolator/{kind}/{item_id}", tags=["Percolator"])
+async def remove_standing_query(kind: Literal["supply", "demand"], item_id: int):
+    """Drop the standing query of a closed, expired or deleted item."""
+    return {"removed": percolators[kind].remove(item_id)}
 
-        for candidate in request.candidates:
-            sup = candidate.supply
-            org = candidate.org
 
-            try:
-                distance_km = calculate_distance(
-                    demand_org.latitude, demand_org.longitude,
-                    org.latitude, org.longitude
-                )
+# ═══════════════════════════════════════════════════════════════
+# Batch allocation (quantity-constrained, all supplies × all demands)
+# ═══════════════════════════════════════════════════════════════
 
-                if distance_km > search_radius:
-                    continue
+class AllocationRequest(BaseModel):
+    class SupplyEntry(BaseModel):
+        supply: SupplyData
+        org: OrgData
 
-                # Category match (same consistent logic)
-                cat_match = check_category_match(
-                    demand.category_id, sup.category_id,
-                    demand.item_category, sup.item_category
-                )
+    class DemandEntry(BaseModel):
+        demand: DemandData
+        org: OrgData
 
-                # Build rich text
-                supply_text = build_rich_text(sup.item_name, sup.item_description, sup.item_category)
-
-                # Hybrid similarity
-                try:
-                    name_similarity = calculate_hybrid_similarity(
-                        demand_text,
-                        supply_text,
-                        use_semantic=settings.USE_SEMANTIC_SEARCH,
-                        semantic_weight=settings.SEMANTIC_WEIGHT,
-                        fuzzy_weight=settings.FUZZY_WEIGHT
-                    )
-                except Exception as e:
-                    print(f"[Worker] Similarity calc failed: {e}")
-                    name_similarity = 0.0
-
-                if not cat_match and name_similarity < settings.SIMILARITY_THRESHOLD:
-                    continue
+    supplies: List[SupplyEntry]
+    demands: List[DemandEntry]
+    search_radius: float = 50.0
+    # Pairs scoring below this are not allocated (default MIN_MATCH_SCORE)
+    min_score: Optional[float] = None
 
-                # Category boost: moderate
-                if cat_match:
-                    effective_sim = max(name_similarity, 0.65)
-                    effective_sim = min(1.0, effective_sim + 0.15)
-                else:
-                    effective_sim = name_similarity
-
-                # Detailed score
-                score_detail = calculate_match_score_detailed(
-                    distance_km=distance_km,
-                    similarity_score=effective_sim,
-                    supply_price=sup.price_per_unit,
-                    demand_max_price=demand.max_price_per_unit,
-                    max_distance=search_radius,
-                    supply_qty=sup.quantity,
-                    supply_unit=sup.quantity_unit,
-                    demand_qty=demand.quantity,
-                    demand_unit=demand.quantity_unit,
-                    price_tolerance=settings.PRICE_TOLERANCE_PERCENT
-                )
 
-                match_score = score_detail["match_score"]
+class Allocation(BaseModel):
+    """Quantity of one supply assigned to one demand"""
+    supply_id: int
+    demand_id: int
+    quantity: float                  # in the demand's unit
+    quantity_unit: Optional[str] = None
+    fulfillment_pct: float           # share of the demand's quantity
+    match_score: float
 
-                if match_score < MIN_MATCH_SCORE:
-                    continue
 
-                results.append(MatchResult(
-                    id=sup.supply_id,
-                    org_id=org.org_id,
-                    org_name=org.org_name,
-                    item_name=sup.item_name,
-                    item_category=sup.item_category,
-                    item_description=sup.item_description,
-                    price=sup.price_per_unit,
-                    currency=sup.currency,
-                    quantity=sup.quantity,
-                    quantity_unit=sup.quantity_unit,
-                    distance_km=round(distance_km, 2),
-                    name_similarity=round(effective_sim, 3),
-                    match_score=round(match_score, 3),
-                    score_breakdown=ScoreBreakdown(**score_detail["breakdown"]),
-                    match_labels=MatchLabels(**score_detail["labels"]),
-                    category_matched=cat_match,
-                    org_email=org.email,
-                    org_phone=org.phone_number,
-                    org_address=org.address,
-                    org_latitude=org.latitude,
-                    org_longitude=org.longitude,
-                ))
-            except Exception as item_err:
-                print(f"[Worker] Skipping candidate due to error: {item_err}")
-                continue
+class AllocationResponse(BaseModel):
+    allocations: List[Allocation]
+    # Σ match_score × fraction of the demand served (see allocation.py)
+    total_score: float
+    demand_fulfilled_pct: float
+    edges: int
+    components: int
+    largest_component_edges: int
+    build_ms: float
+    solve_ms: float
+    computed_at: str
+    # Deadline hit: edges incomplete and/or some components allocated greedily
+    partial: bool = False
 
-        results.sort(key=lambda x: x.match_score, reverse=True)
-        results = results[:settings.MAX_RESULTS]
 
-        return MatchResponse(
-            total_results=len(results),
-            results=results,
-            computed_at=datetime.utcnow().isoformat()
-        )
+def units_compatible(supply_unit: Optional[str], demand_unit: Optional[str]) -> bool:
+    return are_units_comparable(supply_unit, demand_unit) or (not supply_unit and not demand_unit)
 
+
+def build_allocation_graph(request: AllocationRequest, min_score: float, deadline: Deadline):
+    """
+    Feasible (supply, demand, score) edges: supplies near each demand
+    (grid buckets) go through the regular match pipeline, so radius,
+    token/category prefilter and scoring are exactly those of
+    /match/demand-to-supplies, and each demand keeps its top MAX_RESULTS.
+    """
+    supplies = [e for e in request.supplies if e.supply.quantity and e.supply.quantity > 0]
+    demands = [e for e in request.demands if e.demand.quantity and e.demand.quantity > 0]
+    offer = [normalize_quantity(e.supply.quantity, e.supply.quantity_unit) for e in supplies]
+    need = [normalize_quantity(e.demand.quantity, e.demand.quantity_unit) for e in demands]
+
+    grid = RegionGrid(request.search_radius)
+    supply_index: Dict[int, int] = {}
+    for i, entry in enumerate(supplies):
+        grid.add(i, entry.org.latitude, entry.org.longitude)
+        supply_index[entry.supply.supply_id] = i
+
+    scheduler = get_scheduler()
+    edges = []
+    for d, entry in enumerate(demands):
+        if deadline.expired():
+            deadline.partial = True
+            break
+        scheduler.checkpoint()
+        nearby = [
+            (supplies[i].supply, supplies[i].org)
+            for i in grid.near(entry.org.latitude, entry.org.longitude, request.search_radius)
+            if units_compatible(supplies[i].supply.quantity_unit, entry.demand.quantity_unit)
+        ]
+        if not nearby:
+            continue
+        for result in match_candidates(entry.demand, entry.org, nearby, request.search_radius, deadline):
+            if result.match_score >= min_score:
+                edges.append((supply_index[result.id], d, result.match_score))
+    return supplies, demands, offer, need, edges
+
+
+def run_allocation(request: AllocationRequest, deadline: Deadline) -> AllocationResponse:
+    attach_thread()
+    min_score = MIN_MATCH_SCORE if request.min_score is None else request.min_score
+    started = time.perf_counter()
+    supplies, demands, offer, need, edges = build_allocation_graph(request, min_score, deadline)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    flow, stats = allocate(offer, need, edges, deadline, checkpoint=get_scheduler().checkpoint)
+    allocations = []
+    for (s, d, score), amount in zip(edges, flow):
+        if amount <= 1e-9:
+            continue
+        demand = demands[d].demand
+        allocations.append(Allocation(
+            supply_id=supplies[s].supply.supply_id,
+            demand_id=demand.demand_id,
+            quantity=amount / normalize_quantity(1.0, demand.quantity_unit),
+            quantity_unit=demand.quantity_unit,
+            fulfillment_pct=round(100 * amount / need[d], 2),
+            match_score=score,
+        ))
+    allocations.sort(key=lambda a: (a.demand_id, -a.match_score, a.supply_id))
+
+    metrics.observe("allocation.build_ms", build_ms)
+    metrics.observe("allocation.solve_ms", stats["solve_ms"])
+    metrics.observe("allocation.edges", len(edges))
+    return AllocationResponse(
+        allocations=allocations,
+        total_score=round(objective(need, edges, flow), 4),
+        demand_fulfilled_pct=round(100 * fulfilled_fraction(need, flow), 2),
+        edges=len(edges),
+        components=stats["components"],
+        largest_component_edges=stats["largest_component_edges"],
+        build_ms=round(build_ms, 1),
+        solve_ms=stats["solve_ms"],
+        computed_at=datetime.utcnow().isoformat(),
+        partial=deadline.partial,
+    )
+
+
+@app.post("/allocate", response_model=AllocationResponse, tags=["Allocation"])
+async def allocate_quantities(
+    request: AllocationRequest,
+    x_deadline_ms: Optional[int] = Header(None),
+):
+    """
+    Split supply quantities over demands to maximize the total match
+    score, instead of offering every supply's full quantity to every
+    demand. Runs as a bulk job; without X-Deadline-Ms the budget is
+    ALLOCATION_DEADLINE_MS.
+    """
+    print(f"[Worker] Allocating {len(request.supplies)} supplies over {len(request.demands)} demands. "
+          f"Radius: {request.search_radius}km")
+    # Allocations are reported per supply_id/demand_id, so each must be one entry
+    for side, ids in (("supply_id", [e.supply.supply_id for e in request.supplies]),
+                      ("demand_id", [e.demand.demand_id for e in request.demands])):
+        duplicates = sorted(i for i, n in Counter(ids).items() if n > 1)
+        if duplicates:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Duplicate {side} values: {duplicates[:10]}"
+            )
+    deadline = Deadline.from_header(x_deadline_ms, settings.ALLOCATION_DEADLINE_MS)
+    try:
+        return await run_in_threadpool(get_scheduler().run, "bulk", run_allocation, request, deadline)
     except Exception as e:
-        print(f"[Worker] demand→supply matching error: {e}")
+        print(f"[Worker] Allocation error: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
         )
 
 
+# ═══════════════════════════════════════════════════════════════
+# Profiling (admin)
+# ═══════════════════════════════════════════════════════════════
+
+class ProfileRequest(BaseModel):
+    """Profile the next `requests` requests whose path starts with path_prefix"""
+    path_prefix: str = "/match/"
+    requests: int = Field(1, ge=1, le=1000)
+
+
+def require_profiler(x_profile_token: Optional[str]):
+    profiler = get_profiler()
+    if profiler is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profiling is disabled (PROFILE_TOKEN)")
+    if not profiler.authorized(x_profile_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid X-Profile-Token")
+    return profiler
+
+
+@app.post("/admin/profile", tags=["Admin"])
+async def arm_profiling(body: ProfileRequest, x_profile_token: Optional[str] = Header(None)):
+    require_profiler(x_profile_token).arm(body.path_prefix, body.requests)
+    return {"armed": body.requests, "path_prefix": body.path_prefix}
+
+
+@app.get("/admin/profiles", tags=["Admin"])
+async def list_profiles(x_profile_token: Optional[str] = Header(None)):
+    return require_profiler(x_profile_token).profiles()
+
+
+@app.get("/admin/profiles/{profile_id}", response_class=PlainTextResponse, tags=["Admin"])
+async def get_profile(profile_id: str, x_profile_token: Optional[str] = Header(None)):
+    """Collapsed stacks ("frame;frame count" lines) for flamegraph.pl / speedscope."""
+    session = require_profiler(x_profile_token).get(profile_id)
+    if session is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No profile {profile_id}")
+    return session.collapsed()
+
+
+class RebalanceRequest(BaseModel):
+    """Shards to spread the observed cell load over (default: all in the map)"""
+    shards: Optional[List[str]] = None
+
+
+def require_shard_router():
+    router = get_shard_router()
+    if router is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Not a shard coordinator (SHARD_MAP_PATH unset)")
+    return router
+
+
+def require_shard_admin(x_shard_admin_token: Optional[str]):
+    if not settings.SHARD_ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Shard map changes are disabled (SHARD_ADMIN_TOKEN)")
+    if not x_shard_admin_token or not hmac.compare_digest(x_shard_admin_token, settings.SHARD_ADMIN_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid X-Shard-Admin-Token")
+
+
+@app.get("/shards", tags=["Sharding"])
+async def get_shards():
+    """Current shard map plus candidates routed to each shard since startup."""
+    router = require_shard_router()
+    return {"map": router.shard_map().to_dict(), "load": router.shard_load()}
+
+
+@app.put("/shards", tags=["Sharding"])
+async def put_shards(shard_map: Dict[str, Any], x_shard_admin_token: Optional[str] = Header(None)):
+    """Replace the shard map (takes effect for the next request)."""
+    require_shard_admin(x_shard_admin_token)
+    router = require_shard_router()
+    try:
+        new_map = ShardMap.from_dict(shard_map)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid shard map: {e}")
+    router.replace(new_map)
+    return new_map.to_dict()
+
+
+@app.post("/shards/rebalance", tags=["Sharding"])
+async def rebalance_shards(body: RebalanceRequest, x_shard_admin_token: Optional[str] = Header(None)):
+    """Reassign cells so observed load is spread evenly across shards."""
+    require_shard_admin(x_shard_admin_token)
+    router = require_shard_router()
+    new_map = router.rebalance(body.shards)
+    return {"map": new_map.to_dict(), "load": router.shard_load()}
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,227 @@
+"""
+Per-request memory accounting and budgets.
+
+A match request holds its raw JSON, the parsed pydantic candidates, the
+rich texts of the in-radius rows and the scored results at the same
+time, so its footprint grows with its body: roughly
+MEMORY_BYTES_PER_BODY_BYTE × the body size (about 12-16× measured on
+50,000-candidate requests, most of it the parsed models).
+
+The middleware estimates every request with a body before reading it:
+
+    - over REQUEST_MEMORY_LIMIT_BYTES: rejected with 413 right away, the
+      body is never read (bodies without Content-Length are counted as
+      they arrive and cut off at the limit). This is the only bound on
+      a request's memory.
+    - over REQUEST_MEMORY_BUDGET_BYTES: the body is still read and
+      parsed in full; only the scoring is sliced: the match pipeline
+      scores its candidates in MEMORY_STREAM_CHUNK slices and keeps only
+      each slice's top results (same ranking)
+
+A MEMORY_SAMPLE_RATE share of requests is traced with tracemalloc, one
+at a time: the request's peak footprint per stage (parse, prefilter,
+score, render) goes to the `memory.stage.*` summaries in /metrics and
+the observed footprint per body byte to `memory.bytes_per_body_byte`,
+to check MEMORY_BYTES_PER_BODY_BYTE against. tracemalloc is process
+wide: a traced peak can include allocations of concurrent requests, and
+every allocation in the process is slower while it runs, so sampling is
+off by default and meant to be switched on while investigating.
+"""
+
+import contextvars
+import json
+import random
+import threading
+import tracemalloc
+from typing import Dict, Optional
+
+from metrics import metrics
+
+
+class RequestMemory:
+    """Memory estimate and (if sampled) traced stage peaks of one request."""
+
+    __slots__ = ("path", "body_bytes", "estimate", "bounded", "sampled", "stages", "_base")
+
+    def __init__(self, path: str, body_bytes: Optional[int], estimate: int, bounded: bool, sampled: bool):
+        self.path = path
+        self.body_bytes = body_bytes
+        self.estimate = estimate
+        self.bounded = bounded
+        self.sampled = sampled
+        self.stages: Dict[str, int] = {}
+        self._base = 0
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("request_memory", default=None)
+
+
+class MemoryAccountant:
+    """Estimates, budgets and the one-at-a-time tracemalloc sampler."""
+
+    def __init__(self, budget_bytes: int, limit_bytes: int, bytes_per_body_byte: float,
+                 sample_rate: float):
+        self.budget_bytes = budget_bytes
+        self.limit_bytes = limit_bytes
+        self.bytes_per_body_byte = bytes_per_body_byte
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+        self._tracing: Optional[RequestMemory] = None
+        self._in_flight = 0
+
+    def estimate(self, body_bytes: int) -> int:
+        return int(body_bytes * self.bytes_per_body_byte)
+
+    def over_limit(self, body_bytes: int) -> bool:
+        return self.estimate(body_bytes) > self.limit_bytes
+
+    def begin(self, path: str, body_bytes: Optional[int]) -> RequestMemory:
+        estimate = self.estimate(body_bytes or 0)
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        with self._lock:
+            if sampled and self._tracing is None and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            else:
+                sampled = False
+            request = RequestMemory(path, body_bytes, estimate, estimate > self.budget_bytes, sampled)
+            if sampled:
+                self._tracing = request
+            self._in_flight += estimate
+            metrics.set_gauge("memory.in_flight_estimate_bytes", self._in_flight)
+        if sampled:
+            tracemalloc.reset_peak()
+            request._base = tracemalloc.get_traced_memory()[0]
+        return request
+
+    def body_complete(self, request: RequestMemory, body_bytes: int) -> None:
+        """Size of a body sent without Content-Length, once it has arrived."""
+        estimate = self.estimate(body_bytes)
+        with self._lock:
+            self._in_flight += estimate - request.estimate
+        request.body_bytes = body_bytes
+        request.estimate = estimate
+        request.bounded = estimate > self.budget_bytes
+
+    def end(self, request: RequestMemory) -> None:
+        if request.sampled:
+            mark_stage("render", request)
+            with self._lock:
+                tracemalloc.stop()
+                self._tracing = None
+            metrics.inc("memory.sampled")
+            for stage, peak in request.stages.items():
+                metrics.observe(f"memory.stage.{stage}_bytes", peak)
+            if request.body_bytes:
+                metrics.observe("memory.bytes_per_body_byte",
+                                round(max(request.stages.values(), default=0) / request.body_bytes, 2))
+        with self._lock:
+            self._in_flight -= request.estimate
+            metrics.set_gauge("memory.in_flight_estimate_bytes", self._in_flight)
+        metrics.observe("memory.request_estimate_bytes", request.estimate)
+        if request.bounded:
+            metrics.inc("memory.bounded_requests")
+
+
+def mark_stage(stage: str, request: Optional[RequestMemory] = None) -> None:
+    """
+    End of a pipeline stage for the current request: records its peak
+    footprint since the previous mark (largest across repeated marks).
+    Free unless the request is being traced.
+    """
+    request = request or _current.get()
+    if request is None or not request.sampled or not tracemalloc.is_tracing():
+        return
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    request.stages[stage] = max(request.stages.get(stage, 0), peak - request._base)
+
+
+def memory_bounded() -> bool:
+    """Whether the current request is over REQUEST_MEMORY_BUDGET_BYTES."""
+    request = _current.get()
+    return request is not None and request.bounded
+
+
+class MemoryBudgetMiddleware:
+    """
+    ASGI middleware: estimates requests with a body, rejects those over
+    the limit with 413 before reading them, and tracks the rest.
+    """
+
+    def __init__(self, app, accountant: MemoryAccountant):
+        self.app = app
+        self.accountant = accountant
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT"):
+            return await self.app(scope, receive, send)
+        body_bytes = None
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                body_bytes = int(value)
+                break
+        if body_bytes is not None and self.accountant.over_limit(body_bytes):
+            return await self._reject(send, body_bytes)
+
+        request = self.accountant.begin(scope["path"], body_bytes)
+        context_token = _current.set(request)
+        received = 0
+        cut_off = False
+
+        async def receive_counted():
+            nonlocal received, cut_off
+            message = await receive()
+            if body_bytes is None and message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if self.accountant.over_limit(received):
+                    # Unknown length: stop reading at the limit
+                    cut_off = True
+                    return {"type": "http.disconnect"}
+                if not message.get("more_body", False):
+                    self.accountant.body_complete(request, received)
+            return message
+
+        async def send_checked(message):
+            # Once the body was cut off, the app's error response becomes the 413
+            if not cut_off:
+                await send(message)
+            elif message["type"] == "http.response.start":
+                await self._reject(send, received)
+
+        try:
+            await self.app(scope, receive_counted, send_checked)
+        finally:
+            _current.reset(context_token)
+            self.accountant.end(request)
+
+    async def _reject(self, send, body_bytes: int) -> None:
+        metrics.inc("memory.rejected")
+        estimate = self.accountant.estimate(body_bytes)
+        print(f"[Worker] Rejected request: ~{estimate / 2**20:.0f} MiB estimated "
+              f"(limit {self.accountant.limit_bytes / 2**20:.0f} MiB)")
+        body = json.dumps({"detail": f"Request too large: about {estimate // 2**20} MiB needed, "
+                                     f"limit {self.accountant.limit_bytes // 2**20} MiB; "
+                                     f"split the candidates over several requests"}).encode()
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode()),
+                                (b"connection", b"close")]})
+        await send({"type": "http.response.body", "body": body})
+
+
+# Global instance
+_accountant: Optional[MemoryAccountant] = None
+
+
+def get_memory_accountant() -> MemoryAccountant:
+    global _accountant
+    if _accountant is None:
+        from config import get_settings
+        settings = get_settings()
+        _accountant = MemoryAccountant(
+            settings.REQUEST_MEMORY_BUDGET_BYTES,
+            settings.REQUEST_MEMORY_LIMIT_BYTES,
+            settings.MEMORY_BYTES_PER_BODY_BYTE,
+            settings.MEMORY_SAMPLE_RATE,
+        )
+    return _accountant
@@ -0,0 +1,84 @@
+"""
+In-process metrics for the matching worker.
+
+A tiny thread-safe registry of counters, gauges and summaries. The
+snapshot is served as JSON from GET /metrics so the Node server (or a
+human with curl) can see what the worker is doing without a full
+monitoring stack.
+"""
+
+import threading
+from collections import defaultdict, deque
+from typing import Dict, Any
+
+
+# Number of recent observations kept per summary for percentiles
+SUMMARY_WINDOW = 1024
+
+
+class Metrics:
+    """Counters, gauges and windowed summaries keyed by name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, float] = {}
+        self._summaries: Dict[str, deque] = {}
+        self._summary_totals: Dict[str, list] = {}
+
+    def inc(self, name: str, value: float = 1.0) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        """Record one observation (latency, ratio, size...)."""
+        with self._lock:
+            window = self._summaries.get(name)
+            if window is None:
+                window = self._summaries[name] = deque(maxlen=SUMMARY_WINDOW)
+                self._summary_totals[name] = [0, 0.0]
+            window.append(value)
+            totals = self._summary_totals[name]
+            totals[0] += 1
+            totals[1] += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            summaries = {}
+            for name, window in self._summaries.items():
+                values = sorted(window)
+                count, total = self._summary_totals[name]
+                summaries[name] = {
+                    "count": count,
+                    "mean": round(total / count, 6) if count else 0.0,
+                    "p50": _percentile(values, 0.50),
+                    "p99": _percentile(values, 0.99),
+                    "max": values[-1] if values else 0.0,
+                }
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "summaries": summaries,
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._summaries.clear()
+            self._summary_totals.clear()
+
+
+def _percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[idx]
+
+
+# Global instance
+metrics = Metrics()
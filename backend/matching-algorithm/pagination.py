@@ -0,0 +1,168 @@
+"""
+Server-side ranked lists behind match cursors.
+
+A match request with `paginate` ranks up to PAGINATION_MAX_DEPTH
+candidates once, returns the first page and keeps the rest of the
+ranking here as three compact arrays (item ids, match scores, name
+similarities). Each further page is cut from the stored list and served
+with the stored scores; its full results are rebuilt from the stored
+similarity and the caller's candidate data, without scoring again.
+
+The caller sends its candidates with every page request (it has them
+anyway), and the list remembers a fingerprint of the query and the
+candidate set it was ranked over. Any change (an item added, removed or
+edited, a moved org, another radius) makes the cursor fail with 409
+instead of paging through a stale ranking.
+
+Lists expire after PAGINATION_TTL_SECONDS; when the store exceeds
+PAGINATION_MAX_BYTES the oldest lists are evicted first. Lists live in
+the worker process that ranked them: behind several workers, a page
+request that reaches another process gets 410 and starts over.
+"""
+
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from metrics import metrics
+
+# Rough per-list overhead (object, dict entry, id string) on top of the arrays
+_LIST_OVERHEAD_BYTES = 200
+
+
+class CursorError(Exception):
+    """A cursor that cannot be continued; `status` is the HTTP status to answer with."""
+
+    def __init__(self, status: int, reason: str):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+
+
+class RankedList:
+    """
+    One request's ranking: item ids best first, their match scores and
+    name similarities, and what it was ranked over.
+    """
+
+    __slots__ = ("ids", "scores", "similarities", "fingerprint", "partial", "degraded", "expires_at")
+
+    def __init__(self, ids: np.ndarray, scores: np.ndarray, similarities: np.ndarray, fingerprint: str,
+                 partial: bool, degraded: Optional[str], expires_at: float):
+        self.ids = ids
+        self.scores = scores
+        self.similarities = similarities
+        self.fingerprint = fingerprint
+        self.partial = partial
+        self.degraded = degraded
+        self.expires_at = expires_at
+
+    @property
+    def nbytes(self) -> int:
+        return self.ids.nbytes + self.scores.nbytes + self.similarities.nbytes + _LIST_OVERHEAD_BYTES
+
+
+class RankedListStore:
+    """Ranked lists by id, with TTL expiry and a total memory bound (oldest evicted first)."""
+
+    def __init__(self, ttl_seconds: float, max_bytes: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lists: "OrderedDict[str, RankedList]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._lists)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def put(self, ids: List[int], scores: List[float], similarities: List[float], fingerprint: str,
+            partial: bool = False, degraded: Optional[str] = None) -> str:
+        ranked = RankedList(
+            np.asarray(ids, dtype=np.int64),
+            np.asarray(scores, dtype=np.float32),
+            np.asarray(similarities, dtype=np.float32),
+            fingerprint, partial, degraded,
+            time.monotonic() + self.ttl_seconds,
+        )
+        list_id = secrets.token_urlsafe(12)
+        with self._lock:
+            self._expire()
+            self._lists[list_id] = ranked
+            self._bytes += ranked.nbytes
+            while self._bytes > self.max_bytes and len(self._lists) > 1:
+                self._drop(next(iter(self._lists)))
+                metrics.inc("pagination.evicted")
+            metrics.set_gauge("pagination.lists", len(self._lists))
+            metrics.set_gauge("pagination.bytes", self._bytes)
+        metrics.inc("pagination.lists_created")
+        return list_id
+
+    def get(self, list_id: str) -> Optional[RankedList]:
+        with self._lock:
+            self._expire()
+            return self._lists.get(list_id)
+
+    def page(self, cursor: str, fingerprint: str, page_size: int) -> Tuple[RankedList, slice, Optional[str]]:
+        """
+        Rows of the ranking on the page a cursor points at and the cursor
+        of the page after it (None at the end). Raises CursorError for unknown, expired or
+        malformed cursors (410) and for a changed candidate set (409).
+        """
+        list_id, _, offset_text = cursor.partition(".")
+        if not offset_text.isdigit():
+            raise CursorError(400, "Malformed cursor")
+        ranked = self.get(list_id)
+        if ranked is None:
+            metrics.inc("pagination.expired")
+            raise CursorError(410, "Cursor expired or unknown; repeat the request without a cursor")
+        if ranked.fingerprint != fingerprint:
+            metrics.inc("pagination.conflicts")
+            raise CursorError(409, "Candidates changed since the cursor was created; repeat the request without a cursor")
+        offset = int(offset_text)
+        end = offset + page_size
+        metrics.inc("pagination.pages")
+        return ranked, slice(offset, end), cursor_for(list_id, end) if end < len(ranked.ids) else None
+
+    def _expire(self) -> None:
+        # Insertion order is expiry order (same TTL for every list)
+        now = time.monotonic()
+        while self._lists:
+            list_id, ranked = next(iter(self._lists.items()))
+            if ranked.expires_at > now:
+                break
+            self._drop(list_id)
+
+    def _drop(self, list_id: str) -> None:
+        ranked = self._lists.pop(list_id)
+        self._bytes -= ranked.nbytes
+
+
+def cursor_for(list_id: str, offset: int) -> str:
+    return f"{list_id}.{offset}"
+
+
+def request_fingerprint(request, include: set) -> str:
+    """Digest of the request fields a ranking depends on (query, radius, candidates)."""
+    return hashlib.blake2b(request.model_dump_json(include=include).encode(), digest_size=16).hexdigest()
+
+
+# Global instance
+_ranked_lists: Optional[RankedListStore] = None
+
+
+def get_ranked_lists() -> RankedListStore:
+    global _ranked_lists
+    if _ranked_lists is None:
+        from config import get_settings
+        settings = get_settings()
+        _ranked_lists = RankedListStore(settings.PAGINATION_TTL_SECONDS, settings.PAGINATION_MAX_BYTES)
+    return _ranked_lists
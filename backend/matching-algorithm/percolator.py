@@ -0,0 +1,189 @@
+"""
+Percolator: open items as standing queries.
+
+A match request asks "which candidates fit this item?". When an item is
+posted the question is reversed: "whose search would this item now show
+up in, with at least min_score?". The percolator answers it without
+scanning every open item of the other side. Each open item is registered
+as a standing query (its text, category, price and search circle) and
+indexed by:
+
+    - geography: every grid cell (PERCOLATOR_CELL_KM wide) its search
+      circle touches, so a new item only looks at the queries covering
+      its own cell
+    - text and category: a TokenIndex over the standing queries' texts,
+      i.e. the same canonical-token / trigram / category rule as the
+      match prefilter (purely semantic matches are not retrieved)
+    - price ceiling: a supply priced so far over a demand's budget that
+      even perfect similarity, distance and quantity cannot reach
+      min_score is dropped before scoring
+
+The survivors are scored with the normal match scoring, from the
+standing query's side (its text, its radius), so a reported score is the
+one that item's own search would show.
+"""
+
+import math
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from metrics import metrics
+from token_index import TokenIndex
+from utils import build_rich_text, calculate_distance, max_price_overage
+
+Cell = Tuple[int, int]
+
+KM_PER_DEGREE = 111.0
+
+
+class StandingQuery(NamedTuple):
+    item: Any                # SupplyData / DemandData
+    org: Any                 # OrgData
+    radius: float
+    text: str
+    cells: Tuple[Cell, ...]  # empty: registered as "wide" (checked for every item)
+
+
+class Percolator:
+    """
+    Standing queries of one kind ("supply" or "demand").
+
+    `score(query, query_text, rows, radius)` is the match scoring for
+    (item, org, distance_km, item_text) rows, returning a result with
+    `match_score` (or None) per row.
+    """
+
+    # A circle touching more cells than this is kept in the "wide" list instead
+    MAX_CELLS_PER_QUERY = 1024
+
+    def __init__(self, kind: str, score: Callable[[Any, str, list, float], list],
+                 cell_km: float = 50.0, price_tolerance: float = 0.25):
+        self.kind = kind
+        self.score = score
+        self.cell_deg = max(cell_km, 1e-3) / KM_PER_DEGREE
+        self.price_tolerance = price_tolerance
+        self._lock = threading.RLock()
+        self._queries: Dict[int, StandingQuery] = {}
+        self._cells: Dict[Cell, Set[int]] = {}
+        self._wide: Set[int] = set()
+        self._text = TokenIndex()
+
+    def __len__(self) -> int:
+        return len(self._queries)
+
+    def __contains__(self, item_id: int) -> bool:
+        return item_id in self._queries
+
+    def ids(self) -> List[int]:
+        with self._lock:
+            return list(self._queries)
+
+    # ── Updates ────────────────────────────────────────────────
+
+    def upsert(self, item_id: int, item, org, radius: float) -> None:
+        """Register (or replace) the standing query of one open item."""
+        text = build_rich_text(item.item_name, item.item_description, item.item_category)
+        cells = self.covering_cells(org.latitude, org.longitude, radius)
+        if len(cells) > self.MAX_CELLS_PER_QUERY:
+            cells = ()
+        with self._lock:
+            self._unlink(item_id)
+            self._queries[item_id] = StandingQuery(item, org, radius, text, cells)
+            for cell in cells:
+                self._cells.setdefault(cell, set()).add(item_id)
+            if not cells:
+                self._wide.add(item_id)
+            self._text.upsert(item_id, text, item.category_id, item.item_category)
+        metrics.set_gauge(f"percolator.{self.kind}.standing", len(self._queries))
+
+    def remove(self, item_id: int) -> bool:
+        with self._lock:
+            found = self._unlink(item_id)
+            if found:
+                self._text.remove(item_id)
+        metrics.set_gauge(f"percolator.{self.kind}.standing", len(self._queries))
+        return found
+
+    def _unlink(self, item_id: int) -> bool:
+        previous = self._queries.pop(item_id, None)
+        if previous is None:
+            return False
+        for cell in previous.cells:
+            ids = self._cells.get(cell)
+            if ids is not None:
+                ids.discard(item_id)
+                if not ids:
+                    del self._cells[cell]
+        self._wide.discard(item_id)
+        return True
+
+    # ── Queries ────────────────────────────────────────────────
+
+    def cell_of(self, latitude: float, longitude: float) -> Cell:
+        return math.floor(latitude / self.cell_deg), math.floor(longitude / self.cell_deg)
+
+    def covering_cells(self, latitude: float, longitude: float, radius_km: float) -> Tuple[Cell, ...]:
+        """Every cell a search circle can touch (a superset; distance is checked when scoring)."""
+        lat_cells = math.ceil(radius_km / KM_PER_DEGREE / self.cell_deg)
+        # Longitude degrees shrink towards the poles
+        cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+        lon_cells = min(math.ceil(lat_cells / cos_lat), math.ceil(360 / self.cell_deg))
+        row, col = self.cell_of(latitude, longitude)
+        return tuple(
+            (r, c)
+            for r in range(row - lat_cells, row + lat_cells + 1)
+            for c in range(col - lon_cells, col + lon_cells + 1)
+        )
+
+    def candidates(self, item, org, item_text: str, min_score: float) -> List[int]:
+        """Standing queries that pass the geography, text/category and price filters."""
+        with self._lock:
+            near = self._cells.get(self.cell_of(org.latitude, org.longitude), set()) | self._wide
+            if not near:
+                return []
+            hits = self._text.lookup(item_text, item.category_id, item.item_category) & near
+            candidates = [i for i in hits if self._queries[i].org.org_id != org.org_id]
+
+            overage = max_price_overage(min_score, self.price_tolerance)
+            kept = candidates
+            if overage is not None:
+                kept = [i for i in candidates if self._affordable(self._queries[i].item, item, overage)]
+        metrics.observe("percolator.geo_candidates", len(near))
+        metrics.observe("percolator.text_candidates", len(candidates))
+        metrics.inc("percolator.price_pruned", len(candidates) - len(kept))
+        return kept
+
+    @staticmethod
+    def _affordable(query, item, overage: float) -> bool:
+        """False if the supply's price is more than `overage` over the demand's budget."""
+        supply, demand = (query, item) if hasattr(query, "price_per_unit") else (item, query)
+        price, ceiling = supply.price_per_unit, demand.max_price_per_unit
+        if not price or price <= 0 or not ceiling or ceiling <= 0:
+            return True  # budget unknown or price negotiable: scored without a price penalty
+        return price <= ceiling * (1.0 + overage)
+
+    def percolate(self, item, org, min_score: float, limit: Optional[int] = None) -> Tuple[list, int]:
+        """
+        Standing queries `item` (of the opposite kind) qualifies for:
+        [(query item_id, query org_id, match_score, distance_km)], best
+        first, plus the number of standing queries that were scored.
+        """
+        item_text = build_rich_text(item.item_name, item.item_description, item.item_category)
+        with self._lock:
+            queries = [(i, self._queries[i]) for i in self.candidates(item, org, item_text, min_score)]
+
+        matches = []
+        examined = 0
+        for query_id, query in queries:
+            distance_km = calculate_distance(query.org.latitude, query.org.longitude, org.latitude, org.longitude)
+            if distance_km > query.radius:
+                continue
+            examined += 1
+            result = self.score(query.item, query.text, [(item, org, distance_km, item_text)], query.radius)[0]
+            if result is not None and result.match_score >= min_score:
+                matches.append((query_id, query.org.org_id, result.match_score, result.distance_km))
+
+        matches.sort(key=lambda m: (-m[2], m[0]))
+        metrics.observe("percolator.examined", examined)
+        metrics.observe("percolator.matches", len(matches))
+        return matches[:limit] if limit else matches, examined
@@ -0,0 +1,383 @@
+"""
+Materialized match view: background precomputation of top-K results.
+
+Item change events (upsert/delete of a supply or demand) are consumed
+from a queue, coalesced per item, and applied to an in-memory catalog of
+active items. Every item whose ranking could have changed — the item
+itself plus opposite-side items whose search radius covers it, found
+through a lat/lon grid rather than a catalog scan — is marked dirty and
+recomputed in the background with the normal match pipeline. A
+user-facing search then reads its precomputed answer with a single dict
+lookup.
+
+Queues:
+    MemoryChangeQueue — bounded in-process queue (tests, single node)
+    FileChangeQueue   — JSONL file with a committed offset, compacted on ack
+
+Backpressure: queues are bounded and `submit` returns False when full
+(the HTTP layer turns that into 429); the consumer also stops draining
+while too many recomputations are outstanding.
+
+Recomputations run as bulk jobs on the priority scheduler, one item per
+slot, so a full rebuild never starves interactive searches.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from allocation import RegionGrid
+from metrics import metrics
+from utils import calculate_distance
+
+
+class ChangeEvent(NamedTuple):
+    op: str                      # "upsert" | "delete"
+    kind: str                    # "supply" | "demand"
+    item_id: int
+    item: Optional[dict] = None  # SupplyData / DemandData fields (upsert only)
+    org: Optional[dict] = None   # OrgData fields (upsert only)
+    enqueued_at: float = 0.0
+
+
+# ═══════════════════════════════════════════════════════════════
+# Change queues
+# ═══════════════════════════════════════════════════════════════
+
+class MemoryChangeQueue:
+    """Bounded in-memory change queue."""
+
+    def __init__(self, maxsize: int = 10000):
+        self._queue: "queue.Queue[ChangeEvent]" = queue.Queue(maxsize)
+
+    def put(self, event: ChangeEvent) -> bool:
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            return False
+
+    def get_batch(self, max_items: int, timeout: float) -> List[ChangeEvent]:
+        """Block up to `timeout` for the first event, then drain without waiting."""
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < max_items:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def ack(self) -> None:
+        pass
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+
+class FileChangeQueue:
+    """
+    JSONL change log with a committed read offset, so events survive a
+    worker restart. `ack()` commits everything read so far.
+
+    The consumed prefix is dropped on ack: the file is truncated once the
+    reader has caught up, or the unread tail is copied to a fresh file
+    once the offset passes `compact_bytes`. The offset is reset before
+    the file is swapped, so a crash in between replays events (harmless,
+    last write wins) rather than losing them.
+    """
+
+    def __init__(self, path: str, maxsize: int = 100000, compact_bytes: int = 16 * 1024 * 1024):
+        self.path = path
+        self.offset_path = f"{path}.offset"
+        self.maxsize = maxsize
+        self.compact_bytes = compact_bytes
+        self._lock = threading.Lock()
+        self._read_offset = self._load_offset()
+        self._pending = self._count_pending()
+
+    def _load_offset(self) -> int:
+        try:
+            with open(self.offset_path) as f:
+                offset = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        return offset if offset <= size else 0
+
+    def _count_pending(self) -> int:
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, "rb") as f:
+            f.seek(self._read_offset)
+            return sum(1 for _ in f)
+
+    def _write_offset(self, offset: int) -> None:
+        tmp_path = f"{self.offset_path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(offset))
+        os.replace(tmp_path, self.offset_path)
+
+    def _compact(self) -> None:
+        """Drop the consumed prefix of the log (caller holds the lock)."""
+        tmp_path = f"{self.path}.tmp"
+        with open(self.path, "rb") as src, open(tmp_path, "wb") as dst:
+            src.seek(self._read_offset)
+            while True:
+                chunk = src.read(1 << 20)
+                if not chunk:
+                    break
+                dst.write(chunk)
+        self._write_offset(0)
+        os.replace(tmp_path, self.path)
+        self._read_offset = 0
+        metrics.inc("precompute.queue_compactions")
+
+    def put(self, event: ChangeEvent) -> bool:
+        with self._lock:
+            if self._pending >= self.maxsize:
+                return False
+            with open(self.path, "a") as f:
+                f.write(json.dumps(event._asdict()) + "\n")
+            self._pending += 1
+            return True
+
+    def get_batch(self, max_items: int, timeout: float) -> List[ChangeEvent]:
+        with self._lock:
+            batch = []
+            if os.path.exists(self.path):
+                with open(self.path, "rb") as f:
+                    f.seek(self._read_offset)
+                    while len(batch) < max_items:
+                        line = f.readline()
+                        if not line.endswith(b"\n"):
+                            break  # nothing more, or a line still being written
+                        batch.append(ChangeEvent(**json.loads(line)))
+                        self._read_offset = f.tell()
+            self._pending -= len(batch)
+        if not batch:
+            time.sleep(timeout)
+        return batch
+
+    def ack(self) -> None:
+        with self._lock:
+            if self._read_offset and os.path.exists(self.path):
+                caught_up = self._read_offset >= os.path.getsize(self.path)
+                if caught_up or self._read_offset >= self.compact_bytes:
+                    self._compact()
+                    return
+            self._write_offset(self._read_offset)
+
+    def qsize(self) -> int:
+        return self._pending
+
+
+# ═══════════════════════════════════════════════════════════════
+# Materialized view
+# ═══════════════════════════════════════════════════════════════
+
+class MaterializedEntry(NamedTuple):
+    results: list
+    computed_at: float
+
+
+OPPOSITE = {"supply": "demand", "demand": "supply"}
+
+
+class MaterializedView:
+    """
+    Keeps a top-K list per active supply and demand up to date.
+
+    `parse(kind, item_dict, org_dict)` turns event payloads into the
+    worker's item/org models; `score(query, query_org, candidates, radius)`
+    is the match pipeline returning the ranked results. With a
+    `scheduler`, each recomputation holds a bulk slot.
+    """
+
+    def __init__(
+        self,
+        change_queue,
+        parse: Callable[[str, dict, dict], Tuple[Any, Any]],
+        score: Callable[[Any, Any, list, float], list],
+        default_radius: float = 50.0,
+        batch_size: int = 500,
+        batch_window: float = 0.5,
+        recompute_chunk: int = 50,
+        max_dirty: int = 5000,
+        scheduler=None,
+    ):
+        self.queue = change_queue
+        self.parse = parse
+        self.score = score
+        self.default_radius = default_radius
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.recompute_chunk = recompute_chunk
+        self.max_dirty = max_dirty
+        self.scheduler = scheduler
+        self._lock = threading.Lock()
+        self.items: Dict[str, Dict[int, Tuple[Any, Any]]] = {"supply": {}, "demand": {}}
+        self.views: Dict[Tuple[str, int], MaterializedEntry] = {}
+        self.dirty: Dict[Tuple[str, int], float] = {}
+        # Items bucketed by org location, for finding the items a change can affect
+        self.grids = {kind: RegionGrid(default_radius) for kind in self.items}
+        self._max_radius = {kind: default_radius for kind in self.items}
+
+    # ── Producer side ──────────────────────────────────────────
+
+    def submit(self, event: ChangeEvent) -> bool:
+        """Enqueue one change; False means the queue is full (back off)."""
+        if not event.enqueued_at:
+            event = event._replace(enqueued_at=time.time())
+        accepted = self.queue.put(event)
+        if not accepted:
+            metrics.inc("precompute.events_rejected")
+        return accepted
+
+    # ── Reader side ────────────────────────────────────────────
+
+    def get(self, kind: str, item_id: int) -> Optional[Tuple[MaterializedEntry, bool]]:
+        """Precomputed entry plus whether a recompute for it is pending."""
+        key = (kind, item_id)
+        entry = self.views.get(key)
+        if entry is None:
+            return None
+        return entry, key in self.dirty
+
+    # ── Consumer side ──────────────────────────────────────────
+
+    def _radius(self, kind: str, item) -> float:
+        if kind == "supply" and getattr(item, "search_radius", None):
+            return item.search_radius
+        return self.default_radius
+
+    def _mark_dirty(self, key: Tuple[str, int], now: float) -> None:
+        self.dirty.setdefault(key, now)
+
+    def _index(self, kind: str, item_id: int, item, org) -> None:
+        self.grids[kind].add(item_id, org.latitude, org.longitude)
+        # Only ever grows, so near() keeps returning a superset after deletes
+        self._max_radius[kind] = max(self._max_radius[kind], self._radius(kind, item))
+
+    def _unindex(self, kind: str, item_id: int, org) -> None:
+        self.grids[kind].remove(item_id, org.latitude, org.longitude)
+
+    def _mark_affected(self, kind: str, org, now: float) -> None:
+        """Opposite-side items whose search circle contains `org`."""
+        other = OPPOSITE[kind]
+        nearby = self.grids[other].near(org.latitude, org.longitude, self._max_radius[other])
+        for other_id in nearby:
+            other_item, other_org = self.items[other][other_id]
+            if other_org.org_id == org.org_id:
+                continue
+            distance = calculate_distance(org.latitude, org.longitude, other_org.latitude, other_org.longitude)
+            if distance <= self._radius(other, other_item):
+                self._mark_dirty((other, other_id), now)
+
+    def apply_events(self, events: List[ChangeEvent]) -> None:
+        """Coalesce a burst of events (last write wins) and update the catalog."""
+        latest: Dict[Tuple[str, int], ChangeEvent] = {}
+        for event in events:
+            latest[(event.kind, event.item_id)] = event
+
+        now = time.time()
+        for (kind, item_id), event in latest.items():
+            previous = self.items[kind].get(item_id)
+            if event.op == "delete":
+                if previous is None:
+                    continue
+                del self.items[kind][item_id]
+                self._unindex(kind, item_id, previous[1])
+                with self._lock:
+                    self.views.pop((kind, item_id), None)
+                    self.dirty.pop((kind, item_id), None)
+                self._mark_affected(kind, previous[1], event.enqueued_at or now)
+            else:
+                item, org = self.parse(kind, event.item, event.org)
+                if previous is not None:
+                    self._unindex(kind, item_id, previous[1])
+                self.items[kind][item_id] = (item, org)
+                self._index(kind, item_id, item, org)
+                self._mark_dirty((kind, item_id), event.enqueued_at or now)
+                self._mark_affected(kind, org, event.enqueued_at or now)
+                if previous is not None and previous[1].org_id != org.org_id:
+                    self._mark_affected(kind, previous[1], event.enqueued_at or now)
+
+        metrics.inc("precompute.events_applied", len(events))
+        metrics.observe("precompute.coalesced_batch", len(latest))
+
+    def recompute(self, key: Tuple[str, int]) -> None:
+        kind, item_id = key
+        entry = self.items[kind].get(item_id)
+        if entry is None:
+            self.dirty.pop(key, None)
+            return
+        item, org = entry
+        other = OPPOSITE[kind]
+        radius = self._radius(kind, item)
+        # Grid cells the search circle touches (the pipeline filters by distance)
+        nearby = sorted(self.grids[other].near(org.latitude, org.longitude, radius))
+        candidates = [
+            (other_item, other_org)
+            for other_item, other_org in (self.items[other][other_id] for other_id in nearby)
+            if other_org.org_id != org.org_id
+        ]
+        results = self.score(item, org, candidates, radius)
+        now = time.time()
+        with self._lock:
+            self.views[key] = MaterializedEntry(results, now)
+            dirty_since = self.dirty.pop(key, now)
+        metrics.observe("precompute.staleness_ms", (now - dirty_since) * 1000)
+
+    def process_pending(self, timeout: float = 0.0) -> int:
+        """
+        One consumer step: drain a batch of events (unless too much work is
+        already outstanding), then recompute up to `recompute_chunk` of the
+        stalest dirty items. Returns the number of items recomputed.
+        """
+        if len(self.dirty) < self.max_dirty:
+            events = self.queue.get_batch(self.batch_size, timeout)
+            if events:
+                # Give bursts a moment to accumulate so they coalesce
+                if len(events) < self.batch_size and self.batch_window:
+                    time.sleep(self.batch_window)
+                    events += self.queue.get_batch(self.batch_size - len(events), 0.0)
+                self.apply_events(events)
+                self.queue.ack()
+
+        stalest = sorted(self.dirty.items(), key=lambda kv: kv[1])[:self.recompute_chunk]
+        for key, _ in stalest:
+            try:
+                if self.scheduler is not None:
+                    self.scheduler.run("bulk", self.recompute, key)
+                else:
+                    self.recompute(key)
+            except Exception as e:
+                print(f"[Precompute] Recompute failed for {key}: {e}")
+                self.dirty.pop(key, None)
+
+        self._publish()
+        return len(stalest)
+
+    def _publish(self) -> None:
+        metrics.set_gauge("precompute.queue_depth", self.queue.qsize())
+        metrics.set_gauge("precompute.dirty", len(self.dirty))
+        metrics.set_gauge("precompute.materialized", len(self.views))
+        oldest = min(self.dirty.values(), default=None)
+        metrics.set_gauge("precompute.max_staleness_s", round(time.time() - oldest, 3) if oldest else 0.0)
+
+    def run_forever(self, stop: threading.Event) -> None:
+        while not stop.is_set():
+            try:
+                self.process_pending(timeout=self.batch_window)
+            except Exception as e:
+                print(f"[Precompute] Consumer error: {e}")
+                time.sleep(self.batch_window)
@@ -0,0 +1,301 @@
+"""
+On-demand request profiling with collapsed-stack (flamegraph) output.
+
+A statistical profiler: while a profiled request runs, one background
+thread wakes every PROFILE_INTERVAL_MS, grabs the stacks of the threads
+serving that request (sys._current_frames) and counts them. Nothing is
+traced or instrumented, so the profiled request runs at normal speed.
+The sampler does change one process-wide setting: while any profile is
+active, sys.setswitchinterval is lowered to the sampling interval so
+the sampler gets the GIL on time, which makes every thread in the
+process (other requests included) switch more often.
+
+Triggers (both need PROFILE_TOKEN; without it the middleware is not even
+installed and profiling costs nothing):
+
+    - header:  X-Profile: <token>   profiles that one request
+    - admin:   POST /admin/profile  profiles the next N requests on a path
+
+The response carries X-Profile-Id and an X-Profile-Summary of tagged
+time. GET /admin/profiles/{id} returns the collapsed stacks, one
+"frame;frame;frame count" line per stack, the input of flamegraph.pl,
+speedscope and inferno.
+
+Samples are tagged by the innermost frame of interest: string/hybrid
+similarity, token overlap, embedding HTTP calls, pydantic
+(de)serialization, and idle (waiting on I/O or locks).
+The event-loop thread is shared by concurrent requests, so its samples
+may include a little of their work too.
+
+A request runs on several threads (event loop, thread pool), so the
+collapsed stacks count per-thread samples. The tagged times are wall
+time instead: each tick stands for the time since the previous one
+(the sampler can run late), idle threads are ignored if another thread
+of the request is busy, and the busy threads split that time, so
+`tags_ms` adds up to roughly the request's duration.
+"""
+
+import contextvars
+import hmac
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional
+
+from metrics import metrics
+
+# (module, function) → tag; the innermost tagged frame of a sample wins
+_FUNCTION_TAGS = {
+    ("utils", "calculate_token_overlap"): "token_overlap",
+    ("semantic_search", "fetch_embedding"): "embedding_http",
+    ("semantic_search", "_get_hf_embedding"): "embedding_http",
+    ("semantic_search", "_get_openai_embedding"): "embedding_http",
+    ("utils", "calculate_string_similarity"): "similarity",
+    ("utils", "calculate_string_similarity_batch"): "similarity",
+    ("utils", "calculate_hybrid_similarity"): "similarity",
+    ("utils", "calculate_hybrid_similarity_batch"): "similarity",
+    ("fastapi.routing", "serialize_response"): "pydantic",
+    ("fastapi.dependencies.utils", "request_body_to_args"): "pydantic",
+    ("fastapi.encoders", "jsonable_encoder"): "pydantic",
+    # Blocked, not running: event loop waiting for I/O, threads waiting on locks
+    ("selectors", "select"): "idle",
+    ("threading", "wait"): "idle",
+}
+_MODULE_TAGS = (("pydantic", "pydantic"),)
+
+
+def _tag(frames: List[tuple]) -> str:
+    for module, function in reversed(frames):
+        tag = _FUNCTION_TAGS.get((module, function))
+        if tag is None:
+            for prefix, prefix_tag in _MODULE_TAGS:
+                if module == prefix or module.startswith(prefix + "."):
+                    tag = prefix_tag
+                    break
+        if tag is not None:
+            return tag
+    return "other"
+
+
+class ProfileSession:
+    """Samples collected for one profiled request."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, path: str, interval_seconds: float):
+        self.id = f"{int(time.time())}-{next(self._ids)}"
+        self.path = path
+        self.interval_seconds = interval_seconds
+        self.started = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.threads: set = set()
+        self.stacks: Counter = Counter()
+        self.tags: Counter = Counter()   # wall-clock seconds per tag
+        self.samples = 0
+
+    def sample(self, frames_by_thread: dict, elapsed: float) -> None:
+        """Record one tick; `elapsed` is the wall time since the previous tick."""
+        tags = []
+        for thread_id in list(self.threads):
+            frame = frames_by_thread.get(thread_id)
+            if frame is None:
+                continue
+            frames = []
+            while frame is not None:
+                frames.append((frame.f_globals.get("__name__", "?"), frame.f_code.co_name))
+                frame = frame.f_back
+            frames.reverse()
+            self.stacks[";".join(f"{module}:{function}" for module, function in frames)] += 1
+            tags.append(_tag(frames))
+            self.samples += 1
+        # The tick's wall time: shared by the busy threads, else one idle
+        counted = [tag for tag in tags if tag != "idle"] or tags[:1]
+        for tag in counted:
+            self.tags[tag] += elapsed / len(counted)
+
+    def tag_ms(self) -> Dict[str, float]:
+        return {tag: round(seconds * 1000, 1) for tag, seconds in self.tags.most_common()}
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "path": self.path,
+            "duration_ms": self.duration_ms,
+            "samples": self.samples,
+            "interval_ms": self.interval_seconds * 1000,
+            "tags_ms": self.tag_ms(),
+        }
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("profile_session", default=None)
+
+
+class Profiler:
+    """Owns the sampling thread, armed request budgets and finished profiles."""
+
+    def __init__(self, token: str, interval_ms: float, keep: int, directory: Optional[str] = None):
+        self.token = token
+        self.interval_seconds = interval_ms / 1000
+        self.keep = keep
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._active: List[ProfileSession] = []
+        self._armed: Dict[str, int] = {}
+        self._finished: "OrderedDict[str, ProfileSession]" = OrderedDict()
+        self._thread: Optional[threading.Thread] = None
+        self._switch_interval = sys.getswitchinterval()
+
+    def authorized(self, token: Optional[str]) -> bool:
+        return bool(token) and hmac.compare_digest(token, self.token)
+
+    # ── Triggers ───────────────────────────────────────────────
+
+    def arm(self, path_prefix: str, requests: int) -> None:
+        """Profile the next `requests` requests whose path starts with path_prefix."""
+        with self._lock:
+            self._armed[path_prefix] = self._armed.get(path_prefix, 0) + requests
+
+    def take_armed(self, path: str) -> bool:
+        with self._lock:
+            for prefix, remaining in self._armed.items():
+                if path.startswith(prefix):
+                    if remaining <= 1:
+                        del self._armed[prefix]
+                    else:
+                        self._armed[prefix] = remaining - 1
+                    return True
+        return False
+
+    # ── Sessions ───────────────────────────────────────────────
+
+    def start(self, path: str) -> ProfileSession:
+        session = ProfileSession(path, self.interval_seconds)
+        session.threads.add(threading.get_ident())
+        with self._lock:
+            self._active.append(session)
+            if self._thread is None or not self._thread.is_alive():
+                # The sampler needs the GIL to run; a busy thread only hands it
+                # over every switch interval (5 ms by default), so shorten it
+                # while profiling
+                self._switch_interval = sys.getswitchinterval()
+                sys.setswitchinterval(min(self._switch_interval, self.interval_seconds))
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+        return session
+
+    def stop(self, session: ProfileSession) -> None:
+        session.duration_ms = round((time.perf_counter() - session.started) * 1000, 1)
+        with self._lock:
+            if session in self._active:
+                self._active.remove(session)
+            self._finished[session.id] = session
+            while len(self._finished) > self.keep:
+                self._finished.popitem(last=False)
+        metrics.inc("profiling.requests")
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f"{session.id}.collapsed"), "w") as f:
+                f.write(session.collapsed())
+            with open(os.path.join(self.directory, f"{session.id}.json"), "w") as f:
+                json.dump(session.summary(), f, indent=2)
+
+    def _run(self) -> None:
+        # Exits once no session is active; start() launches a new one
+        last_tick = time.perf_counter()
+        while True:
+            time.sleep(self.interval_seconds)
+            now = time.perf_counter()
+            with self._lock:
+                sessions = list(self._active)
+                if not sessions:
+                    sys.setswitchinterval(self._switch_interval)
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            for session in sessions:
+                session.sample(frames, now - max(last_tick, session.started))
+            last_tick = now
+
+    def profiles(self) -> List[dict]:
+        with self._lock:
+            return [s.summary() for s in reversed(self._finished.values())]
+
+    def get(self, profile_id: str) -> Optional[ProfileSession]:
+        with self._lock:
+            return self._finished.get(profile_id)
+
+
+def attach_thread() -> None:
+    """Include the calling thread in the current request's profile, if any."""
+    session = _current.get()
+    if session is not None:
+        session.threads.add(threading.get_ident())
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware: starts a session for requests carrying a valid
+    X-Profile header or matching an armed path, and reports it in the
+    response headers. Everything else passes straight through.
+    """
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = None
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                token = value.decode()
+                break
+        path = scope["path"]
+        profiled = self.profiler.authorized(token) if token else self.profiler.take_armed(path)
+        if not profiled:
+            return await self.app(scope, receive, send)
+
+        session = self.profiler.start(path)
+        context_token = _current.set(session)
+
+        async def send_with_profile(message):
+            if message["type"] == "http.response.start" and session.duration_ms is None:
+                self.profiler.stop(session)
+                summary = ",".join(f"{tag}={ms}ms" for tag, ms in session.tag_ms().items())
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", session.id.encode()),
+                    (b"x-profile-summary", summary.encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            _current.reset(context_token)
+            if session.duration_ms is None:
+                self.profiler.stop(session)
+
+
+# Global instance
+_profiler: Optional[Profiler] = None
+
+
+def get_profiler() -> Optional[Profiler]:
+    """The profiler, or None when PROFILE_TOKEN is not set (profiling off)."""
+    global _profiler
+    if _profiler is None:
+        from config import get_settings
+        settings = get_settings()
+        if not settings.PROFILE_TOKEN:
+            return None
+        _profiler = Profiler(settings.PROFILE_TOKEN, settings.PROFILE_INTERVAL_MS,
+                             settings.PROFILE_KEEP, settings.PROFILE_DIR)
+    return _profiler
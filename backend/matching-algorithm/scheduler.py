@@ -0,0 +1,114 @@
+"""
+Priority scheduler for CPU-bound scoring work.
+
+Two priority classes share the worker's scoring slots:
+
+    interactive — a user is waiting on /match/* (priority 0)
+    bulk        — precompute rebuilds and other background jobs (priority 1)
+
+A job runs only when its class is under its own concurrency limit, the
+total slot budget is not exhausted, and no higher-priority job is
+waiting. Bulk work is chunked: at every chunk boundary it calls
+`checkpoint()`, which hands the slot to a waiting interactive job and
+re-queues the bulk job behind it. Queue-wait time per class is exported
+in /metrics.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from metrics import metrics
+
+
+PRIORITIES = {"interactive": 0, "bulk": 1}
+
+
+class PriorityScheduler:
+    """Per-class concurrency limits with strict priority between classes."""
+
+    def __init__(self, total_slots: int, limits: Dict[str, int]):
+        self.total_slots = total_slots
+        self.limits = limits
+        self._cond = threading.Condition()
+        self._running = {name: 0 for name in PRIORITIES}
+        self._waiting = {name: 0 for name in PRIORITIES}
+        self._local = threading.local()
+
+    def _can_run(self, name: str) -> bool:
+        if self._running[name] >= self.limits[name]:
+            return False
+        if sum(self._running.values()) >= self.total_slots:
+            return False
+        rank = PRIORITIES[name]
+        return not any(self._waiting[other] for other, r in PRIORITIES.items() if r < rank)
+
+    def _acquire(self, name: str) -> float:
+        start = time.monotonic()
+        with self._cond:
+            self._waiting[name] += 1
+            try:
+                while not self._can_run(name):
+                    self._cond.wait()
+            finally:
+                self._waiting[name] -= 1
+            self._running[name] += 1
+            metrics.set_gauge(f"scheduler.{name}.running", self._running[name])
+        waited = time.monotonic() - start
+        metrics.observe(f"scheduler.{name}.queue_wait_ms", waited * 1000)
+        return waited
+
+    def _release(self, name: str) -> None:
+        with self._cond:
+            self._running[name] -= 1
+            metrics.set_gauge(f"scheduler.{name}.running", self._running[name])
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, name: str):
+        """Hold one scoring slot of class `name` for the duration of the block."""
+        self._acquire(name)
+        previous = getattr(self._local, "current", None)
+        self._local.current = name
+        try:
+            yield
+        finally:
+            self._local.current = previous
+            self._release(name)
+
+    def run(self, name: str, fn: Callable, *args, **kwargs):
+        with self.slot(name):
+            return fn(*args, **kwargs)
+
+    def checkpoint(self) -> None:
+        """
+        Chunk boundary for the calling thread's job. If a higher-priority
+        job is waiting, give up the slot and queue again behind it.
+        """
+        name: Optional[str] = getattr(self._local, "current", None)
+        if name is None:
+            return
+        rank = PRIORITIES[name]
+        with self._cond:
+            preempt = any(self._waiting[other] for other, r in PRIORITIES.items() if r < rank)
+        if preempt:
+            metrics.inc(f"scheduler.{name}.preemptions")
+            self._release(name)
+            self._acquire(name)
+
+
+# Global instance
+_scheduler: Optional[PriorityScheduler] = None
+
+
+def get_scheduler() -> PriorityScheduler:
+    global _scheduler
+    if _scheduler is None:
+        from config import get_settings
+        settings = get_settings()
+        _scheduler = PriorityScheduler(
+            settings.SCHEDULER_SLOTS,
+            {"interactive": settings.INTERACTIVE_CONCURRENCY, "bulk": settings.BULK_CONCURRENCY},
+        )
+    return _scheduler
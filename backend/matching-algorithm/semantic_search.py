@@ -8,10 +8,12 @@ to understand semantic similarity.
 
 import requests
 import numpy as np
+import threading
 import time
 from typing import List, Tuple, Optional
-from functools import lru_cache
 from config import get_settings
+from metrics import metrics
+from embedding_store import EmbeddingStore, EmbeddingVersion, PCAProjection, fallback_dimension
 
 # Global settings
 settings = get_settings()
@@ -24,33 +26,148 @@ class SemanticMatcher:
     def __init__(self):
         self.provider = settings.SEMANTIC_PROVIDER
         print(f"Initializing SemanticMatcher with provider: {self.provider}")
+        self.projection = PCAProjection.load(settings.EMBEDDING_PCA_PATH) if settings.EMBEDDING_PCA_PATH else None
+        model = settings.OPENAI_MODEL if self.provider == "openai" else settings.HF_MODEL
+        # The version the settings ask for; serving may lag behind it while
+        # an embedding migration (embedding_migration.py) is running
+        self.configured_version = EmbeddingVersion.of(self.provider, model)
+        self._lock = threading.Lock()
+        # (version, store) swapped as one reference, so a request never
+        # mixes one version's store with another's model
+        self._active = (self.configured_version, self.make_store(self.configured_version))
+        self._shared_check: Tuple[Optional[int], bool] = (None, False)
+        # Circuit breaker over the embedding API (get_embedding only)
+        self._failures = 0
+        self._open_until = 0.0
+
+    @property
+    def version(self) -> EmbeddingVersion:
+        return self._active[0]
+
+    @property
+    def store(self) -> EmbeddingStore:
+        return self._active[1]
+
+    @store.setter
+    def store(self, store: EmbeddingStore) -> None:
+        self._active = (self._active[0], store)
+
+    def served(self) -> Tuple[EmbeddingVersion, EmbeddingStore]:
+        """The version being served and its store, read together."""
+        return self._active
+
+    @property
+    def model(self) -> str:
+        return self.version.model
+
+    def make_store(self, version: EmbeddingVersion) -> EmbeddingStore:
+        """An empty store for `version`'s vectors (PCA only if fitted for its dimension)."""
+        projection = self.projection
+        if projection is not None and version.dim not in (0, projection.input_dim):
+            print(f"[Embeddings] PCA projection expects dimension {projection.input_dim}, "
+                  f"{version.key} has {version.dim}: storing unprojected vectors")
+            projection = None
+        return EmbeddingStore(
+            capacity=settings.EMBEDDING_STORE_SIZE,
+            dtype=settings.EMBEDDING_STORE_DTYPE,
+            projection=projection,
+        )
+
+    def activate(self, version: EmbeddingVersion, store: EmbeddingStore) -> None:
+        """Atomically serve `version` from `store`."""
+        with self._lock:
+            self._active = (version, store)
+            self._shared_check = (None, False)
+
+    def _learn_dimension(self, version: EmbeddingVersion, dim: int) -> None:
+        with self._lock:
+            if self._active[0] == version and version.dim == 0:
+                self._active = (version._replace(dim=dim), self._active[1])
+
+    def shared_matches(self, shared) -> bool:
+        """Whether a shared generation's vectors are of the version being served."""
+        generation, matches = self._shared_check
+        if generation != shared.generation:
+            key = shared.embedding_version
+            matches = key is not None and self.version.same_as(EmbeddingVersion.parse(key))
+            self._shared_check = (shared.generation, matches)
+        return matches
+
+    def zero_vector(self) -> np.ndarray:
+        return np.zeros(fallback_dimension(self.model, self.store), dtype=np.float32)
         
-    @lru_cache(maxsize=1000)
     def get_embedding(self, text: str) -> np.ndarray:
         """
-        Get embedding for text from configured API.
-        Cached to reduce API calls.
+        Get the (normalized, possibly PCA-projected) embedding for text.
+        Cached in the quantized embedding store to reduce API calls.
         """
         if not text:
-            return np.zeros(384) # Default size for MiniLM
+            return self.zero_vector()
             
         text = text.lower().strip()
-        
+        version, store = self._active
+
+        # Multi-process mode: read-only vector from the shared generation
+        # (only if it holds vectors of the version being served)
+        from shared_state import get_shared_state
+        shared = get_shared_state()
+        if shared is not None and self.shared_matches(shared):
+            vec = shared.embedding(text)
+            if vec is not None:
+                return vec
+
+        cached = store.get(text)
+        if cached is not None:
+            return cached
+        if time.monotonic() < self._open_until:
+            metrics.inc("embedding.breaker_skipped")
+            return self.zero_vector()
+        raw = self.fetch_embedding(text, version)
+        if raw is None:
+            # Not cached, so a transient API error is retried on the next call
+            self._record_failure(version)
+            return self.zero_vector()
+        self._failures = 0
+        if version.dim == 0:
+            self._learn_dimension(version, len(raw))
+        return store.put(text, raw)
+
+    def _record_failure(self, version: EmbeddingVersion) -> None:
+        """Count a failed API call; open the breaker after too many in a row."""
+        if version.provider not in ("openai", "huggingface"):
+            return
+        with self._lock:
+            self._failures += 1
+            if self._failures < settings.EMBEDDING_FAILURE_THRESHOLD:
+                return
+            # Half-open afterwards: one more failure reopens it
+            self._failures = settings.EMBEDDING_FAILURE_THRESHOLD - 1
+            self._open_until = time.monotonic() + settings.EMBEDDING_FAILURE_COOLDOWN_SECONDS
+        metrics.inc("embedding.breaker_opened")
+        print(f"[Embeddings] {version.provider} API failing, skipping embedding calls "
+              f"for {settings.EMBEDDING_FAILURE_COOLDOWN_SECONDS:g}s")
+
+    def fetch_embedding(self, text: str, version: Optional[EmbeddingVersion] = None) -> Optional[np.ndarray]:
+        """
+        Raw embedding from the API of `version` (default: the version being
+        served); no cache, no projection. None on failure.
+        """
+        version = version or self.version
         try:
-            if self.provider == "openai":
-                return self._get_openai_embedding(text)
-            elif self.provider == "huggingface":
-                return self._get_hf_embedding(text)
+            if version.provider == "openai":
+                return self._get_openai_embedding(text, version.model)
+            elif version.provider == "huggingface":
+                return self._get_hf_embedding(text, version.model)
             else:
                 # Fuzzy only / Fallback
-                return np.zeros(384)
+                return None
         except Exception as e:
-            print(f"Error fetching embedding ({self.provider}): {e}")
-            return np.zeros(384)
+            print(f"Error fetching embedding ({version.provider}): {e}")
+            return None
 
-    def _get_hf_embedding(self, text: str) -> np.ndarray:
+    def _get_hf_embedding(self, text: str, model: Optional[str] = None) -> np.ndarray:
         """Fetch embedding from Hugging Face Inference API"""
-        api_url = f"https://api-inference.huggingface.co/pipeline/feature-extraction/{settings.HF_MODEL}"
+        api_url = f"{settings.HF_INFERENCE_URL}/{model or settings.HF_MODEL}"
         headers = {}
         if settings.HF_API_KEY:
             headers["Authorization"] = f"Bearer {settings.HF_API_KEY}"
@@ -76,7 +193,7 @@ class SemanticMatcher:
                 
         raise Exception("Failed to get HF embedding")
 
-    def _get_openai_embedding(self, text: str) -> np.ndarray:
+    def _get_openai_embedding(self, text: str, model: Optional[str] = None) -> np.ndarray:
         """Fetch embedding from OpenAI API"""
         if not settings.OPENAI_API_KEY:
              raise Exception("OPENAI_API_KEY not set")
@@ -88,7 +205,7 @@ class SemanticMatcher:
         }
         data = {
             "input": text,
-            "model": settings.OPENAI_MODEL
+            "model": model or settings.OPENAI_MODEL
         }
         
         response = requests.post(url, headers=headers, json=data)
@@ -0,0 +1,43 @@
+"""
+Worker entry point.
+
+    WORKERS=1                      → single uvicorn process (default)
+    WORKERS=N + SHARED_STATE_DIR   → N uvicorn processes sharing one
+      + CATALOG_PATH                 read-only copy of the derived state,
+                                     built by a separate loader process
+
+The loader publishes a new generation whenever the catalog changes;
+workers pick it up on their own (see shared_state.py).
+"""
+
+import multiprocessing
+
+import uvicorn
+
+from config import get_settings
+from loader import run_loader
+
+settings = get_settings()
+
+
+def main():
+    if settings.CATALOG_PATH and settings.SHARED_STATE_DIR:
+        loader = multiprocessing.Process(
+            target=run_loader,
+            args=(settings.CATALOG_PATH, settings.SHARED_STATE_DIR, settings.LOADER_POLL_SECONDS),
+            name="shared-state-loader",
+            daemon=True,
+        )
+        loader.start()
+        print(f"[Serve] Loader started (pid {loader.pid}), state dir: {settings.SHARED_STATE_DIR}")
+
+    uvicorn.run(
+        "main:app",
+        host=settings.API_HOST,
+        port=settings.API_PORT,
+        workers=settings.WORKERS,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Local sharded cluster for development and testing.
+
+Starts N shard workers on API_PORT+1 .. API_PORT+N and a coordinator on
+API_PORT, all on this machine. The coordinator gets a shard map that
+stripes grid cells over the shards (see sharding.py).
+
+Usage:
+    python shard_cluster.py 3                  # 3 shards, 1-degree cells
+    python shard_cluster.py 3 --cell-deg 0.25
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from config import get_settings
+
+settings = get_settings()
+
+
+def _start(port: int, extra_env: dict) -> subprocess.Popen:
+    env = {k: v for k, v in os.environ.items() if k != "SHARD_MAP_PATH"}
+    env.update(extra_env)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        env=env,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("shards", type=int)
+    parser.add_argument("--cell-deg", type=float, default=1.0)
+    parser.add_argument("--map", help="shard map path (default: a temp file)")
+    args = parser.parse_args()
+
+    ports = [settings.API_PORT + i for i in range(1, args.shards + 1)]
+    map_path = args.map or os.path.join(tempfile.mkdtemp(prefix="shards-"), "shard_map.json")
+    with open(map_path, "w") as f:
+        json.dump({
+            "version": 1,
+            "cell_deg": args.cell_deg,
+            "default": [f"http://127.0.0.1:{port}" for port in ports],
+            "cells": {},
+        }, f, indent=2)
+
+    processes = [_start(port, {}) for port in ports]
+    processes.append(_start(settings.API_PORT, {"SHARD_MAP_PATH": map_path}))
+    print(f"[Cluster] Coordinator on :{settings.API_PORT}, shards on {ports}, map: {map_path}")
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
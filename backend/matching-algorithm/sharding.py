@@ -0,0 +1,291 @@
+"""
+Region-sharded matching: scatter-gather across worker nodes.
+
+The world is cut into square lat/lon grid cells of `cell_deg` degrees.
+A shard map assigns every cell to one worker ("shard"): explicitly in
+`cells`, or by a stable hash over the `default` shards for cells nobody
+listed. The coordinator (a worker started with SHARD_MAP_PATH) takes a
+match request, drops candidates outside the search circle, groups the
+rest by the shard owning their org's cell, sends each shard its subset
+in parallel, and merges the per-shard top-K lists.
+
+Shard map file (JSON):
+
+    {
+      "version": 1,
+      "cell_deg": 1.0,
+      "default": ["http://worker-a:8000", "http://worker-b:8000"],
+      "cells": {"12,77": "http://worker-c:8000", "13,77": "local"}
+    }
+
+"local" means the coordinator scores that cell itself. The map is reloaded
+when the file changes and can be replaced or rebalanced over HTTP
+(GET/PUT /shards, POST /shards/rebalance).
+"""
+
+import json
+import math
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from metrics import metrics
+from utils import calculate_distance
+
+LOCAL = "local"
+
+Cell = Tuple[int, int]
+
+
+def cell_key(cell: Cell) -> str:
+    return f"{cell[0]},{cell[1]}"
+
+
+def parse_cell_key(key: str) -> Cell:
+    lat_idx, lon_idx = key.split(",")
+    return int(lat_idx), int(lon_idx)
+
+
+class ShardMap:
+    """Immutable cell → shard assignment."""
+
+    def __init__(self, cell_deg: float, default: List[str], cells: Optional[Dict[str, str]] = None,
+                 version: int = 1):
+        if cell_deg <= 0:
+            raise ValueError("cell_deg must be positive")
+        if not default:
+            raise ValueError("Shard map needs at least one default shard")
+        self.cell_deg = cell_deg
+        self.default = list(default)
+        self.cells: Dict[Cell, str] = {parse_cell_key(k): v for k, v in (cells or {}).items()}
+        self.version = version
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ShardMap":
+        default = data.get("default", [LOCAL])
+        if isinstance(default, str):
+            default = [default]
+        return cls(float(data.get("cell_deg", 1.0)), default, data.get("cells"), int(data.get("version", 1)))
+
+    def to_dict(self) -> dict:
+        return {
+            "version": self.version,
+            "cell_deg": self.cell_deg,
+            "default": self.default,
+            "cells": {cell_key(c): shard for c, shard in sorted(self.cells.items())},
+        }
+
+    @property
+    def shards(self) -> List[str]:
+        return sorted(set(self.default) | set(self.cells.values()))
+
+    def cell_of(self, latitude: float, longitude: float) -> Cell:
+        return math.floor(latitude / self.cell_deg), math.floor(longitude / self.cell_deg)
+
+    def owner(self, cell: Cell) -> str:
+        shard = self.cells.get(cell)
+        if shard is None:
+            # Stable across processes and restarts (unlike hash())
+            shard = self.default[zlib.crc32(cell_key(cell).encode()) % len(self.default)]
+        return shard
+
+    def rebalanced(self, cell_load: Dict[Cell, float], shards: Optional[List[str]] = None) -> "ShardMap":
+        """
+        New map assigning every loaded cell explicitly, heaviest first, to
+        the currently least-loaded shard (ties keep the current owner).
+        """
+        shards = shards or self.shards
+        totals = {shard: 0.0 for shard in shards}
+        cells = {}
+        for cell, load in sorted(cell_load.items(), key=lambda kv: (-kv[1], kv[0])):
+            current = self.owner(cell)
+            lightest = min(totals.values())
+            shard = current if totals.get(current) == lightest else min(totals, key=lambda s: (totals[s], s))
+            cells[cell_key(cell)] = shard
+            totals[shard] += load
+        return ShardMap(self.cell_deg, [s for s in self.default if s in totals] or shards, cells, self.version + 1)
+
+
+class ShardRouter:
+    """Routes match requests to region shards and merges their results."""
+
+    def __init__(self, shard_map_path: str, max_results: int, pool_size: int = 16):
+        self.path = shard_map_path
+        self.max_results = max_results
+        self._lock = threading.Lock()
+        self._map: Optional[ShardMap] = None
+        self._mtime: Optional[int] = None
+        self._pool = ThreadPoolExecutor(pool_size, thread_name_prefix="shard")
+        self._session = requests.Session()
+        self.cell_load: Dict[Cell, int] = {}
+
+    # ── Shard map ──────────────────────────────────────────────
+
+    def shard_map(self) -> ShardMap:
+        """Current map, reloaded if the file changed on disk."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        with self._lock:
+            if self._map is None or (mtime is not None and mtime != self._mtime):
+                with open(self.path) as f:
+                    self._map = ShardMap.from_dict(json.load(f))
+                self._mtime = mtime
+                print(f"[Shards] Loaded shard map v{self._map.version}: {len(self._map.shards)} shards")
+            return self._map
+
+    def replace(self, shard_map: ShardMap) -> None:
+        """Swap in a new map and persist it atomically."""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(shard_map.to_dict(), f, indent=2)
+        os.replace(tmp_path, self.path)
+        with self._lock:
+            self._map = shard_map
+            self._mtime = os.stat(self.path).st_mtime_ns
+        metrics.set_gauge("shards.map_version", shard_map.version)
+
+    def rebalance(self, shards: Optional[List[str]] = None) -> ShardMap:
+        with self._lock:
+            load = dict(self.cell_load)
+        new_map = self.shard_map().rebalanced(load, shards)
+        self.replace(new_map)
+        return new_map
+
+    def shard_load(self) -> Dict[str, int]:
+        shard_map = self.shard_map()
+        with self._lock:
+            load = dict(self.cell_load)
+        totals = {shard: 0 for shard in shard_map.shards}
+        for cell, count in load.items():
+            owner = shard_map.owner(cell)
+            totals[owner] = totals.get(owner, 0) + count
+        return totals
+
+    # ── Scatter-gather ─────────────────────────────────────────
+
+    def plan(self, query_org, orgs: list, search_radius: float) -> Dict[str, List[int]]:
+        """Candidate indices per shard, for candidates inside the search circle."""
+        shard_map = self.shard_map()
+        distances: Dict[tuple, float] = {}
+        owners: Dict[Cell, str] = {}
+        plan: Dict[str, List[int]] = {}
+        loads: Dict[Cell, int] = {}
+        for index, org in enumerate(orgs):
+            location = (org.latitude, org.longitude)
+            distance_km = distances.get(location)
+            if distance_km is None:
+                try:
+                    distance_km = calculate_distance(query_org.latitude, query_org.longitude, *location)
+                except Exception:
+                    continue
+                distances[location] = distance_km
+            if distance_km > search_radius:
+                continue
+            cell = shard_map.cell_of(*location)
+            owner = owners.get(cell)
+            if owner is None:
+                owner = owners[cell] = shard_map.owner(cell)
+            plan.setdefault(owner, []).append(index)
+            loads[cell] = loads.get(cell, 0) + 1
+        with self._lock:
+            for cell, count in loads.items():
+                self.cell_load[cell] = self.cell_load.get(cell, 0) + count
+        return plan
+
+    def _call_shard(self, shard: str, path: str, payload: dict, timeout: float) -> dict:
+        response = self._session.post(
+            f"{shard.rstrip('/')}{path}",
+            json=payload,
+            headers={"X-Deadline-Ms": str(max(1, int(timeout * 1000)))},
+            timeout=timeout,
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def scatter(self, path: str, request, query_org, deadline,
+                local: Callable[[List[int]], Dict[float, list]], result_model,
+                limit: Optional[int] = None) -> Dict[float, list]:
+        """
+        Fan the request out to the shards owning in-radius candidates,
+        score "local" cells in this process, and merge by score (ties in
+        original candidate order, as on a single node) into the top
+        `limit` (default max_results) per radius: {search_radius: results},
+        plus every radius of a sweep. A failed or timed-out shard makes
+        the response partial instead of failing it.
+        """
+        limit = limit or self.max_results
+        radii = request.sweep_radii() or [request.search_radius]
+        plan = self.plan(query_org, [c.org for c in request.candidates], max(radii))
+        metrics.observe("shards.fanout", len(plan))
+
+        futures = {}
+        for shard, indices in plan.items():
+            if shard == LOCAL:
+                continue
+            subset = [request.candidates[i] for i in indices]
+            # Shards always answer in full, one page of the merged depth; the
+            # coordinator shapes the merged response and owns any cursor
+            payload = request.model_copy(update={
+                "candidates": subset, "fields": None, "response_format": "full",
+                "page_size": limit, "paginate": False, "cursor": None,
+            }).model_dump(mode="json")
+            # Leave the coordinator a little time to merge
+            timeout = max(0.001, deadline.remaining() - 0.05)
+            futures[shard] = self._pool.submit(self._call_shard, shard, path, payload, timeout)
+
+        merged = {radius: [] for radius in radii}
+        if LOCAL in plan:
+            for radius, results in local(plan[LOCAL]).items():
+                merged[radius].extend(results)
+
+        for shard, future in futures.items():
+            try:
+                body = future.result()
+            except Exception as e:
+                print(f"[Shards] {shard} failed: {e}")
+                metrics.inc("shards.errors")
+                deadline.partial = True
+                continue
+            deadline.partial = deadline.partial or body.get("partial", False)
+            if body.get("degraded") and not deadline.degraded:
+                deadline.degraded = body["degraded"]
+            ranked = {request.search_radius: body["results"]}
+            ranked.update((entry["search_radius"], entry["results"]) for entry in body.get("by_radius") or [])
+            for radius, results in ranked.items():
+                if radius in merged:
+                    merged[radius].extend(result_model(**r) for r in results)
+
+        position = {}
+        for index, candidate in enumerate(request.candidates):
+            position.setdefault(candidate_id(candidate), index)
+        for radius, results in merged.items():
+            results.sort(key=lambda r: (-r.match_score, position.get(r.id, len(position))))
+            merged[radius] = results[:limit]
+        return merged
+
+
+def candidate_id(candidate) -> int:
+    item = getattr(candidate, "supply", None) or getattr(candidate, "demand")
+    return item.supply_id if hasattr(item, "supply_id") else item.demand_id
+
+
+# Global instance
+_router: Optional[ShardRouter] = None
+
+
+def get_shard_router() -> Optional[ShardRouter]:
+    """The coordinator's router, or None when this worker is not sharding."""
+    global _router
+    if _router is None:
+        from config import get_settings
+        settings = get_settings()
+        if not settings.SHARD_MAP_PATH:
+            return None
+        _router = ShardRouter(settings.SHARD_MAP_PATH, settings.MAX_RESULTS)
+    return _router
@@ -0,0 +1,269 @@
+"""
+Shared, read-only matching state for multi-process serving.
+
+A single loader process builds the expensive derived state — the
+embedding matrix and the token indexes — and publishes it as an
+immutable *generation* of .npy files. Worker processes memory-map those
+files read-only, so N workers share one copy through the page cache
+instead of holding N private copies.
+
+Layout (ideally on tmpfs, e.g. /dev/shm):
+
+    <SHARED_STATE_DIR>/
+        CURRENT                  generation number, swapped atomically
+        gen-000007/
+            meta.json            includes the embedding version
+            embedding_texts.json text of each matrix row (for re-embedding)
+            embedding_keys.npy   sorted text hashes
+            embedding_rows.npy   matrix row for each sorted hash
+            embeddings.npy       float32 (n, dim)
+            supply_index/...     FrozenTokenIndex arrays
+            demand_index/...
+
+Workers check CURRENT at most once per SHARED_STATE_POLL_SECONDS and
+re-attach when the generation number changes. Old generations stay on
+disk for a grace period so in-flight requests never lose their mapping.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+from token_index import FrozenTokenIndex, TokenIndex
+
+
+CURRENT_FILE = "CURRENT"
+KEEP_GENERATIONS = 3
+
+
+def embedding_key(text: str) -> int:
+    """64-bit hash of normalized embedding text (same normalization as get_embedding)."""
+    digest = hashlib.blake2b(text.lower().strip().encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def _generation_dir(directory: str, generation: int) -> str:
+    return os.path.join(directory, f"gen-{generation:06d}")
+
+
+def read_current_generation(directory: str) -> Optional[int]:
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+# ═══════════════════════════════════════════════════════════════
+# Writer (loader process)
+# ═══════════════════════════════════════════════════════════════
+
+def _save_arrays(directory: str, arrays: Dict) -> None:
+    os.makedirs(directory, exist_ok=True)
+    strings = {}
+    for name, value in arrays.items():
+        if isinstance(value, np.ndarray):
+            np.save(os.path.join(directory, f"{name}.npy"), value)
+        else:
+            strings[name] = value
+    with open(os.path.join(directory, "strings.json"), "w") as f:
+        json.dump(strings, f)
+
+
+def publish_generation(
+    directory: str,
+    embeddings: Dict[str, np.ndarray],
+    token_indexes: Dict[str, TokenIndex],
+    base: Optional["SharedGeneration"] = None,
+    embedding_version: Optional[str] = None,
+) -> int:
+    """
+    Write a new immutable generation and atomically make it current.
+    With `base`, the new generation is `base` overlaid with the given
+    state (newer entries win); the base's embeddings are only kept if
+    they have the same `embedding_version`. Returns the new generation number.
+    """
+    os.makedirs(directory, exist_ok=True)
+    generation = (read_current_generation(directory) or 0) + 1
+    target = _generation_dir(directory, generation)
+    staging = f"{target}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    # Embedding matrix, addressed by sorted text hash
+    texts = [t for t, v in embeddings.items() if v is not None and np.any(v)]
+    dim = len(embeddings[texts[0]]) if texts else 0
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        matrix[row] = embeddings[text]
+    keys = np.array([embedding_key(t) for t in texts], dtype=np.int64)
+    row_texts: list = list(texts)
+    if (base is not None and len(base._embedding_keys) and base.embedding_version == embedding_version
+            and (not texts or base._embeddings.shape[1] == dim)):
+        kept = ~np.isin(base._embedding_keys, keys)
+        dim = base._embeddings.shape[1]
+        kept_rows = base._embedding_rows[kept]
+        matrix = np.concatenate([matrix.reshape(-1, dim), base._embeddings[kept_rows]])
+        keys = np.concatenate([keys, base._embedding_keys[kept]])
+        # None for rows of older generations written without texts
+        base_texts = base.embedding_texts()
+        row_texts.extend(base_texts[row] if row < len(base_texts) else None for row in kept_rows.tolist())
+    order = np.argsort(keys, kind="stable")
+    np.save(os.path.join(staging, "embeddings.npy"), matrix)
+    np.save(os.path.join(staging, "embedding_keys.npy"), keys[order])
+    np.save(os.path.join(staging, "embedding_rows.npy"), order.astype(np.int64))
+    with open(os.path.join(staging, "embedding_texts.json"), "w") as f:
+        json.dump(row_texts, f)
+
+    counts = {"embeddings": len(keys)}
+    for kind, index in token_indexes.items():
+        frozen = base.token_index(kind) if base is not None else None
+        if frozen is not None:
+            arrays = frozen.postings().overlay(index.postings()).to_arrays()
+        else:
+            arrays = index.to_arrays()
+        _save_arrays(os.path.join(staging, f"{kind}_index"), arrays)
+        counts[f"{kind}_items"] = len(arrays["item_ids"])
+
+    with open(os.path.join(staging, "meta.json"), "w") as f:
+        json.dump({"generation": generation, "built_at": time.time(), "dim": dim,
+                   "embedding_version": embedding_version, "counts": counts}, f)
+
+    os.replace(staging, target)
+    tmp_current = os.path.join(directory, f"{CURRENT_FILE}.tmp")
+    with open(tmp_current, "w") as f:
+        f.write(str(generation))
+    os.replace(tmp_current, os.path.join(directory, CURRENT_FILE))
+
+    _prune_generations(directory, generation)
+    return generation
+
+
+def _prune_generations(directory: str, current: int) -> None:
+    for name in os.listdir(directory):
+        if not name.startswith("gen-") or name.endswith(".tmp"):
+            continue
+        try:
+            generation = int(name[4:])
+        except ValueError:
+            continue
+        if generation <= current - KEEP_GENERATIONS:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+# ═══════════════════════════════════════════════════════════════
+# Reader (worker processes)
+# ═══════════════════════════════════════════════════════════════
+
+def _load_arrays(directory: str) -> Dict:
+    with open(os.path.join(directory, "strings.json")) as f:
+        arrays = json.load(f)
+    for name in os.listdir(directory):
+        if name.endswith(".npy"):
+            arrays[name[:-4]] = np.load(os.path.join(directory, name), mmap_mode="r")
+    return arrays
+
+
+class SharedGeneration:
+    """One attached, read-only generation."""
+
+    def __init__(self, directory: str, generation: int):
+        path = _generation_dir(directory, generation)
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.path = path
+        self.generation = generation
+        self._embedding_texts: Optional[list] = None
+        self._embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+        self._embedding_keys = np.load(os.path.join(path, "embedding_keys.npy"), mmap_mode="r")
+        self._embedding_rows = np.load(os.path.join(path, "embedding_rows.npy"), mmap_mode="r")
+        self._token_indexes: Dict[str, FrozenTokenIndex] = {}
+        for kind in ("supply", "demand"):
+            index_dir = os.path.join(path, f"{kind}_index")
+            if os.path.isdir(index_dir):
+                self._token_indexes[kind] = FrozenTokenIndex(_load_arrays(index_dir))
+
+    def embedding(self, text: str) -> Optional[np.ndarray]:
+        """Read-only embedding view for `text`, or None if not in this generation."""
+        if not text or len(self._embedding_keys) == 0:
+            return None
+        key = embedding_key(text)
+        pos = int(np.searchsorted(self._embedding_keys, key))
+        if pos < len(self._embedding_keys) and self._embedding_keys[pos] == key:
+            return self._embeddings[self._embedding_rows[pos]]
+        return None
+
+    @property
+    def embedding_version(self) -> Optional[str]:
+        """EmbeddingVersion key of the vectors; None for generations written before versioning."""
+        return self.meta.get("embedding_version")
+
+    def embedding_texts(self) -> list:
+        """Text of each embedding matrix row (None where unknown); loaded on first use."""
+        if self._embedding_texts is None:
+            try:
+                with open(os.path.join(self.path, "embedding_texts.json")) as f:
+                    self._embedding_texts = json.load(f)
+            except FileNotFoundError:
+                self._embedding_texts = []
+        return self._embedding_texts
+
+    def token_index(self, kind: str) -> Optional[FrozenTokenIndex]:
+        return self._token_indexes.get(kind)
+
+
+class SharedStateReader:
+    """Attaches to the current generation and swaps when it changes."""
+
+    def __init__(self, directory: str, poll_seconds: float = 1.0):
+        self.directory = directory
+        self.poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        self._current: Optional[SharedGeneration] = None
+        self._last_check = 0.0
+
+    def get(self) -> Optional[SharedGeneration]:
+        now = time.monotonic()
+        if now - self._last_check >= self.poll_seconds:
+            with self._lock:
+                if now - self._last_check >= self.poll_seconds:
+                    self._last_check = now
+                    self._refresh()
+        return self._current
+
+    def _refresh(self) -> None:
+        generation = read_current_generation(self.directory)
+        if generation is None or (self._current and self._current.generation == generation):
+            return
+        try:
+            # Reference swap is atomic; requests holding the old object keep its mmaps
+            self._current = SharedGeneration(self.directory, generation)
+            print(f"[Worker] Attached shared state generation {generation}")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[Worker] Failed to attach shared state generation {generation}: {e}")
+
+
+# Global instance
+_reader: Optional[SharedStateReader] = None
+
+
+def get_shared_state() -> Optional[SharedGeneration]:
+    """
+    Current shared generation: the loader's (SHARED_STATE_DIR), else this
+    worker's own warm-start snapshot (WARM_STATE_DIR), else None.
+    """
+    global _reader
+    if _reader is None:
+        from config import get_settings
+        settings = get_settings()
+        directory = settings.SHARED_STATE_DIR or settings.WARM_STATE_DIR
+        if not directory:
+            return None
+        _reader = SharedStateReader(directory, settings.SHARED_STATE_POLL_SECONDS)
+    return _reader.get()
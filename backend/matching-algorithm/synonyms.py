@@ -0,0 +1,94 @@
+"""
+Phrase-level synonym canonicalization.
+
+Synonym clusters ("solar, photovoltaic, pv, solar panel, ...") are
+compiled into a trie over token sequences. Tokenization walks the text
+once and, at each position, takes the longest phrase in the trie
+starting there ("solar panels" → solar, not solar + panels). The cost
+per token is bounded by the longest phrase, not by the number of
+synonyms, so the table can grow to tens of thousands of entries.
+
+File format (SYNONYMS_PATH), one cluster per line, canonical form first:
+
+    # comment
+    solar, photovoltaic, pv, solar panel, solar panels
+    mask, masks, face mask, n95, surgical mask
+"""
+
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from tokenizer import split_words
+
+# Trie nodes are dicts keyed by token; the canonical form of a phrase
+# ending at a node is stored under this key (split() never yields "")
+_END = ""
+
+
+class SynonymTrie:
+    """Token-sequence trie mapping synonym phrases to a canonical token."""
+
+    def __init__(self):
+        self.root: dict = {}
+        self.size = 0
+        self.max_phrase_len = 0
+
+    def add(self, phrase: str, canonical: str) -> None:
+        words = split_words(phrase)
+        if not words:
+            return
+        node = self.root
+        for word in words:
+            node = node.setdefault(word, {})
+        if _END not in node:
+            self.size += 1
+        node[_END] = canonical
+        self.max_phrase_len = max(self.max_phrase_len, len(words))
+
+    def add_clusters(self, clusters: Iterable[Sequence[str]]) -> "SynonymTrie":
+        for cluster in clusters:
+            # Normalized like the phrases and the text (NFKC, casefold);
+            # a multi-word canonical stays one token
+            canonical = " ".join(split_words(cluster[0])) if cluster else ""
+            if not canonical:
+                continue
+            for phrase in cluster:
+                self.add(phrase, canonical)
+        return self
+
+    def longest_match(self, words: Sequence[str], start: int) -> Tuple[int, Optional[str]]:
+        """(length, canonical) of the longest phrase at words[start:], or (0, None)."""
+        node = self.root
+        best = (0, None)
+        end = min(len(words), start + self.max_phrase_len)
+        for pos in range(start, end):
+            node = node.get(words[pos])
+            if node is None:
+                break
+            canonical = node.get(_END)
+            if canonical is not None:
+                best = (pos - start + 1, canonical)
+        return best
+
+    def first_word(self, word: str) -> Tuple[Optional[str], bool]:
+        """(canonical of the one-word phrase `word` or None, whether longer phrases start with it)."""
+        node = self.root.get(word)
+        if node is None:
+            return None, False
+        return node.get(_END), len(node) > (_END in node)
+
+    def __len__(self) -> int:
+        return self.size
+
+
+def load_clusters(path: str) -> List[List[str]]:
+    """Read synonym clusters from a text file (see module docstring)."""
+    clusters = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            cluster = [phrase.strip() for phrase in line.split(",") if phrase.strip()]
+            if cluster:
+                clusters.append(cluster)
+    return clusters
@@ -0,0 +1,422 @@
+"""
+Inverted token / trigram index for text-first candidate retrieval.
+
+Items are indexed by the canonical tokens produced by `tokenize` (so
+synonyms collapse onto one posting list), and every vocabulary token is
+in turn indexed by its character trigrams. A query token that is not in
+the vocabulary can still reach items through its "trigram neighbourhood"
+— vocabulary tokens that share enough trigrams with it — which mirrors
+the typo tolerance of `calculate_token_overlap`.
+
+Categories are indexed as well, so that anything `check_category_match`
+would accept is always retrieved.
+"""
+
+import math
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, FrozenSet, Hashable, List, Optional, Set
+
+import numpy as np
+
+from metrics import metrics
+from utils import tokenize, text_fingerprint
+
+
+def token_trigrams(token: str) -> FrozenSet[str]:
+    """Character trigrams of a token, padded so word boundaries count."""
+    padded = f" {token} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def entry_fingerprint(text: str, category_id: Optional[int] = None, category_name: Optional[str] = None) -> int:
+    """Fingerprint of everything an item is indexed by (text and both category keys)."""
+    cat_name = (category_name or "").lower().strip()
+    return text_fingerprint(f"{text}\x1f{'' if category_id is None else category_id}\x1f{cat_name}")
+
+
+class _IndexedItem:
+    __slots__ = ("text", "tokens", "category_id", "category_name")
+
+    def __init__(self, text: str, tokens: FrozenSet[str], category_id: Optional[int], category_name: str):
+        self.text = text
+        self.tokens = tokens
+        self.category_id = category_id
+        self.category_name = category_name
+
+
+class TokenIndex:
+    """
+    Incrementally updatable inverted index: token → item IDs,
+    trigram → vocabulary tokens, category → item IDs.
+
+    With `max_items`, the least recently upserted items are evicted once
+    the index holds more than that many (an unchanged re-upsert counts
+    as a use).
+    """
+
+    def __init__(self, trigram_min_overlap: float = 0.5, max_items: Optional[int] = None):
+        self.trigram_min_overlap = trigram_min_overlap
+        self.max_items = max_items
+        self._lock = threading.RLock()
+        self._items: "OrderedDict[Hashable, _IndexedItem]" = OrderedDict()
+        self._token_postings: Dict[str, Set[Hashable]] = defaultdict(set)
+        self._trigram_tokens: Dict[str, Set[str]] = defaultdict(set)
+        self._category_ids: Dict[int, Set[Hashable]] = defaultdict(set)
+        self._category_names: Dict[str, Set[Hashable]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, item_id: Hashable) -> bool:
+        return item_id in self._items
+
+    @property
+    def vocabulary_size(self) -> int:
+        return len(self._token_postings)
+
+    # ── Updates ────────────────────────────────────────────────
+
+    def upsert(
+        self,
+        item_id: Hashable,
+        text: str,
+        category_id: Optional[int] = None,
+        category_name: Optional[str] = None,
+    ) -> bool:
+        """
+        Index (or re-index) one item. Unchanged items are a cheap no-op.
+        Returns True if the postings were touched.
+        """
+        cat_name = (category_name or "").lower().strip()
+        with self._lock:
+            existing = self._items.get(item_id)
+            if (
+                existing is not None
+                and existing.text == text
+                and existing.category_id == category_id
+                and existing.category_name == cat_name
+            ):
+                self._items.move_to_end(item_id)
+                return False
+            if existing is not None:
+                self._unlink(item_id, existing)
+
+            entry = _IndexedItem(text, frozenset(tokenize(text)), category_id, cat_name)
+            self._items[item_id] = entry
+            for token in entry.tokens:
+                postings = self._token_postings[token]
+                if not postings:
+                    for tri in token_trigrams(token):
+                        self._trigram_tokens[tri].add(token)
+                postings.add(item_id)
+            if category_id is not None:
+                self._category_ids[category_id].add(item_id)
+            if cat_name:
+                self._category_names[cat_name].add(item_id)
+            if self.max_items is not None:
+                self._evict()
+            return True
+
+    def _evict(self) -> None:
+        evicted = 0
+        while len(self._items) > self.max_items:
+            oldest_id, oldest = self._items.popitem(last=False)
+            self._unlink(oldest_id, oldest)
+            evicted += 1
+        if evicted:
+            metrics.inc("token_index.evicted", evicted)
+
+    def remove(self, item_id: Hashable) -> bool:
+        with self._lock:
+            existing = self._items.pop(item_id, None)
+            if existing is None:
+                return False
+            self._unlink(item_id, existing)
+            return True
+
+    def _unlink(self, item_id: Hashable, entry: _IndexedItem) -> None:
+        for token in entry.tokens:
+            postings = self._token_postings.get(token)
+            if postings is None:
+                continue
+            postings.discard(item_id)
+            if not postings:
+                del self._token_postings[token]
+                for tri in token_trigrams(token):
+                    vocab = self._trigram_tokens.get(tri)
+                    if vocab is not None:
+                        vocab.discard(token)
+                        if not vocab:
+                            del self._trigram_tokens[tri]
+        _discard_posting(self._category_ids, entry.category_id, item_id)
+        _discard_posting(self._category_names, entry.category_name, item_id)
+
+    # ── Queries ────────────────────────────────────────────────
+
+    def neighbour_tokens(self, token: str) -> Set[str]:
+        """Vocabulary tokens sharing enough trigrams with `token`."""
+        query_tris = token_trigrams(token)
+        shared: Dict[str, int] = defaultdict(int)
+        with self._lock:
+            for tri in query_tris:
+                for vocab_token in self._trigram_tokens.get(tri, ()):
+                    shared[vocab_token] += 1
+        neighbours = set()
+        for vocab_token, count in shared.items():
+            smaller = min(len(query_tris), len(token_trigrams(vocab_token)))
+            if count >= math.ceil(self.trigram_min_overlap * smaller):
+                neighbours.add(vocab_token)
+        return neighbours
+
+    def lookup(
+        self,
+        text: str,
+        category_id: Optional[int] = None,
+        category_name: Optional[str] = None,
+    ) -> Set[Hashable]:
+        """
+        Item IDs sharing a token, a trigram neighbourhood, or a category
+        with the query.
+        """
+        hits: Set[Hashable] = set()
+        with self._lock:
+            for token in tokenize(text):
+                for vocab_token in {token} | self.neighbour_tokens(token):
+                    hits |= self._token_postings.get(vocab_token, set())
+
+            if category_id is not None:
+                hits |= self._category_ids.get(category_id, set())
+
+            # Same exact/substring rule as check_category_match
+            cat_name = (category_name or "").lower().strip()
+            if cat_name:
+                for name, ids in self._category_names.items():
+                    if name == cat_name or name in cat_name or cat_name in name:
+                        hits |= ids
+        return hits
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "items": len(self._items),
+                "vocabulary": len(self._token_postings),
+                "trigrams": len(self._trigram_tokens),
+                "categories": len(self._category_ids) + len(self._category_names),
+            }
+
+    def postings(self) -> "IndexPostings":
+        """Snapshot of the posting dicts (item IDs must be integers)."""
+        with self._lock:
+            return IndexPostings(
+                fingerprints={
+                    i: entry_fingerprint(e.text, e.category_id, e.category_name) for i, e in self._items.items()
+                },
+                tokens={t: set(ids) for t, ids in self._token_postings.items()},
+                trigrams={tri: set(tokens) for tri, tokens in self._trigram_tokens.items()},
+                category_ids={c: set(ids) for c, ids in self._category_ids.items()},
+                category_names={c: set(ids) for c, ids in self._category_names.items()},
+            )
+
+    def to_arrays(self) -> Dict[str, Any]:
+        """
+        Export the index as flat arrays (CSR posting lists) for
+        FrozenTokenIndex. Item IDs must be integers.
+        """
+        return self.postings().to_arrays()
+
+
+class IndexPostings:
+    """Plain-dict form of a token index, used to export and merge indexes."""
+
+    def __init__(self, fingerprints: Dict[int, int], tokens: Dict[str, Set[int]],
+                 trigrams: Dict[str, Set[str]], category_ids: Dict[int, Set[int]],
+                 category_names: Dict[str, Set[int]]):
+        self.fingerprints = fingerprints
+        self.tokens = tokens
+        self.trigrams = trigrams
+        self.category_ids = category_ids
+        self.category_names = category_names
+
+    def overlay(self, newer: "IndexPostings") -> "IndexPostings":
+        """This index with every item of `newer` replaced by its newer entry."""
+        replaced = set(newer.fingerprints)
+
+        def merge(old: Dict, new: Dict) -> Dict:
+            merged = {}
+            for key, ids in old.items():
+                kept = ids - replaced
+                if kept:
+                    merged[key] = kept
+            for key, ids in new.items():
+                merged.setdefault(key, set()).update(ids)
+            return merged
+
+        tokens = merge(self.tokens, newer.tokens)
+        trigrams = {}
+        for source in (self.trigrams, newer.trigrams):
+            for tri, vocab in source.items():
+                live = {t for t in vocab if t in tokens}
+                if live:
+                    trigrams.setdefault(tri, set()).update(live)
+        fingerprints = {i: f for i, f in self.fingerprints.items() if i not in replaced}
+        fingerprints.update(newer.fingerprints)
+        return IndexPostings(
+            fingerprints, tokens, trigrams,
+            merge(self.category_ids, newer.category_ids),
+            merge(self.category_names, newer.category_names),
+        )
+
+    def to_arrays(self) -> Dict[str, Any]:
+        vocab = sorted(self.tokens)
+        trigrams = sorted(self.trigrams)
+        token_ids = {token: i for i, token in enumerate(vocab)}
+        cat_ids = sorted(self.category_ids)
+        cat_names = sorted(self.category_names)
+        item_ids = sorted(self.fingerprints)
+
+        arrays = {
+            "vocab": vocab,
+            "trigrams": trigrams,
+            "category_names": cat_names,
+            "category_ids": np.array(cat_ids, dtype=np.int64),
+            "item_ids": np.array(item_ids, dtype=np.int64),
+            "item_fingerprints": np.array([self.fingerprints[i] for i in item_ids], dtype=np.int64),
+        }
+        arrays["token_offsets"], arrays["token_items"] = _csr(
+            [sorted(self.tokens[t]) for t in vocab]
+        )
+        arrays["trigram_offsets"], arrays["trigram_tokens"] = _csr(
+            [sorted(token_ids[t] for t in self.trigrams[tri]) for tri in trigrams]
+        )
+        arrays["category_id_offsets"], arrays["category_id_items"] = _csr(
+            [sorted(self.category_ids[c]) for c in cat_ids]
+        )
+        arrays["category_name_offsets"], arrays["category_name_items"] = _csr(
+            [sorted(self.category_names[c]) for c in cat_names]
+        )
+        return arrays
+
+
+class FrozenTokenIndex:
+    """
+    Read-only TokenIndex over flat arrays, typically memory-mapped from a
+    shared-state generation so every worker process shares one copy of
+    the posting lists. Lookups follow the same rules as TokenIndex.
+    """
+
+    def __init__(self, arrays: Dict[str, Any], trigram_min_overlap: float = 0.5):
+        self.trigram_min_overlap = trigram_min_overlap
+        self._arrays = arrays
+        self._vocab: List[str] = arrays["vocab"]
+        self._token_ids = {token: i for i, token in enumerate(self._vocab)}
+        self._trigram_ids = {tri: i for i, tri in enumerate(arrays["trigrams"])}
+        self._category_names: List[str] = arrays["category_names"]
+
+    def __len__(self) -> int:
+        return len(self._arrays["item_ids"])
+
+    def fingerprint(self, item_id: int) -> Optional[int]:
+        item_ids = self._arrays["item_ids"]
+        pos = int(np.searchsorted(item_ids, item_id))
+        if pos < len(item_ids) and item_ids[pos] == item_id:
+            return int(self._arrays["item_fingerprints"][pos])
+        return None
+
+    def postings(self) -> IndexPostings:
+        """Unpack the arrays back into posting dicts (for merging)."""
+        a = self._arrays
+
+        def unpack(name: str, keys, values: str = "items") -> Dict:
+            offsets, flat = a[f"{name}_offsets"], a[f"{name}_{values}"]
+            return {key: set(flat[offsets[i]:offsets[i + 1]].tolist()) for i, key in enumerate(keys)}
+
+        token_rows = unpack("trigram", a["trigrams"], values="tokens")
+        return IndexPostings(
+            fingerprints=dict(zip(a["item_ids"].tolist(), a["item_fingerprints"].tolist())),
+            tokens=unpack("token", self._vocab),
+            trigrams={tri: {self._vocab[t] for t in rows} for tri, rows in token_rows.items()},
+            category_ids=unpack("category_id", a["category_ids"].tolist()),
+            category_names=unpack("category_name", self._category_names),
+        )
+
+    def _postings(self, name: str, row: int) -> np.ndarray:
+        offsets = self._arrays[f"{name}_offsets"]
+        return self._arrays[f"{name}_items"][offsets[row]:offsets[row + 1]]
+
+    def neighbour_tokens(self, token: str) -> Set[int]:
+        query_tris = token_trigrams(token)
+        offsets = self._arrays["trigram_offsets"]
+        trigram_tokens = self._arrays["trigram_tokens"]
+        shared: Dict[int, int] = defaultdict(int)
+        for tri in query_tris:
+            row = self._trigram_ids.get(tri)
+            if row is None:
+                continue
+            for token_id in trigram_tokens[offsets[row]:offsets[row + 1]].tolist():
+                shared[token_id] += 1
+        neighbours = set()
+        for token_id, count in shared.items():
+            smaller = min(len(query_tris), len(token_trigrams(self._vocab[token_id])))
+            if count >= math.ceil(self.trigram_min_overlap * smaller):
+                neighbours.add(token_id)
+        return neighbours
+
+    def lookup(
+        self,
+        text: str,
+        category_id: Optional[int] = None,
+        category_name: Optional[str] = None,
+    ) -> Set[int]:
+        hits: Set[int] = set()
+        for token in tokenize(text):
+            token_rows = self.neighbour_tokens(token)
+            if token in self._token_ids:
+                token_rows.add(self._token_ids[token])
+            for row in token_rows:
+                hits.update(self._postings("token", row).tolist())
+
+        if category_id is not None:
+            cat_ids = self._arrays["category_ids"]
+            pos = int(np.searchsorted(cat_ids, category_id))
+            if pos < len(cat_ids) and cat_ids[pos] == category_id:
+                hits.update(self._postings("category_id", pos).tolist())
+
+        cat_name = (category_name or "").lower().strip()
+        if cat_name:
+            for row, name in enumerate(self._category_names):
+                if name == cat_name or name in cat_name or cat_name in name:
+                    hits.update(self._postings("category_name", row).tolist())
+        return hits
+
+
+def _csr(rows: List[List[int]]):
+    """Pack a list of int lists into (offsets, values) arrays."""
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(r) for r in rows]) if rows else []
+    values = np.fromiter((v for r in rows for v in r), dtype=np.int64, count=int(offsets[-1]))
+    return offsets, values
+
+
+def _discard_posting(postings: Dict, key, item_id: Hashable) -> None:
+    if key is None or key == "":
+        return
+    ids = postings.get(key)
+    if ids is None:
+        return
+    ids.discard(item_id)
+    if not ids:
+        del postings[key]
+
+
+# Global instances, one per item kind
+_token_indexes: Dict[str, TokenIndex] = {}
+
+
+def get_token_index(kind: str) -> TokenIndex:
+    """This worker's index of request candidates, bounded to TOKEN_INDEX_MAX_ITEMS."""
+    index = _token_indexes.get(kind)
+    if index is None:
+        from config import get_settings
+        index = _token_indexes.setdefault(kind, TokenIndex(max_items=get_settings().TOKEN_INDEX_MAX_ITEMS))
+    return index
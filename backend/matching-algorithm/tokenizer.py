@@ -0,0 +1,145 @@
+"""
+Regex-free, Unicode-aware tokenization with a shared token vocabulary.
+
+Words are maximal runs of Unicode letters, digits and combining marks
+(so Devanagari vowel signs or Arabic harakat stay inside their word),
+casefolded. Splitting is a translate to spaces followed by str.split():
+ASCII text goes through a 256-byte bytes.translate table; other text is
+NFKC-normalized (composed and decomposed accents, full-width digits give
+the same word) and translated with a table filled lazily, one
+unicodedata lookup per distinct code point.
+
+Every distinct word is classified once — dropped (stop word, or a single
+ASCII character), its canonical synonym, whether a multi-word synonym
+phrase can start with it — and the result is cached with the token
+string interned in a shared Vocabulary. Tokenizing a known word is then
+one dict lookup, and every token set refers to the same string objects.
+"""
+
+import threading
+import unicodedata
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from metrics import metrics
+
+
+# ASCII text (the common case): one bytes.translate that lowercases and
+# blanks out everything but [a-z0-9]
+_ASCII_WORD_CHARS = bytes(
+    code + 32 if 65 <= code <= 90 else code if chr(code).isalnum() else 32
+    for code in range(128)
+) + b" " * 128
+
+
+class _WordCharTable(dict):
+    """str.translate table: word characters map to themselves, the rest to a space."""
+
+    def __missing__(self, code: int):
+        value = code if unicodedata.category(chr(code))[0] in "LMN" else " "
+        self[code] = value
+        return value
+
+
+_WORD_CHARS = _WordCharTable()
+
+
+def split_words(text: str) -> List[str]:
+    """Casefold and split on everything that is not a letter, digit or combining mark."""
+    if text.isascii():
+        return text.encode("ascii").translate(_ASCII_WORD_CHARS).decode("ascii").split()
+    text = unicodedata.normalize("NFKC", text)
+    return text.casefold().translate(_WORD_CHARS).split()
+
+
+class Vocabulary:
+    """Token ↔ id, one shared string object per token."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids: Dict[str, int] = {}
+        self._tokens: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def __getitem__(self, token_id: int) -> str:
+        return self._tokens[token_id]
+
+    def id_of(self, token: str) -> Optional[int]:
+        return self._ids.get(token)
+
+    def add(self, token: str) -> int:
+        token_id = self._ids.get(token)
+        if token_id is None:
+            with self._lock:
+                token_id = self._ids.get(token)
+                if token_id is None:
+                    token_id = self._ids[token] = len(self._tokens)
+                    self._tokens.append(token)
+            metrics.set_gauge("tokenizer.vocabulary", len(self._tokens))
+        return token_id
+
+    def intern(self, token: str) -> str:
+        """The vocabulary's copy of `token` (added if new)."""
+        return self._tokens[self.add(token)]
+
+
+# Per-word entry: (token to emit, or None if the word is dropped;
+#                  whether a multi-word synonym phrase starts with it)
+_Entry = Tuple[Optional[str], bool]
+
+
+class Tokenizer:
+    """
+    Canonical tokens of a text: stop words and single ASCII characters
+    dropped, synonym phrases replaced by their canonical token in one
+    left-to-right pass, longest phrase first.
+
+    At most `max_words` distinct words are cached (and interned); words
+    beyond that are classified on every call with the same result.
+    """
+
+    def __init__(self, synonyms, stop_words: FrozenSet[str], max_words: int = 200000):
+        self.synonyms = synonyms
+        self.stop_words = stop_words
+        self.max_words = max_words
+        self.vocabulary = Vocabulary()
+        self._words: Dict[str, _Entry] = {}
+
+    def _classify(self, word: str) -> _Entry:
+        canonical, starts_phrase = self.synonyms.first_word(word)
+        cached = len(self._words) < self.max_words
+        if (len(word) < 2 and word.isascii()) or word in self.stop_words:
+            token = None
+        else:
+            token = canonical or word
+            if cached:
+                token = self.vocabulary.intern(token)
+        entry = (token, starts_phrase)
+        if cached:
+            self._words[word] = entry
+        return entry
+
+    def tokenize(self, text: str) -> Set[str]:
+        if not text:
+            return set()
+        words = split_words(text)
+        entries = self._words
+        meaningful = set()
+        i = 0
+        count = len(words)
+        while i < count:
+            entry = entries.get(words[i]) or self._classify(words[i])
+            if entry[1]:
+                length, canonical = self.synonyms.longest_match(words, i)
+                if length > 1:
+                    meaningful.add(self.vocabulary.intern(canonical))
+                    i += length
+                    continue
+            i += 1
+            if entry[0] is not None:
+                meaningful.add(entry[0])
+        return meaningful
+
+    def __len__(self) -> int:
+        return len(self._words)
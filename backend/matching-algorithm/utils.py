@@ -1,9 +1,16 @@
 # Used for calculation of the score 
 
 import math
-import re
-from typing import Tuple, Set
+import zlib
+from typing import Optional, Tuple, Set, List, Sequence
 import Levenshtein
+import numpy as np
+from rapidfuzz import process
+from rapidfuzz.distance import Indel
+
+from semantic_search import calculate_semantic_similarity
+from synonyms import SynonymTrie, load_clusters
+from tokenizer import Tokenizer
 
 
 # ═══════════════════════════════════════════════════════════════
@@ -29,8 +36,8 @@ STOP_WORDS = frozenset({
     'good', 'best', 'new', 'used', 'fresh', 'bulk', 'wholesale',
 })
 
-# Synonym clusters for common supply-chain terms
-SYNONYM_MAP = {}
+# Synonym clusters for common supply-chain terms (built-in set; more can
+# be loaded from SYNONYMS_PATH). The first entry is the canonical form.
 _SYNONYM_CLUSTERS = [
     ['rice', 'basmati', 'paddy', 'grain rice'],
     ['wheat', 'flour', 'atta', 'maida'],
@@ -64,37 +71,45 @@ _SYNONYM_CLUSTERS = [
     ['kit', 'kits', 'set', 'sets', 'package', 'packages'],
 ]
 
-for cluster in _SYNONYM_CLUSTERS:
-    canonical = cluster[0]
-    for word in cluster:
-        SYNONYM_MAP[word.lower()] = canonical
+_synonyms: Optional[SynonymTrie] = None
+
+
+def get_synonyms() -> SynonymTrie:
+    """Compiled synonym trie: built-in clusters plus SYNONYMS_PATH, if set."""
+    global _synonyms
+    if _synonyms is None:
+        from config import get_settings
+        trie = SynonymTrie().add_clusters(_SYNONYM_CLUSTERS)
+        path = get_settings().SYNONYMS_PATH
+        if path:
+            trie.add_clusters(load_clusters(path))
+        _synonyms = trie
+    return _synonyms
+
+
+_tokenizer: Optional[Tokenizer] = None
+
+
+def get_tokenizer() -> Tokenizer:
+    """Tokenizer over STOP_WORDS and the current synonym trie (rebuilt if the trie is replaced)."""
+    global _tokenizer
+    synonyms = get_synonyms()
+    if _tokenizer is None or _tokenizer.synonyms is not synonyms:
+        from config import get_settings
+        _tokenizer = Tokenizer(synonyms, STOP_WORDS, get_settings().TOKENIZER_VOCABULARY_SIZE)
+    return _tokenizer
 
 
 def tokenize(text: str) -> Set[str]:
     """
     Tokenize and normalize text into a set of meaningful tokens.
-    Removes stop words, lowercases, strips punctuation.
+    Removes stop words, casefolds, splits on anything that is not a
+    Unicode letter, digit or combining mark. Synonym phrases ("face
+    mask", "solar panels") are replaced by their canonical token in a
+    single left-to-right pass, longest phrase first. Tokens are interned
+    in the tokenizer's shared vocabulary.
     """
-    if not text:
-        return set()
-    
-    # Lowercase and replace non-alphanumeric with spaces
-    cleaned = re.sub(r'[^a-z0-9\s]', ' ', text.lower())
-    tokens = cleaned.split()
-    
-    # Filter stop words and very short tokens
-    meaningful = set()
-    for t in tokens:
-        t = t.strip()
-        if len(t) < 2:
-            continue
-        if t in STOP_WORDS:
-            continue
-        # Map synonyms to canonical form
-        canonical = SYNONYM_MAP.get(t, t)
-        meaningful.add(canonical)
-    
-    return meaningful
+    return get_tokenizer().tokenize(text)
 
 
 def calculate_token_overlap(tokens1: Set[str], tokens2: Set[str]) -> float:
@@ -215,6 +230,76 @@ def calculate_string_similarity(str1: str, str2: str) -> float:
     return max(lev_score, token_score, substring_score)
 
 
+def calculate_string_similarity_batch(
+    query: str,
+    candidates: Sequence[str],
+    min_score: float = 0.0
+) -> List[float]:
+    """
+    One-to-many version of calculate_string_similarity.
+
+    - Candidates with identical normalized text are compared only once
+    - Levenshtein ratios for all unique candidates are computed in one
+      native call (rapidfuzz cdist, multi-threaded, GIL released)
+    - Candidates whose length difference already caps the ratio below
+      `min_score` skip the Levenshtein kernel entirely
+
+    Scores >= min_score are exactly what calculate_string_similarity
+    returns; anything below min_score may be under-reported.
+    """
+    if not query:
+        return [0.0] * len(candidates)
+
+    s1 = query.lower().strip()
+    tokens1 = tokenize(s1)
+
+    # Deduplicate by normalized text
+    unique_index = {}
+    row_to_unique = []
+    for text in candidates:
+        key = text.lower().strip() if text else None
+        row_to_unique.append(unique_index.setdefault(key, len(unique_index)))
+    uniques = list(unique_index)
+
+    # Indel ratio is at most 2*min(len)/(len1+len2): prune hopeless lengths
+    len1 = len(s1)
+    eligible = [
+        i for i, s2 in enumerate(uniques)
+        if s2 and 2 * min(len1, len(s2)) / (len1 + len(s2)) >= min_score
+    ]
+    lev_scores = np.zeros(len(uniques), dtype=np.float64)
+    if eligible:
+        lev_scores[eligible] = process.cdist(
+            [s1],
+            [uniques[i] for i in eligible],
+            scorer=Indel.normalized_similarity,
+            score_cutoff=min_score or None,
+            dtype=np.float64,
+            workers=-1,
+        )[0]
+
+    unique_scores = []
+    for i, s2 in enumerate(uniques):
+        if s2 is None:
+            unique_scores.append(0.0)
+            continue
+        if s1 == s2:
+            unique_scores.append(1.0)
+            continue
+
+        token_score = calculate_token_overlap(tokens1, tokenize(s2))
+
+        substring_score = 0.0
+        if s1 in s2 or s2 in s1:
+            shorter = min(len1, len(s2))
+            longer = max(len1, len(s2))
+            substring_score = max(shorter / longer if longer > 0 else 0.0, 0.7)
+
+        unique_scores.append(max(float(lev_scores[i]), token_score, substring_score))
+
+    return [unique_scores[u] for u in row_to_unique]
+
+
 # ═══════════════════════════════════════════════════════════════
 # Hybrid Similarity (Semantic + Fuzzy + Token)
 # ═══════════════════════════════════════════════════════════════
@@ -241,7 +326,6 @@ def calculate_hybrid_similarity(
         return fuzzy_sim
     
     try:
-        from semantic_search import calculate_semantic_similarity
         semantic_sim = calculate_semantic_similarity(str1, str2)
         
         # Combine with weights
@@ -255,6 +339,42 @@ def calculate_hybrid_similarity(
         return fuzzy_sim
 
 
+def calculate_hybrid_similarity_batch(
+    query: str,
+    candidates: Sequence[str],
+    use_semantic: bool = True,
+    semantic_weight: float = 0.7,
+    fuzzy_weight: float = 0.3,
+    min_score: float = 0.0
+) -> List[float]:
+    """
+    One-to-many version of calculate_hybrid_similarity.
+    `min_score` only prunes the fuzzy kernel when semantic scoring is off
+    (the semantic blend needs the exact fuzzy score).
+    """
+    fuzzy_scores = calculate_string_similarity_batch(
+        query, candidates, min_score=0.0 if use_semantic else min_score
+    )
+
+    if not use_semantic:
+        return fuzzy_scores
+
+    try:
+        combined_cache = {}
+        results = []
+        for text, fuzzy_sim in zip(candidates, fuzzy_scores):
+            if text not in combined_cache:
+                semantic_sim = calculate_semantic_similarity(query, text)
+                combined = (semantic_sim * semantic_weight) + (fuzzy_sim * fuzzy_weight)
+                combined_cache[text] = max(combined, fuzzy_sim)
+            results.append(combined_cache[text])
+        return results
+
+    except Exception as e:
+        print(f"Semantic search not available, using enhanced fuzzy: {e}")
+        return fuzzy_scores
+
+
 # ═══════════════════════════════════════════════════════════════
 # Quantity Normalization & Scoring
 # ═══════════════════════════════════════════════════════════════
@@ -406,12 +526,18 @@ def calculate_match_score(
     return min(1.0, max(0.0, overall))
 
 
-def calculate_match_score_detailed(
-    distance_km: float,
+def distance_score(distance_km: float, max_distance: float) -> float:
+    """Distance component of the match score: exp(-2·d/max_distance), in [0, 1]."""
+    if max_distance <= 0:
+        return 0.0
+    ratio = distance_km / max_distance
+    return max(0.0, min(1.0, math.exp(-2.0 * ratio)))
+
+
+def score_components(
     similarity_score: float,
     supply_price: float,
     demand_max_price: float,
-    max_distance: float,
     supply_qty: float = None,
     supply_unit: str = None,
     demand_qty: float = None,
@@ -419,21 +545,14 @@ def calculate_match_score_detailed(
     price_tolerance: float = 0.25
 ) -> dict:
     """
-    Same as calculate_match_score but returns a detailed breakdown 
-    for the frontend to display personalized explanations.
+    The radius-independent components of calculate_match_score_detailed
+    (similarity, price, quantity and their labels); combine them with a
+    distance_score via combine_match_score / match_score_detail.
     """
-    # 1. Distance Score
-    if max_distance <= 0:
-        dist_score = 0.0
-    else:
-        ratio = distance_km / max_distance
-        dist_score = math.exp(-2.0 * ratio)
-        dist_score = max(0.0, min(1.0, dist_score))
-    
-    # 2. Similarity Score
+    # Similarity Score
     sim_score = max(0.0, min(1.0, similarity_score))
     
-    # 3. Price Score
+    # Price Score
     price_score = 0.0
     price_label = "unknown"
     if demand_max_price is None or demand_max_price <= 0:
@@ -467,7 +586,7 @@ def calculate_match_score_detailed(
                 price_score = 0.15
                 price_label = "expensive"
     
-    # 4. Quantity Score
+    # Quantity Score
     qty_score = 0.5
     qty_label = "unknown"
     fulfillment_pct = None
@@ -497,29 +616,41 @@ def calculate_match_score_detailed(
                     qty_label = "very_low"
         else:
             qty_label = "incompatible_units"
-    
-    # Overall
+
+    return {
+        "similarity": sim_score,
+        "price": price_score,
+        "quantity": qty_score,
+        "labels": {
+            "price": price_label,
+            "quantity": qty_label,
+            "fulfillment_pct": fulfillment_pct,
+        },
+    }
+
+
+def combine_match_score(components: dict, dist_score: float) -> float:
+    """Weighted overall score (unrounded) from score_components and a distance_score."""
     overall = (
-        sim_score  * 0.40 +
-        price_score * 0.25 +
+        components["similarity"] * 0.40 +
+        components["price"] * 0.25 +
         dist_score * 0.20 +
-        qty_score  * 0.15
+        components["quantity"] * 0.15
     )
-    overall = min(1.0, max(0.0, overall))
-    
+    return min(1.0, max(0.0, overall))
+
+
+def match_score_detail(components: dict, dist_score: float) -> dict:
+    """calculate_match_score_detailed's result from precomputed components."""
     return {
-        "match_score": round(overall, 3),
+        "match_score": round(combine_match_score(components, dist_score), 3),
         "breakdown": {
-            "similarity": round(sim_score, 3),
+            "similarity": round(components["similarity"], 3),
             "distance": round(dist_score, 3),
-            "price": round(price_score, 3),
-            "quantity": round(qty_score, 3),
-        },
-        "labels": {
-            "price": price_label,
-            "quantity": qty_label,
-            "fulfillment_pct": fulfillment_pct,
+            "price": round(components["price"], 3),
+            "quantity": round(components["quantity"], 3),
         },
+        "labels": dict(components["labels"]),
         "weights": {
             "similarity": 0.40,
             "distance": 0.20,
@@ -529,5 +660,74 @@ def calculate_match_score_detailed(
     }
 
 
+def calculate_match_score_detailed(
+    distance_km: float,
+    similarity_score: float,
+    supply_price: float,
+    demand_max_price: float,
+    max_distance: float,
+    supply_qty: float = None,
+    supply_unit: str = None,
+    demand_qty: float = None,
+    demand_unit: str = None,
+    price_tolerance: float = 0.25
+) -> dict:
+    """
+    Same as calculate_match_score but returns a detailed breakdown 
+    for the frontend to display personalized explanations.
+    """
+    components = score_components(
+        similarity_score, supply_price, demand_max_price,
+        supply_qty, supply_unit, demand_qty, demand_unit, price_tolerance,
+    )
+    return match_score_detail(components, distance_score(distance_km, max_distance))
+
+
+def max_achievable_score(distance_km: float, max_distance: float) -> float:
+    """
+    Upper bound of calculate_match_score_detailed's match_score for any
+    candidate at `distance_km` or farther: perfect similarity, price and
+    quantity, with the distance component at its value for `distance_km`.
+    Includes the 3-decimal rounding slack of match_score.
+    """
+    if max_distance <= 0:
+        dist_score = 0.0
+    else:
+        dist_score = min(1.0, math.exp(-2.0 * distance_km / max_distance))
+    return 0.40 + 0.25 + 0.20 * dist_score + 0.15 + 0.0005
+
+
+def max_price_overage(min_score: float, price_tolerance: float = 0.25) -> Optional[float]:
+    """
+    Largest relative overage (supply_price - demand_max_price) /
+    demand_max_price at which a candidate can still reach `min_score`,
+    with every other component perfect (as in max_achievable_score).
+    None when the price component alone can never rule a candidate out.
+    """
+    needed = (min_score - (0.40 + 0.20 + 0.15 + 0.0005)) / 0.25
+    if needed <= 0.15:
+        return None
+    if needed >= 0.6:
+        return price_tolerance * (1.0 - needed) / 0.4
+    if needed >= 0.3:
+        return price_tolerance + price_tolerance * (0.6 - needed) / 0.3
+    return 2 * price_tolerance
+
+
+def build_rich_text(item_name: str, item_description: str = None, item_category: str = None) -> str:
+    """Build rich comparison text from item fields."""
+    parts = [item_name or ""]
+    if item_description:
+        parts.append(item_description)
+    if item_category:
+        parts.append(item_category)
+    return " ".join(parts).strip()
+
+
+def text_fingerprint(text: str) -> int:
+    """Stable (cross-process) fingerprint of an item's comparison text."""
+    return zlib.crc32((text or "").encode("utf-8"))
+
+
 def generate_cache_key(demand_id: int) -> str:
     return f"search_results:demand:{demand_id}"
@@ -0,0 +1,131 @@
+"""
+Warm start: periodic snapshots of the worker's derived state.
+
+With WARM_STATE_DIR set (single-node mode, no loader), the worker
+periodically publishes everything it has derived from traffic:
+
+    - embeddings (from the embedding store)
+    - token vocabulary, trigram and category indexes
+
+The snapshot uses the shared-state generation format (shared_state.py).
+On restart the latest generation is memory-mapped as the read-only base
+layer, so the first requests do not rebuild indexes or refetch
+embeddings. New state accumulates in the private
+structures and the next snapshot merges it on top of the base.
+
+Snapshots assume one writer. With WORKERS > 1 and no loader, every
+process would publish into the same directory and race on generation
+numbers, so snapshot writes are disabled (with a warning); the processes
+still restore the latest existing snapshot.
+
+A warm-up job also runs one synthetic scoring pass at startup, so imports,
+singletons and kernels are initialized before real traffic. GET /ready
+reports 503 until it finishes, then whether the worker started warm or cold.
+"""
+
+import threading
+import time
+from typing import Callable, Optional
+
+from metrics import metrics
+from shared_state import get_shared_state, publish_generation
+from token_index import get_token_index
+
+
+class WarmState:
+    """Tracks warm/cold start, warm-up completion and snapshot writes."""
+
+    def __init__(self, directory: Optional[str], interval_seconds: float,
+                 writes_snapshots: bool = True):
+        self.directory = directory
+        self.writes_snapshots = bool(directory) and writes_snapshots
+        self.interval_seconds = interval_seconds
+        self.state = "cold"
+        self.restored_generation: Optional[int] = None
+        self.ready = False
+        self.warm_up_ms: Optional[float] = None
+        self.last_snapshot: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def restore(self) -> None:
+        """Attach the latest snapshot (mmap), if any."""
+        started = time.perf_counter()
+        # Also set when a loader's shared generation (SHARED_STATE_DIR) is attached
+        generation = get_shared_state()
+        if generation is not None:
+            self.restored_generation = generation.generation
+            self.state = "warm"
+        if not self.directory:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        metrics.set_gauge("warm_state.restore_ms", round(elapsed_ms, 1))
+        print(f"[Worker] Start {self.state}: snapshot generation {self.restored_generation}, "
+              f"restored in {elapsed_ms:.0f} ms")
+
+    def warm_up(self, job: Callable[[], None]) -> None:
+        started = time.perf_counter()
+        try:
+            job()
+        except Exception as e:
+            print(f"[Worker] Warm-up failed (serving anyway): {e}")
+        self.warm_up_ms = round((time.perf_counter() - started) * 1000, 1)
+        self.ready = True
+        metrics.set_gauge("warm_state.warm_up_ms", self.warm_up_ms)
+
+    def snapshot(self) -> Optional[int]:
+        """Publish the current derived state as a new generation."""
+        if not self.writes_snapshots:
+            return None
+        from semantic_search import get_semantic_matcher
+
+        with self._lock:
+            started = time.perf_counter()
+            version, store = get_semantic_matcher().served()
+            embeddings = dict(store.items())
+            token_indexes = {kind: get_token_index(kind) for kind in ("supply", "demand")}
+            generation = publish_generation(
+                self.directory, embeddings, token_indexes, base=get_shared_state(),
+                embedding_version=version.key,
+            )
+            self.last_snapshot = generation
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            metrics.observe("warm_state.snapshot_ms", elapsed_ms)
+            print(f"[Worker] Wrote warm-state snapshot generation {generation} in {elapsed_ms:.0f} ms")
+            return generation
+
+    def run_periodic(self, stop: threading.Event) -> None:
+        while not stop.wait(self.interval_seconds):
+            try:
+                self.snapshot()
+            except Exception as e:
+                print(f"[Worker] Warm-state snapshot failed: {e}")
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "state": self.state,
+            "snapshot_generation": self.restored_generation,
+            "last_snapshot": self.last_snapshot,
+            "warm_up_ms": self.warm_up_ms,
+        }
+
+
+# Global instance
+_warm_state: Optional[WarmState] = None
+
+
+def get_warm_state() -> WarmState:
+    global _warm_state
+    if _warm_state is None:
+        from config import get_settings
+        settings = get_settings()
+        # With a loader (SHARED_STATE_DIR) the loader owns the shared state
+        directory = None if settings.SHARED_STATE_DIR else settings.WARM_STATE_DIR
+        # Several processes would publish into one directory concurrently
+        single_writer = settings.WORKERS <= 1
+        if directory and not single_writer:
+            print(f"[Worker] WARM_STATE_DIR with WORKERS={settings.WORKERS}: restoring the last "
+                  f"snapshot but not writing new ones; use SHARED_STATE_DIR + CATALOG_PATH instead")
+        _warm_state = WarmState(directory, settings.WARM_SNAPSHOT_INTERVAL_SECONDS,
+                                writes_snapshots=single_writer)
+    return _warm_state
@@ -1,20 +1,39 @@
 const express = require('express');
 const router = express.Router();
 const pool = require('../connections/db');
-const { exec } = require('child_process');
+const QR_SERVICE_URL = process.env.QR_SERVICE_URL || 'http://qr_service:8100';
+// Where browsers fetch rendered codes; empty = same origin (the gateway
+// proxies GET /qr/* to the QR service)
+const QR_PUBLIC_BASE_URL = process.env.QR_PUBLIC_BASE_URL || '';
 
-// Replace QR code generation logic
-const generateQRCode = async (qrData) => {
-  return new Promise((resolve, reject) => {
-    exec(`python ./barcode/qr_code.py ${qrData}`, (error, stdout, stderr) => {
-      if (error) {
-        console.error(`Error generating QR code: ${stderr}`);
-        return reject(error);
-      }
-      console.log(`QR Code generated: ${stdout}`);
-      resolve(stdout.trim());
-    });
+// Render QR codes through the long-lived QR service in ONE call.
+// Identical payloads are rendered once and served from its content-addressed
+// cache. Resolves to [{ index, digest, url, cached }] in payload order;
+// a payload that failed to render has { index, digest, error } instead.
+const generateQRCodes = async (payloads, format = 'png') => {
+  const qrRes = await fetch(`${QR_SERVICE_URL}/qr/batch`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ payloads, format }),
   });
+  if (!qrRes.ok) {
+    throw new Error(`QR service error ${qrRes.status}: ${await qrRes.text()}`);
+  }
+  // NDJSON stream: one line per payload, in completion order
+  const lines = (await qrRes.text()).split('\n').filter(Boolean).map(l => JSON.parse(l));
+  if (lines.length !== payloads.length) {
+    throw new Error(`QR service returned ${lines.length} of ${payloads.length} codes`);
+  }
+  return lines.sort((a, b) => a.index - b.index);
+};
+
+const generateQRCode = async (qrData) => {
+  const [result] = await generateQRCodes([qrData]);
+  if (result.error) {
+    throw new Error(`QR code generation failed: ${result.error}`);
+  }
+  console.log(`QR Code generated: ${result.url}`);
+  return `${QR_PUBLIC_BASE_URL}${result.url}`;
 };
 
 // ═══════════════════════════════════════════════════════════════
@@ -6,6 +6,18 @@ const { redisClient } = require('../connections/redis');
 
 const CACHE_TTL_SECONDS = 900; // 15 minutes (freshness over speed)
 const WORKER_URL = process.env.MATCHING_WORKER_URL || 'http://matching-worker:8000';
+// Time budget for one worker call; the worker is told slightly less so it
+// can answer (possibly with partial results) before we give up on it
+const WORKER_TIMEOUT_MS = parseInt(process.env.MATCHING_WORKER_TIMEOUT_MS || '15000', 10);
+const WORKER_DEADLINE_MARGIN_MS = 500;
+
+// ═══════════════════════════════════════════════════════════════
+// Expand org_dict match results (cached compact, served full)
+// ═══════════════════════════════════════════════════════════════
+function expandMatchResults(results, orgs) {
+  if (!orgs) return results;
+  return results.map(r => ({ ...orgs[String(r.org_id)], ...r }));
+}
 
 // ═══════════════════════════════════════════════════════════════
 // Cache Invalidation Helper — clears ALL supply search caches
@@ -324,10 +336,11 @@ router.get('/:id/search', async (req, res) => {
       try {
         const cached = await redisClient.get(cacheKey);
         if (cached) {
-          const parsed = JSON.parse(cached);
+          const { orgs, ...parsed } = JSON.parse(cached);
           const ttl = await redisClient.ttl(cacheKey);
           return res.json({
             ...parsed,
+            results: expandMatchResults(parsed.results, orgs),
             cached: true,
             cache_expires_in_seconds: ttl,
           });
@@ -399,6 +412,7 @@ router.get('/:id/search', async (req, res) => {
         longitude: demand.org_lng,
       },
       search_radius: searchRadius,
+      response_format: 'org_dict',
       candidates: supplyRows.map(s => ({
         supply: {
           supply_id: s.supply_id,
@@ -425,11 +439,28 @@ router.get('/:id/search', async (req, res) => {
       })),
     };
 
-    const workerRes = await fetch(`${WORKER_URL}/match/demand-to-supplies`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify(workerPayload),
-    });
+    let workerRes;
+    try {
+      workerRes = await fetch(`${WORKER_URL}/match/demand-to-supplies`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'X-Deadline-Ms': String(WORKER_TIMEOUT_MS - WORKER_DEADLINE_MARGIN_MS),
+        },
+        body: JSON.stringify(workerPayload),
+        signal: AbortSignal.timeout(WORKER_TIMEOUT_MS),
+      });
+    } catch (fetchErr) {
+      console.error('[Demand Search] Worker unreachable or timed out:', fetchErr.message);
+      return res.status(504).json({ error: 'Matching worker timed out.' });
+    }
+
+    // Worker shed the request: pass its Retry-After hint through
+    if (workerRes.status === 503) {
+      const retryAfter = workerRes.headers.get('retry-after') || '1';
+      res.set('Retry-After', retryAfter);
+      return res.status(503).json({ error: 'Matching is busy, please retry shortly.', retry_after: parseInt(retryAfter, 10) });
+    }
 
     if (!workerRes.ok) {
       const errBody = await workerRes.text();
@@ -455,12 +486,19 @@ router.get('/:id/search', async (req, res) => {
       search_radius_km: searchRadius,
       cached: false,
       cache_expires_in_seconds: null,
-      results: workerData.results,
+      results: expandMatchResults(workerData.results, workerData.orgs),
+      partial: workerData.partial || false,
+      degraded: workerData.degraded || null,
       searched_at: new Date().toISOString(),
     };
 
     try {
-      await redisClient.setEx(cacheKey, CACHE_TTL_SECONDS, JSON.stringify(responseData));
+      // Partial (deadline-truncated) or degraded (e.g. fuzzy-only) results
+      // are served but never cached
+      if (!workerData.partial && !workerData.degraded) {
+        const cachedData = { ...responseData, results: workerData.results, orgs: workerData.orgs };
+        await redisClient.setEx(cacheKey, CACHE_TTL_SECONDS, JSON.stringify(cachedData));
+      }
     } catch (cacheErr) {
       console.error('[Demand Search] Cache write error:', cacheErr.message);
     }